@@ -0,0 +1,103 @@
+import json
+from typing import NamedTuple, Optional
+
+from app import jsonCodec
+
+
+class AcsFrame(NamedTuple):
+    kind: str
+    silent: bool
+    data: Optional[str]
+    # full parsed envelope, only populated when the fast path had to fall back
+    message: Optional[dict] = None
+
+
+def _string_value(frame: str, key: str, start: int = 0):
+    """Returns (value, end_index) of a "key": "value" pair, or (None, -1)."""
+    i = frame.find(key, start)
+    if i < 0:
+        return None, -1
+    i += len(key)
+    while frame[i] == " ":
+        i += 1
+    if frame[i] != ":":
+        return None, -1
+    i += 1
+    while frame[i] == " ":
+        i += 1
+    if frame[i] != '"':
+        return None, -1
+    end = frame.find('"', i + 1)
+    if end < 0:
+        return None, -1
+    return frame[i + 1:end], end
+
+
+def _bool_value(frame: str, key: str, start: int = 0):
+    # ACS puts `silent` after the payload, so search from the end
+    i = frame.rfind(key, start)
+    if i < 0:
+        return None
+    i = frame.find(":", i + len(key))
+    if i < 0:
+        return None
+    i += 1
+    while frame[i] == " ":
+        i += 1
+    if frame.startswith("false", i):
+        return False
+    if frame.startswith("true", i):
+        return True
+    return None
+
+
+def _parse_full(frame: str) -> AcsFrame:
+    message = jsonCodec.loads(frame)
+    kind = message.get("kind")
+    if kind == "AudioData":
+        audio_data_section = message.get("audioData") or {}
+        silent = audio_data_section.get("silent", True)
+        return AcsFrame(kind, silent, None if silent else audio_data_section.get("data"), message)
+    return AcsFrame(kind, True, None, message)
+
+
+def parse_acs_frame(frame: str) -> AcsFrame:
+    """Classifies an inbound ACS media streaming frame.
+
+    AudioData frames are scanned in place for `silent` and `audioData.data`
+    without building the object tree; anything else (AudioMetadata, DTMF,
+    unexpected layouts or escaped payloads) goes through the full JSON parser.
+    """
+    try:
+        kind, end = _string_value(frame, '"kind"')
+        if kind != "AudioData":
+            return _parse_full(frame)
+        silent = _bool_value(frame, '"silent"', end)
+        if silent is None:
+            return _parse_full(frame)
+        if silent:
+            return AcsFrame(kind, True, None)
+        data, _ = _string_value(frame, '"data"', end)
+        if data is None or "\\" in data:
+            return _parse_full(frame)
+        return AcsFrame(kind, False, data)
+    except IndexError:
+        return _parse_full(frame)
+
+
+# Outbound envelopes. These are byte-for-byte what json.dumps produces for the
+# AudioData / StopAudio dicts; base64 never needs JSON escaping so the delta
+# can be spliced straight in between the prefix and suffix.
+_AUDIO_DATA_PREFIX = '{"Kind": "AudioData", "AudioData": {"Data": "'
+_AUDIO_DATA_SUFFIX = '"}, "StopAudio": null}'
+
+STOP_AUDIO_FRAME = json.dumps({
+    "Kind": "StopAudio",
+    "AudioData": None,
+    "StopAudio": {}
+})
+
+
+def encode_audio_frame(data: str) -> str:
+    """Wraps a base64 PCM delta in an ACS AudioData envelope."""
+    return _AUDIO_DATA_PREFIX + data + _AUDIO_DATA_SUFFIX
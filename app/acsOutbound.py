@@ -0,0 +1,213 @@
+import asyncio
+import base64
+import os
+import time
+from collections import deque
+
+from app import metrics
+from app.acsMedia import STOP_AUDIO_FRAME, encode_audio_frame
+
+# max frames waiting for the ACS socket before stale audio is shed
+ACS_OUTBOUND_HIGH_WATER = int(os.getenv("ACS_OUTBOUND_HIGH_WATER", "50"))
+# "drop" discards the oldest audio frame; "coalesce" merges the two oldest
+# into one send, which saves sends but still plays all of it, so it only
+# merges up to ACS_OUTBOUND_MAX_COALESCED_MS and drops beyond that
+ACS_OUTBOUND_POLICY = os.getenv("ACS_OUTBOUND_POLICY", "drop")
+ACS_OUTBOUND_MAX_COALESCED_MS = int(os.getenv("ACS_OUTBOUND_MAX_COALESCED_MS", "200"))
+
+_AUDIO = 0
+_CONTROL = 1
+_FILLER = 2
+
+# PCM24K mono 16-bit
+BYTES_PER_MS = 48
+
+
+def _pcm(payload) -> bytearray:
+    # coalesced frames are kept as raw PCM and only encoded once, when sent
+    return payload if isinstance(payload, bytearray) else bytearray(base64.b64decode(payload))
+
+
+def _decoded_len(payload) -> int:
+    if isinstance(payload, bytearray):
+        return len(payload)
+    return len(payload) * 3 // 4 - payload[-2:].count("=")
+
+
+# writers of this worker's calls in progress
+_writers = set()
+
+
+def mean_queue_depth() -> float:
+    """Average outbound backlog over the calls in progress."""
+    if not _writers:
+        return 0.0
+    return sum(writer.depth() for writer in _writers) / len(_writers)
+
+
+class AcsOutboundWriter():
+    """Per-call writer task that owns all sends to the ACS media socket.
+
+    The OpenAI receive loop only enqueues, so a slow ACS socket never stalls
+    consumption of realtime events.
+    """
+
+    def __init__(
+        self,
+        send,
+        high_water: int = ACS_OUTBOUND_HIGH_WATER,
+        policy: str = ACS_OUTBOUND_POLICY,
+        max_coalesced_ms: int = ACS_OUTBOUND_MAX_COALESCED_MS,
+    ) -> None:
+        self._send = send
+        self._queue = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.high_water = high_water
+        self.policy = policy
+        self.max_coalesced_bytes = max_coalesced_ms * BYTES_PER_MS
+        self.dropped = 0
+        self.coalesced = 0
+        # when the filler sent so far has played out, if it is the last
+        # thing sent; 0 once other audio follows it
+        self._filler_until = 0.0
+        self._first_audio_mark = None
+        # playback of the assistant item currently being sent
+        self._playing_item = None
+        self._played_bytes = 0
+        self._playing_since = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            _writers.add(self)
+
+    async def close(self):
+        _writers.discard(self)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._queue.clear()
+
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def mark_first_audio(self, received_at: float):
+        """Times the next audio send against the first delta of a response."""
+        self._first_audio_mark = received_at
+
+    def put_audio(self, data: str, item_id: str = None):
+        metrics.ACS_OUTBOUND_QUEUE_DEPTH.observe(len(self._queue))
+        if len(self._queue) >= self.high_water:
+            self._shed()
+        self._queue.append((_AUDIO, data, item_id))
+        self._wakeup.set()
+
+    def put_filler(self, data: str):
+        """Queues latency-hiding filler audio; cancel_filler() takes it back."""
+        self._queue.append((_FILLER, data, None))
+        self._wakeup.set()
+
+    def cancel_filler(self):
+        """Drops queued filler and stops ACS playing filler already sent, if
+        that is still what the caller hears."""
+        self._queue = deque(item for item in self._queue if item[0] != _FILLER)
+        if time.perf_counter() < self._filler_until:
+            self._filler_until = 0.0
+            self._queue.appendleft((_CONTROL, STOP_AUDIO_FRAME, None))
+            self._wakeup.set()
+
+    def put_control(self, frame: str):
+        self._queue.append((_CONTROL, frame, None))
+        self._wakeup.set()
+
+    def flush_audio(self) -> int:
+        """Drops every queued audio frame, keeping control frames in order."""
+        before = len(self._queue)
+        self._queue = deque(item for item in self._queue if item[0] == _CONTROL)
+        return before - len(self._queue)
+
+    def stop_audio(self) -> int:
+        """Barge-in: discard buffered audio and send StopAudio ahead of anything
+        else. Returns the number of frames that never reached ACS."""
+        flushed = self.flush_audio()
+        self._filler_until = 0.0
+        # whatever played of the current item has been accounted for
+        self._playing_item = None
+        self._queue.appendleft((_CONTROL, STOP_AUDIO_FRAME, None))
+        self._wakeup.set()
+        return flushed
+
+    def forget_playback(self):
+        """Stops tracking assistant items for barge-in, for when the session
+        that generated them is gone; queued audio still plays."""
+        self._playing_item = None
+        self._queue = deque((kind, payload, None) for kind, payload, _ in self._queue)
+
+    def playback_position(self):
+        """(item id, played ms, sent ms) of the assistant item last sent to ACS.
+
+        ACS plays what it receives in real time, so the caller has heard at
+        most the time since the item's first frame went out, and at most
+        what was sent.
+        """
+        if self._playing_item is None:
+            return None, 0, 0
+        sent_ms = self._played_bytes // BYTES_PER_MS
+        elapsed_ms = int(1000 * (time.perf_counter() - self._playing_since))
+        return self._playing_item, min(sent_ms, elapsed_ms), sent_ms
+
+    def _shed(self):
+        audio = [i for i, item in enumerate(self._queue) if item[0] == _AUDIO][:2]
+        if not audio:
+            return
+        first = self._queue[audio[0]]
+        second = self._queue[audio[1]] if len(audio) == 2 else None
+        # only merge neighbours of the same item, so playback stays per item
+        if (self.policy == "coalesce" and second is not None and audio[1] == audio[0] + 1
+                and first[2] == second[2]
+                and _decoded_len(first[1]) + _decoded_len(second[1]) <= self.max_coalesced_bytes):
+            merged = _pcm(first[1])
+            merged += _pcm(second[1])
+            self._queue[audio[0]] = (_AUDIO, merged, first[2])
+            del self._queue[audio[1]]
+            self.coalesced += 1
+            metrics.ACS_OUTBOUND_SHED.inc(label="coalesce")
+        else:
+            del self._queue[audio[0]]
+            self.dropped += 1
+            metrics.ACS_OUTBOUND_SHED.inc(label="drop")
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            kind, payload, item_id = self._queue.popleft()
+            if kind == _CONTROL:
+                await self._send(payload)
+                continue
+            if kind == _FILLER:
+                # ACS plays each chunk in real time, once the earlier ones have played
+                played_s = _decoded_len(payload) / BYTES_PER_MS / 1000
+                self._filler_until = max(self._filler_until, time.perf_counter()) + played_s
+            else:
+                # a StopAudio would now cut this audio too
+                self._filler_until = 0.0
+                if item_id is not None:
+                    if item_id != self._playing_item:
+                        self._playing_item = item_id
+                        self._played_bytes = 0
+                        self._playing_since = time.perf_counter()
+                    self._played_bytes += _decoded_len(payload)
+            if isinstance(payload, bytearray):
+                payload = base64.b64encode(payload).decode("ascii")
+            await self._send(encode_audio_frame(payload))
+            if kind == _AUDIO and self._first_audio_mark is not None:
+                metrics.FIRST_DELTA_TO_ACS_SEND.observe(time.perf_counter() - self._first_audio_mark)
+                self._first_audio_mark = None
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+
+from app import metrics
+from app.acsOutbound import mean_queue_depth
+from app.callRegistry import call_store
+
+logger = logging.getLogger(__name__)
+
+# calls taken on by the workers sharing the call store, from admission to
+# the end of the media stream; 0 = no limit
+ADMISSION_MAX_CALLS = int(os.getenv("ADMISSION_MAX_CALLS", "0"))
+# event-loop lag, averaged over the workers, past which new calls are turned away
+ADMISSION_MAX_LOOP_LAG_MS = float(os.getenv("ADMISSION_MAX_LOOP_LAG_MS", "100"))
+# media sessions of answered calls are only refused once their worker is this far behind
+ADMISSION_SESSION_MAX_LOOP_LAG_MS = float(os.getenv("ADMISSION_SESSION_MAX_LOOP_LAG_MS", "500"))
+# frames waiting on the ACS sockets, averaged over the workers
+ADMISSION_MAX_QUEUE_DEPTH = float(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "20"))
+# how long an admitted call holds its slot while ACS opens the media stream
+ADMISSION_RESERVATION_S = float(os.getenv("ADMISSION_RESERVATION_S", "15"))
+ADMISSION_LAG_INTERVAL_S = float(os.getenv("ADMISSION_LAG_INTERVAL_S", "0.1"))
+# how often the other workers' load is read and this worker's calls renew
+# their slots; well under ADMISSION_RESERVATION_S
+ADMISSION_SHARED_INTERVAL_S = float(os.getenv("ADMISSION_SHARED_INTERVAL_S", "1"))
+# raw id of the overflow route (+E.164 number or ACS user id); unset rejects as busy
+OVERFLOW_REDIRECT_TARGET = os.getenv("OVERFLOW_REDIRECT_TARGET")
+
+# slot key of a call admitted but not answered yet
+RESERVATION_PREFIX = "admitting:"
+
+# new calls go by the lag peak, decayed per sample so a spike fades in about
+# a second; answered calls go by the average, which one slow tick can't move much
+_LAG_DECAY = 0.8
+_LAG_SMOOTHING = 0.3
+
+
+def _worker_load() -> tuple:
+    """Lag peaks and outbound queue depths of the running workers."""
+    return (
+        metrics.live_series(metrics.LOOP_LAG_PEAK.name),
+        metrics.live_series(metrics.OUTBOUND_QUEUE_MEAN_DEPTH.name),
+    )
+
+
+class AdmissionControl():
+    """Decides whether another call can be taken on.
+
+    The webhook that admits a call and the /ws that carries its media are
+    usually handled by different gunicorn workers, so new calls are judged
+    on shared state: slots in the call store, taken with one atomic
+    check-and-reserve before a call is answered and renewed by the worker
+    carrying its media, and the load every worker publishes in its metrics
+    snapshot, read in the background. A media session is judged by the
+    worker that would carry it, and only refused once that worker is
+    clearly overloaded, since refusing it drops a call the caller has
+    already picked up.
+    """
+
+    def __init__(self) -> None:
+        self.loop_lag = 0.0
+        self.loop_lag_peak = 0.0
+        # mean lag peak and queue depth over the workers, as last read
+        self.workers_loop_lag = 0.0
+        self.workers_queue_depth = 0.0
+        # calls whose media this worker carries; their slots are renewed
+        self.streaming = set()
+        self._monitors = []
+
+    def start(self):
+        if not self._monitors:
+            self._monitors = [
+                asyncio.create_task(self._watch_loop_lag()),
+                asyncio.create_task(self._watch_shared_state()),
+            ]
+
+    async def stop(self):
+        for monitor in self._monitors:
+            monitor.cancel()
+        await asyncio.gather(*self._monitors, return_exceptions=True)
+        self._monitors = []
+
+    async def _watch_loop_lag(self):
+        loop = asyncio.get_running_loop()
+        worker = str(os.getpid())
+        while True:
+            before = loop.time()
+            await asyncio.sleep(ADMISSION_LAG_INTERVAL_S)
+            lag = max(0.0, loop.time() - before - ADMISSION_LAG_INTERVAL_S)
+            metrics.EVENT_LOOP_LAG.observe(lag)
+            self.loop_lag += _LAG_SMOOTHING * (lag - self.loop_lag)
+            self.loop_lag_peak = max(lag, self.loop_lag_peak * _LAG_DECAY)
+            metrics.LOOP_LAG_PEAK.set(self.loop_lag_peak, label=worker)
+            metrics.OUTBOUND_QUEUE_MEAN_DEPTH.set(mean_queue_depth(), label=worker)
+
+    async def _watch_shared_state(self):
+        while True:
+            try:
+                if ADMISSION_MAX_LOOP_LAG_MS or ADMISSION_MAX_QUEUE_DEPTH:
+                    # reads the other workers' snapshot files
+                    lags, depths = await asyncio.to_thread(_worker_load)
+                    self.workers_loop_lag = sum(lags) / len(lags) if lags else 0.0
+                    self.workers_queue_depth = sum(depths) / len(depths) if depths else 0.0
+                if ADMISSION_MAX_CALLS:
+                    await call_store.hold_slots(list(self.streaming), ADMISSION_RESERVATION_S)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.warning("Could not refresh shared admission state: %s", e)
+            await asyncio.sleep(ADMISSION_SHARED_INTERVAL_S)
+
+    async def admit_call(self, event_id: str) -> str:
+        """None if a new call may be answered, else the reason it may not.
+        An admitted call holds a slot from here; answered() hands it to the
+        call, and it is freed by release() or when it stops being renewed."""
+        reason = self._overloaded()
+        if reason is None and ADMISSION_MAX_CALLS:
+            key = RESERVATION_PREFIX + event_id
+            if not await call_store.reserve_slot(key, ADMISSION_MAX_CALLS, ADMISSION_RESERVATION_S):
+                reason = "calls"
+        if reason is not None:
+            metrics.ADMISSION_REFUSED.inc(label=reason)
+        return reason
+
+    async def answered(self, event_id: str, call_connection_id: str):
+        if ADMISSION_MAX_CALLS:
+            await call_store.move_slot(RESERVATION_PREFIX + event_id, call_connection_id, ADMISSION_RESERVATION_S)
+
+    def streaming_started(self, call_connection_id: str):
+        self.streaming.add(call_connection_id)
+
+    async def release(self, key: str):
+        """Frees the slot of an answered call."""
+        self.streaming.discard(key)
+        if ADMISSION_MAX_CALLS:
+            await call_store.release_slot(key)
+
+    async def release_event(self, event_id: str):
+        await self.release(RESERVATION_PREFIX + event_id)
+
+    def admit_session(self) -> str:
+        """None if a media session may start on this worker, else the reason
+        it may not."""
+        if ADMISSION_SESSION_MAX_LOOP_LAG_MS and 1000 * self.loop_lag >= ADMISSION_SESSION_MAX_LOOP_LAG_MS:
+            metrics.ADMISSION_REFUSED.inc(label="session_loop_lag")
+            return "loop_lag"
+        return None
+
+    def _overloaded(self) -> str:
+        # a limit of 0 is switched off
+        if ADMISSION_MAX_LOOP_LAG_MS and 1000 * self.workers_loop_lag >= ADMISSION_MAX_LOOP_LAG_MS:
+            return "loop_lag"
+        if ADMISSION_MAX_QUEUE_DEPTH and self.workers_queue_depth >= ADMISSION_MAX_QUEUE_DEPTH:
+            return "queue_depth"
+        return None
+
+
+admission = AdmissionControl()
@@ -0,0 +1,95 @@
+import asyncio
+import base64
+import logging
+import os
+import time
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# 0 disables batching: every ACS frame is forwarded as its own append
+INBOUND_AUDIO_BATCH_MS = int(os.getenv("INBOUND_AUDIO_BATCH_MS", "0"))
+INBOUND_AUDIO_BATCH_MAX_BYTES = int(os.getenv("INBOUND_AUDIO_BATCH_MAX_BYTES", "0"))
+# PCM24K mono, 16 bit
+BYTES_PER_MS = 48
+
+
+class InboundAudioBatcher():
+    """Coalesces ACS audio frames into fewer input_audio_buffer.append calls.
+
+    Decoded PCM is accumulated in a reusable bytearray and flushed once it
+    holds `batch_ms` of audio, reaches `max_bytes`, or the batch timer fires.
+    """
+
+    def __init__(self, append, batch_ms: int = INBOUND_AUDIO_BATCH_MS, max_bytes: int = INBOUND_AUDIO_BATCH_MAX_BYTES) -> None:
+        self._append = append
+        self.batch_ms = batch_ms
+        self.max_bytes = max_bytes or batch_ms * BYTES_PER_MS
+        self._buffer = bytearray(self.max_bytes + 4096)
+        self._size = 0
+        self._timer = None
+        # flush started by the timer, kept so its failure is seen and close() can stop it
+        self._timed_flush = None
+        self._lock = asyncio.Lock()
+        self.frames_in = 0
+        self.frames_out = 0
+        self.started = time.monotonic()
+
+    def retarget(self, append):
+        """Sends later flushes to a replacement realtime session."""
+        self._append = append
+
+    def pending(self) -> int:
+        return self._size
+
+    async def add(self, data: str):
+        await self.add_pcm(base64.b64decode(data))
+
+    async def add_pcm(self, pcm: bytes):
+        self.frames_in += 1
+        end = self._size + len(pcm)
+        if end > len(self._buffer):
+            self._buffer.extend(bytes(end - len(self._buffer)))
+        self._buffer[self._size:end] = pcm
+        self._size = end
+        if self._size >= self.max_bytes:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_ms / 1000, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._timed_flush = asyncio.create_task(self.flush())
+        self._timed_flush.add_done_callback(self._timed_flush_done)
+
+    def _timed_flush_done(self, task: asyncio.Task):
+        if self._timed_flush is task:
+            self._timed_flush = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Timed flush of inbound audio failed: %s", task.exception())
+
+    async def flush(self):
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._size:
+                return
+            with memoryview(self._buffer) as view:
+                data = base64.b64encode(view[:self._size]).decode("ascii")
+            self._size = 0
+            self.frames_out += 1
+            await self._append(audio=data)
+            metrics.REALTIME_APPENDS.inc()
+
+    def rates(self):
+        """Returns (ACS frames/s in, upstream appends/s out) since creation."""
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return self.frames_in / elapsed, self.frames_out / elapsed
+
+    async def close(self):
+        if self._timed_flush is not None:
+            self._timed_flush.cancel()
+            await asyncio.gather(self._timed_flush, return_exceptions=True)
+        await self.flush()
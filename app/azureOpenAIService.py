@@ -1,132 +1,304 @@
 import json
+import logging
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from openai import AsyncAzureOpenAI
-
 import asyncio
+import base64
 import json
-import httpx
+import random
+import time
+from collections import deque
+
+from fastapi.websockets import WebSocketDisconnect, WebSocketState
+from websockets.exceptions import ConnectionClosed
+
+from app.acsMedia import parse_acs_frame
+from app.acsOutbound import AcsOutboundWriter
+from app.clients import get_openai_client, send_realtime_event
+from app.tools import ToolResultCache, tool_registry
+from app.sessionProfiles import session_profiles
+from app import metrics
+from app.callLogging import CALL_DEBUG_SAMPLE_RATE, CallLogger
+from app.fillerAudio import FILLER_DELAY_MS, filler_clip, hold_clip
+from app.realtimePool import ProfilePools
+from app.audioBatcher import INBOUND_AUDIO_BATCH_MS, InboundAudioBatcher
+from app import jsonCodec
+from app.callCapture import CALL_CAPTURE_ENABLED, CallCapture
 
-AZURE_OPENAI_API_ENDPOINT = os.getenv("AZURE_OPENAI_API_ENDPOINT")
-AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
 SAMPLE_RATE = 24000
+LOCAL_VAD_ENABLED = os.getenv("LOCAL_VAD_ENABLED", "false").lower() == "true"
+# fire stop_audio locally on speech onset instead of waiting for speech_started
+LOCAL_VAD_BARGE_IN = os.getenv("LOCAL_VAD_BARGE_IN", "false").lower() == "true"
+if LOCAL_VAD_ENABLED:
+    # numpy is only worth its import time and memory when the gate is on
+    from app.vad import EnergyVad
+# the caller waits at most this long for all the tool calls of one response
+TOOL_RESPONSE_TIMEOUT_S = float(os.getenv("TOOL_RESPONSE_TIMEOUT_S", "10"))
+# how long a finished call waits for tool calls still running
+TOOL_DRAIN_TIMEOUT_S = float(os.getenv("TOOL_DRAIN_TIMEOUT_S", "5"))
+# retries after the realtime session drops mid-call, with jittered exponential backoff
+REALTIME_RECONNECT_ATTEMPTS = int(os.getenv("REALTIME_RECONNECT_ATTEMPTS", "5"))
+REALTIME_RECONNECT_BASE_MS = int(os.getenv("REALTIME_RECONNECT_BASE_MS", "250"))
+REALTIME_RECONNECT_MAX_MS = int(os.getenv("REALTIME_RECONNECT_MAX_MS", "4000"))
+# caller audio held while reconnecting; the oldest is dropped past this
+REALTIME_RECONNECT_BUFFER_MS = int(os.getenv("REALTIME_RECONNECT_BUFFER_MS", "5000"))
+# transcript turns replayed into the replacement session
+REALTIME_REPLAY_ITEMS = int(os.getenv("REALTIME_REPLAY_ITEMS", "20"))
+ACS_FRAME_MS = 20
+# stands in for a frame ACS flagged as silent; 20 ms of PCM24K mono 16-bit
+SILENT_FRAME = bytes(ACS_FRAME_MS * SAMPLE_RATE * 2 // 1000)
+
+def connect_realtime():
+    return get_openai_client().beta.realtime.connect(
+                model="gpt-4o-realtime-preview"
+        )
+
+
+async def configure_realtime(connection, profile):
+    # the event was serialized when the profile was loaded; skip the SDK's
+    # per-call model validation and dump of the same payload
+    await send_realtime_event(connection, profile.update_event)
+
+
+realtime_pools = ProfilePools(connect_realtime, configure_realtime)
+
+
+class ToolBatch():
+    """The function calls of one response. They share a deadline, and the
+    model is asked to continue once, after the response is done and every
+    call's output is in the conversation."""
+
+    def __init__(self, deadline: float) -> None:
+        self.deadline = deadline
+        self.pending = 0
+        # status of the response once response.done arrives
+        self.status = None
 
-system_prompt = """Your name is Mudasir, you work for Novizant Services. 
-You're a helpful, calm and cheerful agent who responds with a clam American accent, but also can speak in any language or accent. 
-Always start the conversation with a cheery hello, stating your name and who do you work for! You can also call functions when requested. 
-Ask if the user has any questions or if they need help with anything if not then end the call.
-
-You are a helpful assistant that can help with the following tasks:
-- Get the ticket from the server
-- Create a new ticket on the server
-- End the current phone call
-"""
-
-
-def session_config():
-    """Returns a random value from the predefined list."""
-
-    SESSION_CONFIG={
-        "input_audio_transcription": {
-            "model": "whisper-1",
-        },
-        "turn_detection": {
-            "threshold": 0.4,
-            "silence_duration_ms": 600,
-            "type": "server_vad"
-        },
-        "instructions": system_prompt,
-        "voice": "shimmer",
-        "modalities": ["text", "audio"],
-        "tool_choice": "auto",
-        "tools": [
-            {
-                "type": "function",
-                "name": "get_ticket",
-                "description": "Get the ticket from the server",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "ticket_id": {
-                            "type": "string",
-                            "description": "The id of the ticket to get"
-                        }
-                    },
-                    "required": ["ticket_id"]
-                }
-            },
-            {
-                "type": "function",
-                "name": "create_ticket",
-                "description": "Create a new ticket on the server",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "description": {
-                            "type": "string",
-                            "description": "The description of the ticket to create"
-                        }
-                    },
-                    "required": ["description"]
-                }
-            },
-            {
-                "type": "function",
-                "name": "end_call",
-                "description": "End the current phone call",
-                "parameters": {
-                    "type": "object",
-                    "properties": {},
-                    "required": []
-                }
-            }
-        ]
-    }
-    return SESSION_CONFIG
 
 class OpenAIRTHandler():
     incoming_websocket = None
-    client = None
     connection = None
     connection_manager = None
+    outbound = None
+    inbound = None
+    vad = None
+    capture = None
     welcomed = False
-
-    def __init__(self) -> None:
-        print("Hello World")
-        self.client = AsyncAzureOpenAI(
-                azure_endpoint=AZURE_OPENAI_API_ENDPOINT,
-                azure_deployment=AZURE_OPENAI_DEPLOYMENT_NAME,
-                api_key=AZURE_OPENAI_API_KEY,
-                api_version=AZURE_OPENAI_API_VERSION,
-            )
-        self.connection_manager = self.client.beta.realtime.connect(
-                    model="gpt-4o-realtime-preview"
-            )
-
-    def __exit__(self, exc_type, exc_value, traceback):
-        self.connection.close()
-        self.incoming_websocket.close()
+    started_at = None
+    first_audio_at = None
+    filler_playing = False
+    speech_stopped_at = None
+    response_id = None
+    # response currently generating upstream, and the last one cut off by barge-in
+    active_response_id = None
+    interrupted_response_id = None
+    call_connection_id = None
+    correlation_id = None
+    closed = False
+    # the realtime session dropped and a replacement is being opened
+    reconnecting = False
+    # server VAD has heard the caller start a turn it hasn't ended yet
+    caller_speaking = False
+
+    def __init__(self, profile=None) -> None:
+        self.profile = profile or session_profiles.default
+        self.log = CallLogger()
+        self.started_at = time.monotonic()
+        self.tasks = set()
+        self.tool_tasks = set()
+        self.tool_cache = ToolResultCache()
+        # response id -> ToolBatch of its function calls
+        self.tool_batches = {}
+        # (role, text) of recent turns, replayed if the session has to be replaced
+        self.history = deque(maxlen=REALTIME_REPLAY_ITEMS)
+        self.backlog = deque(maxlen=REALTIME_RECONNECT_BUFFER_MS // ACS_FRAME_MS)
+        self.backlog_dropped = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def run(self):
+        """Pumps both directions until either side hangs up."""
+        self.tasks = {
+            asyncio.create_task(self.receive_acs_messages()),
+            asyncio.create_task(self.receive_oai_sessions()),
+        }
+        done, _ = await asyncio.wait(self.tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                self.log.info("Call ended: %s", task.exception())
+
+    async def close(self):
+        """Releases everything the call holds; safe to call more than once."""
+        if self.closed:
+            return
+        self.closed = True
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.tool_tasks:
+            # let tools with side effects finish while the session is still open
+            _, pending = await asyncio.wait(self.tool_tasks, timeout=TOOL_DRAIN_TIMEOUT_S)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self.inbound is not None:
+            try:
+                await self.inbound.close()
+            except Exception:
+                pass
+            frames_in, frames_out = self.inbound.rates()
+            self.log.info("Inbound audio: %.1f ACS frames/s -> %.1f appends/s", frames_in, frames_out)
+        if self.outbound is not None:
+            await self.outbound.close()
+        if self.capture is not None:
+            await self.capture.close()
+        if self.connection is not None:
+            try:
+                await self.connection.close()
+            except Exception as e:
+                self.log.debug("Closing realtime session failed: %s", e)
+        socket = self.incoming_websocket
+        if (socket is not None and socket.client_state == WebSocketState.CONNECTED
+                and socket.application_state == WebSocketState.CONNECTED):
+            try:
+                await socket.close()
+            except Exception:
+                pass
 
     
 #init_websocket -> init_incoming_websocket (incoming)
     async def init_incoming_websocket(self, socket):
         # print("--inbound socket set")
         self.incoming_websocket = socket
+        self.outbound = AcsOutboundWriter(self.send_message)
+        self.outbound.start()
 
 #start_conversation > start_client
     async def start_client(self):
-            self.connection = await self.connection_manager.enter()
-            await self.connection.session.update(session=session_config())
+            # pooled sessions are already connected and have the profile applied
+            session = await realtime_pools.get(self.profile).acquire()
+            self.connection_manager = session.manager
+            self.connection = session.connection
+            if INBOUND_AUDIO_BATCH_MS > 0:
+                self.inbound = InboundAudioBatcher(self.connection.input_audio_buffer.append)
+            if LOCAL_VAD_ENABLED:
+                self.vad = EnergyVad(trailing_silence_ms=self.profile.silence_duration_ms)
+            if CALL_CAPTURE_ENABLED:
+                self.capture = CallCapture(self.call_connection_id, {
+                    "correlation_id": self.correlation_id,
+                    "profile": self.profile.name,
+                })
             await self.connection.response.create()
-            ### running an async task to listen and recieve oai messages
-            asyncio.create_task(self.receive_oai_messages())
 
 
+    async def receive_acs_messages(self):
+        while True:
+            try:
+                data = await self.incoming_websocket.receive_text()
+            except WebSocketDisconnect:
+                return
+            except Exception as e:  # pylint: disable=broad-except
+                self.log.info("WebSocket connection closed: %s", e)
+                return
+            await self.acs_to_oai(data)
+            await self.send_welcome()
+
+    async def receive_oai_sessions(self):
+        """Consumes realtime events, replacing the session if it drops."""
+        while True:
+            try:
+                await self.receive_oai_messages()
+                self.log.warning("Realtime session closed by the server")
+            except ConnectionClosed as e:
+                self.log.warning("Realtime session dropped: %s", e)
+            if not await self.reconnect():
+                return
+
+    async def reconnect(self) -> bool:
+        """Opens a replacement session with the profile's configuration and
+        the recent turns replayed, while the caller hears the hold prompt and
+        their audio is buffered. False once the attempts run out."""
+        started = time.monotonic()
+        self.reconnecting = True
+        resume = self.active_response_id is not None
+        self.active_response_id = None
+        self.play_filler(hold_clip())
+        # the new session can't truncate an item of the old one
+        self.outbound.forget_playback()
+        try:
+            await self.connection.close()
+        except Exception:
+            pass
+        for attempt in range(REALTIME_RECONNECT_ATTEMPTS):
+            # full jitter, so calls dropped together don't retry together
+            backoff_ms = min(REALTIME_RECONNECT_MAX_MS, REALTIME_RECONNECT_BASE_MS * 2 ** attempt)
+            await asyncio.sleep(random.uniform(0, backoff_ms) / 1000)
+            session = None
+            try:
+                session = await realtime_pools.get(self.profile).acquire()
+                replayed = await self._resume(session, resume)
+                break
+            except Exception as e:  # pylint: disable=broad-except
+                self.log.warning("Realtime reconnect attempt %d failed: %s", attempt + 1, e)
+                if session is not None:
+                    try:
+                        await session.connection.close()
+                    except Exception:
+                        pass
+        else:
+            metrics.REALTIME_RECONNECT_FAILED.inc()
+            self.log.error("Giving up on the realtime session after %d attempts", REALTIME_RECONNECT_ATTEMPTS)
+            return False
+
+        self.reconnecting = False
+        if not resume:
+            # no answer is coming to take over from the hold prompt
+            self.filler_playing = False
+            self.outbound.cancel_filler()
+        elapsed = time.monotonic() - started
+        metrics.REALTIME_RECONNECT.observe(elapsed)
+        self.log.info(
+            "Realtime session reconnected in %.0f [ms], replayed %d turns and %d buffered frames (%d dropped)",
+            1000 * elapsed, len(self.history), replayed, self.backlog_dropped,
+        )
+        self.backlog_dropped = 0
+        return True
+
+    async def _resume(self, session, resume: bool) -> int:
+        """Moves the call onto a replacement session: the recent turns, the
+        answer the drop cut off and the caller audio held meanwhile. Returns
+        the number of held frames sent."""
+        self.connection_manager = session.manager
+        self.connection = session.connection
+        self.caller_speaking = False
+        # function calls of the old session can't be continued in this one
+        self.tool_batches.clear()
+        if self.inbound is not None:
+            self.inbound.retarget(self.connection.input_audio_buffer.append)
+        for role, text in self.history:
+            content_type = "input_text" if role == "user" else "text"
+            await self.connection.conversation.item.create(
+                item={"type": "message", "role": role, "content": [{"type": content_type, "text": text}]}
+            )
+        if resume:
+            # the drop cut off an answer; let the new session give it again
+            await self.connection.response.create()
+        replayed = 0
+        # frames that arrive while this drains are appended behind it; one the
+        # session fails to take stays first in line for the next attempt
+        while self.backlog:
+            await self._send_audio(self.backlog[0])
+            self.backlog.popleft()
+            replayed += 1
+        return replayed
+
 #receive_messages > receive_oai_messages
     async def receive_oai_messages(self):
         async for event in self.connection:
@@ -134,71 +306,137 @@ class OpenAIRTHandler():
                 continue
             match event.type:
                 case "session.created":
-                    print("Session Created Message")
-                    print(f"  Session Id: {event.session.id}")
+                    self.log.info("Session created: %s", event.session.id)
                     pass
                 case "error":
-                    print(f"  Error: {event.error}")
-                    pass
+                    if event.error.code == "response_cancel_not_active":
+                        # barge-in raced the response finishing
+                        self.log.debug("Realtime error: %s", event.error)
+                    else:
+                        self.log.error("Realtime error: %s", event.error)
                 case "input_audio_buffer.cleared":
-                    print("Input Audio Buffer Cleared Message")
+                    self.log.debug("Input audio buffer cleared")
                     pass
                 case "input_audio_buffer.speech_started":
-                    print(f"Voice activity detection started at {event.audio_start_ms} [ms]")
+                    self.log.debug("Voice activity detection started at %s [ms]", event.audio_start_ms)
+                    self.caller_speaking = True
                     await self.stop_audio()
                     pass
                 case "input_audio_buffer.speech_stopped":
-                    pass
+                    self.caller_speaking = False
+                    self.speech_stopped_at = time.perf_counter()
                 case "conversation.item.input_audio_transcription.completed":
-                    print(f" User:-- {event.transcript}")
+                    self.log.info("User: %s", event.transcript)
+                    self.history.append(("user", event.transcript))
+                    if self.capture is not None:
+                        self.capture.transcript("caller", event.transcript, event.item_id)
                 case "conversation.item.input_audio_transcription.failed":
-                    print(f"  Error: {event.error}")
+                    self.log.warning("Transcription failed: %s", event.error)
+                case "response.created":
+                    self.active_response_id = event.response.id
                 case "response.done":
-                    print("Response Done Message")
-                    print(f"  Response Id: {event.response.id}")
+                    self.log.debug("Response done: %s", event.response.id)
+                    if self.active_response_id == event.response.id:
+                        self.active_response_id = None
+                    if self.filler_playing and event.response.id not in self.tool_batches:
+                        # the answer after the tools had no audio to take over
+                        # from the filler; it plays out and the next tool may play it again
+                        self.filler_playing = False
                     if event.response.status_details:
-                        print(f"  Status Details: {event.response.status_details.model_dump_json()}")
+                        self.log.info("Response %s status details: %s", event.response.id, event.response.status_details)
+                    batch = self.tool_batches.get(event.response.id)
+                    if batch is not None:
+                        batch.status = event.response.status
+                        await self.continue_after_tools(event.response.id)
                 case "response.audio_transcript.done":
-                    print(f" AI:-- {event.transcript}")
+                    self.log.info("AI: %s", event.transcript)
+                    self.history.append(("assistant", event.transcript))
+                    if self.capture is not None:
+                        self.capture.transcript("assistant", event.transcript, event.item_id)
                 case "response.audio.delta":
-                    await self.oai_to_acs(event.delta)
-                    pass
+                    if event.response_id == self.interrupted_response_id:
+                        # still in flight when the caller barged in
+                        continue
+                    if self.first_audio_at is None:
+                        self.first_audio_at = time.monotonic()
+                        metrics.TIME_TO_FIRST_AUDIO.observe(self.first_audio_at - self.started_at)
+                        self.log.info("Time to first audio: %.0f [ms]", 1000 * (self.first_audio_at - self.started_at))
+                    if event.response_id != self.response_id:
+                        self.response_id = event.response_id
+                        now = time.perf_counter()
+                        self.outbound.mark_first_audio(now)
+                        if self.speech_stopped_at is not None:
+                            metrics.SPEECH_STOPPED_TO_FIRST_DELTA.observe(now - self.speech_stopped_at)
+                            self.speech_stopped_at = None
+                    if self.filler_playing:
+                        # real response audio replaces the filler
+                        self.filler_playing = False
+                        self.outbound.cancel_filler()
+                    if self.capture is not None:
+                        self.capture.assistant(event.delta)
+                    await self.oai_to_acs(event.delta, event.item_id)
+                    self.log.sampled(
+                        CALL_DEBUG_SAMPLE_RATE, logging.DEBUG, "Audio delta of %s queued, %d frames to ACS pending",
+                        event.item_id, self.outbound.depth(),
+                    )
                 case "response.function_call_arguments.done":
-                    await self.handle_function_call(event)
+                    batch = self.tool_batches.get(event.response_id)
+                    if batch is None:
+                        batch = ToolBatch(asyncio.get_running_loop().time() + TOOL_RESPONSE_TIMEOUT_S)
+                        self.tool_batches[event.response_id] = batch
+                    batch.pending += 1
+                    # run the tool on its own task so audio keeps flowing
+                    task = asyncio.create_task(self.handle_function_call(event, batch))
+                    self.tool_tasks.add(task)
+                    task.add_done_callback(self.tool_tasks.discard)
                     pass
                 case _:
                     pass
 
     
-    async def handle_function_call(self, event):
+    async def handle_function_call(self, event, batch: ToolBatch):
         """Handle function call events from OpenAI"""
         try:
             function_name = event.name
             call_id = event.call_id
             
-            print(f"Function call received: {function_name} with call_id: {call_id}")
+            self.log.info("Function call received: %s with call_id: %s", function_name, call_id)
             
             try:
-                arguments = json.loads(event.arguments) if isinstance(event.arguments, str) else event.arguments
-            except json.JSONDecodeError:
-                print(f"Failed to parse arguments: {event.arguments}")
+                arguments = jsonCodec.loads(event.arguments) if isinstance(event.arguments, str) else event.arguments
+            except ValueError:
+                self.log.warning("Failed to parse arguments: %s", event.arguments)
                 arguments = {}
             
-            if function_name == "get_ticket":
-                result = await self.get_ticket_function(arguments)
-                await self.send_function_call_result(result, call_id)
-            elif function_name == "create_ticket":
-                result = await self.create_ticket_function(arguments)
-                await self.send_function_call_result(result, call_id)
-            elif function_name == "end_call":
-                result = await self.end_call_function(arguments)
-                await self.send_function_call_result(result, call_id)
-            else:
-                error_result = f"Unknown function: {function_name}"
-                await self.send_function_call_result(error_result, call_id)
-                
+            filler_timer = asyncio.get_running_loop().call_later(FILLER_DELAY_MS / 1000, self.play_filler)
+            try:
+                result = await tool_registry.call(
+                    function_name, arguments, self, cache=self.tool_cache, deadline=batch.deadline
+                )
+            finally:
+                filler_timer.cancel()
+            await self.send_function_call_result(result, call_id)
+
+        except Exception as e:
+            self.log.exception("Error handling function call: %s", e)
+        finally:
+            batch.pending -= 1
+            await self.continue_after_tools(event.response_id)
+
+    async def continue_after_tools(self, response_id):
+        """One response.create for all the function calls of a response; a
+        second one would be refused while the first is generating."""
+        batch = self.tool_batches.get(response_id)
+        if batch is None or batch.pending or batch.status is None:
+            return
+        del self.tool_batches[response_id]
+        if batch.status == "cancelled":
+            # the caller barged in; their turn gets its own response
+            return
+        try:
+            await self.connection.response.create()
         except Exception as e:
-            print(f"Error handling function call: {e}")
+            self.log.error("Error continuing after function calls: %s", e)
 
 
     async def send_function_call_result(self, result, call_id):
@@ -212,11 +450,10 @@ class OpenAIRTHandler():
                 }
             )
             
-            await self.connection.response.create()
-            print(f"Sent function call result: {result}")
+            self.log.debug("Sent function call result: %s", result)
             
         except Exception as e:
-            print(f"Error sending function call result: {e}")
+            self.log.error("Error sending function call result: %s", e)
             
 
     async def send_welcome(self):
@@ -234,30 +471,40 @@ class OpenAIRTHandler():
 
 # stop oai talking when detecting the user talking
     async def stop_audio(self):
-            stop_audio_data = {
-                "Kind": "StopAudio",
-                "AudioData": None,
-                "StopAudio": {}
-            }
-
-            json_data = json.dumps(stop_audio_data)
-            await self.send_message(json_data)
-
-
-    async def oai_to_acs(self, data):
+            self.filler_playing = False
+            item_id, played_ms, sent_ms = self.outbound.playback_position()
+            flushed = self.outbound.stop_audio()
+            response_id = self.active_response_id
+            if response_id is not None:
+                self.interrupted_response_id = response_id
+                self.active_response_id = None
+                await self.connection.response.cancel(response_id=response_id)
+            if item_id is not None and (response_id is not None or flushed or played_ms < sent_ms):
+                # keep only what the caller heard in the model's context
+                await self.connection.conversation.item.truncate(
+                    item_id=item_id, content_index=0, audio_end_ms=played_ms
+                )
+                self.log.debug("Barge-in: truncated %s at %d of %d [ms]", item_id, played_ms, sent_ms)
+                if self.capture is not None:
+                    self.capture.event("truncated", item_id=item_id, audio_end_ms=played_ms, sent_ms=sent_ms)
+
+
+    def play_filler(self, clip: tuple = None):
+        """Hides tool latency by queuing the cached filler clip to ACS."""
+        clip = clip or filler_clip()
+        if not clip or self.filler_playing:
+            return
+        self.filler_playing = True
+        for chunk in clip:
+            self.outbound.put_filler(chunk)
+
+
+    async def oai_to_acs(self, data, item_id=None):
         try:
-            data = {
-                "Kind": "AudioData",
-                "AudioData": {
-                        "Data":  data
-                },
-                "StopAudio": None
-            }
-            serialized_data = json.dumps(data)
-            await self.send_message(serialized_data)
+            self.outbound.put_audio(data, item_id)
             
         except Exception as e:
-            print(e)
+            self.log.throttled("oai_to_acs", logging.ERROR, "Failed to queue audio: %s", e)
 
 
     async def send_message(self, message: str):
@@ -265,53 +512,78 @@ class OpenAIRTHandler():
             # FastAPI WebSocket expects text to be sent via send_text
             await self.incoming_websocket.send_text(message)
         except Exception as e:
-            print(f"Failed to send message: {e}")
+            self.log.throttled("send_message", logging.WARNING, "Failed to send message: %s", e)
 
 
     async def acs_to_oai(self, stream_data):
         try:
-            data = json.loads(stream_data)
-            kind = data['kind']
-            if kind == "AudioData":
-                audio_data_section = data.get("audioData", {})
-                if not audio_data_section.get("silent", True):
-                    audio_data = audio_data_section.get("data")
-                    await self.connection.input_audio_buffer.append(audio=audio_data)
+            arrived = time.perf_counter()
+            frame = parse_acs_frame(stream_data)
+            if frame.kind != "AudioData":
+                return
+            if frame.silent:
+                if self.capture is not None:
+                    # keeps the caller track on the call's timeline
+                    self.capture.caller_silence()
+                # server VAD counts the silence it is sent, so a turn only
+                # ends if the silence after it goes upstream
+                if self.vad is not None:
+                    silence = self.vad.process_silence()
+                else:
+                    silence = [SILENT_FRAME] if self.caller_speaking else []
+                if not self.reconnecting:
+                    for pcm in silence:
+                        await self.forward_pcm(pcm)
+                if self.inbound is not None and self.inbound.pending():
+                    # don't hold the tail of an utterance until the timer fires
+                    await self.inbound.flush()
+                return
+            metrics.ACS_FRAMES_IN.inc()
+            if self.capture is not None:
+                self.capture.caller(frame.data)
+            if self.reconnecting:
+                self._hold_audio(frame.data)
+                return
+            await self.forward_audio(frame.data)
+            forwarded = time.perf_counter() - arrived
+            metrics.ACS_FRAME_TO_APPEND.observe(forwarded)
+            self.log.sampled(
+                CALL_DEBUG_SAMPLE_RATE, logging.DEBUG, "ACS frame forwarded in %.2f [ms]", 1000 * forwarded
+            )
         except Exception as e:
-            print(f'Error processing WebSocket message: {e}')
-
-# OpenAI Functions
-
-    async def get_ticket_function(self, arguments):
-        """Execute the get_ticket function"""
-
-        url = f"{os.getenv("CALLBACK_URI_HOST")}/api/ticket/{arguments['ticket_id']}"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
+            self.log.throttled("acs_to_oai", logging.ERROR, "Error processing WebSocket message: %s", e)
 
-        message = response.text
-        return message
-
-    async def create_ticket_function(self, arguments):
-        """Execute the create_ticket function"""
-        url = f"{os.getenv("CALLBACK_URI_HOST")}/api/ticket"
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=arguments)
-
-        message = response.text
-        return message
-
-    async def end_call_function(self, arguments):
-        """Execute the end_call function"""
+    async def forward_audio(self, data: str):
         try:
-            url = f"{os.getenv("CALLBACK_URI_HOST")}/api/endCall"
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url)
-
-            if response.status_code == 200:
-                return "Call ended successfully. Thank you for calling!"
+            await self._send_audio(data)
+        except ConnectionClosed:
+            # dropped before receive_oai_sessions noticed; keep the frame for
+            # the replacement session
+            self.reconnecting = True
+            self._hold_audio(data)
+
+    def _hold_audio(self, data: str):
+        if len(self.backlog) == self.backlog.maxlen:
+            self.backlog_dropped += 1
+        self.backlog.append(data)
+
+    async def _send_audio(self, data: str):
+        if self.vad is None:
+            if self.inbound is None:
+                await self.connection.input_audio_buffer.append(audio=data)
+                metrics.REALTIME_APPENDS.inc()
             else:
-                return "Failed to end call. Please try again."
-        except Exception as e:
-            print(f"Error ending call: {e}")
-            return "Failed to end call due to an error."
\ No newline at end of file
+                await self.inbound.add(data)
+        else:
+            frames, onset = self.vad.process(base64.b64decode(data))
+            if onset and LOCAL_VAD_BARGE_IN:
+                await self.stop_audio()
+            for pcm in frames:
+                await self.forward_pcm(pcm)
+
+    async def forward_pcm(self, pcm: bytes):
+        if self.inbound is not None:
+            await self.inbound.add_pcm(pcm)
+        else:
+            await self.connection.input_audio_buffer.append(audio=base64.b64encode(pcm).decode("ascii"))
+            metrics.REALTIME_APPENDS.inc()
@@ -0,0 +1,235 @@
+import asyncio
+import base64
+import logging
+import os
+import time
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from app import jsonCodec, metrics
+
+logger = logging.getLogger(__name__)
+
+CALL_CAPTURE_ENABLED = os.getenv("CALL_CAPTURE_ENABLED", "false").lower() == "true"
+CALL_CAPTURE_DIR = os.getenv("CALL_CAPTURE_DIR", "/tmp/call_captures")
+# PCM held per track while the writer catches up; past that, audio is dropped
+CALL_CAPTURE_BUFFER_S = float(os.getenv("CALL_CAPTURE_BUFFER_S", "4"))
+# hand buffered audio to the writer once this much has accumulated
+CALL_CAPTURE_FLUSH_MS = int(os.getenv("CALL_CAPTURE_FLUSH_MS", "500"))
+CALL_CAPTURE_THREADS = int(os.getenv("CALL_CAPTURE_THREADS", "2"))
+# idle ring buffers a worker keeps for the next calls
+CALL_CAPTURE_POOL_SIZE = int(os.getenv("CALL_CAPTURE_POOL_SIZE", "16"))
+
+SAMPLE_RATE = 24000
+# PCM24K mono 16-bit
+BYTES_PER_MS = 48
+FRAME_BYTES = 20 * BYTES_PER_MS
+_SILENCE = bytes(FRAME_BYTES)
+
+_executor = None
+_free_buffers = []
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # created on first use so it belongs to the worker, not the preloaded master
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(CALL_CAPTURE_THREADS, thread_name_prefix="capture")
+    return _executor
+
+
+def _acquire_buffer(size: int) -> bytearray:
+    while _free_buffers:
+        buffer = _free_buffers.pop()
+        if len(buffer) == size:
+            return buffer
+    return bytearray(size)
+
+
+def _release_buffer(buffer: bytearray):
+    if len(_free_buffers) < CALL_CAPTURE_POOL_SIZE:
+        _free_buffers.append(buffer)
+
+
+class AudioRing():
+    """Fixed-size PCM ring. The event loop copies audio in once; the writer
+    thread gets memoryview slices of the same storage, which stay untouched
+    until it reports them written. A full ring drops new audio instead of
+    growing or waiting."""
+
+    def __init__(self, buffer: bytearray) -> None:
+        self.buffer = buffer
+        self.capacity = len(buffer)
+        self._view = memoryview(buffer)
+        # running byte offsets: accepted from the loop / written out by the thread
+        self.written = 0
+        self.released = 0
+        self.dropped = 0
+
+    def pending(self) -> int:
+        return self.written - self.released
+
+    def write(self, data) -> bool:
+        size = len(data)
+        if size > self.capacity - self.pending():
+            self.dropped += size
+            return False
+        data = memoryview(data)
+        start = self.written % self.capacity
+        first = min(size, self.capacity - start)
+        self._view[start:start + first] = data[:first]
+        if first < size:
+            self._view[:size - first] = data[first:]
+        self.written += size
+        return True
+
+    def regions(self, start: int, end: int) -> list:
+        """memoryviews covering the running offsets [start, end)."""
+        if start == end:
+            return []
+        begin = start % self.capacity
+        size = end - start
+        if begin + size <= self.capacity:
+            return [self._view[begin:begin + size]]
+        return [self._view[begin:], self._view[:begin + size - self.capacity]]
+
+    def close(self) -> bytearray:
+        self._view.release()
+        return self.buffer
+
+
+class CallCapture():
+    """Per-call recording: caller.wav, assistant.wav and transcript.jsonl
+    (one JSON object per line) under CALL_CAPTURE_DIR/<call id>/.
+
+    Every method is non-blocking and meant for the event loop. File work
+    runs on a shared thread pool, one job per call at a time so writes stay
+    in order. The caller track is kept on the call's timeline (silent
+    frames become silence); the assistant track is the audio as generated,
+    and transcript lines carry offsets from the start of the call.
+    """
+
+    def __init__(self, call_id: str = None, meta: dict = None) -> None:
+        self.call_id = call_id or str(uuid.uuid4())
+        self.directory = os.path.join(CALL_CAPTURE_DIR, self.call_id)
+        self.started = time.monotonic()
+        size = int(CALL_CAPTURE_BUFFER_S * 1000) * BYTES_PER_MS
+        self._rings = {"caller": AudioRing(_acquire_buffer(size)), "assistant": AudioRing(_acquire_buffer(size))}
+        self._flush_bytes = CALL_CAPTURE_FLUSH_MS * BYTES_PER_MS
+        self._lines = []
+        self._files = None
+        self._job = None
+        self._again = False
+        self._failed = False
+        self._closed = False
+        self._line("call", call_id=self.call_id, **(meta or {}))
+
+    def caller(self, data: str):
+        self._write("caller", base64.b64decode(data))
+
+    def caller_silence(self):
+        self._write("caller", _SILENCE)
+
+    def assistant(self, data: str):
+        self._write("assistant", base64.b64decode(data))
+
+    def transcript(self, role: str, text: str, item_id: str = None):
+        self._line("transcript", role=role, item_id=item_id, text=text)
+
+    def event(self, kind: str, **fields):
+        self._line(kind, **fields)
+
+    def _line(self, kind: str, **fields):
+        if self._failed or self._closed:
+            return
+        entry = {"type": kind, "ts": time.time(), "offset_ms": int(1000 * (time.monotonic() - self.started)), **fields}
+        self._lines.append(jsonCodec.dumps(entry) + "\n")
+
+    def _write(self, track: str, pcm: bytes):
+        if self._failed or self._closed:
+            return
+        ring = self._rings[track]
+        if not ring.write(pcm):
+            metrics.CAPTURE_DROPPED_BYTES.inc(len(pcm), label=track)
+        if ring.pending() >= self._flush_bytes:
+            self._flush()
+
+    def _flush(self, final: bool = False):
+        if self._job is not None:
+            self._again = True
+            return
+        spans = {track: (ring.released, ring.written) for track, ring in self._rings.items()}
+        regions = {track: ring.regions(*spans[track]) for track, ring in self._rings.items()}
+        lines, self._lines = self._lines, []
+        self._job = asyncio.get_running_loop().run_in_executor(
+            _get_executor(), self._write_out, regions, lines, final
+        )
+        self._job.add_done_callback(lambda job: self._written(job, spans))
+
+    def _written(self, job, spans: dict):
+        self._job = None
+        if job.cancelled() or job.exception() is not None:
+            if not self._failed:
+                logger.warning("Call capture for %s stopped: %s", self.call_id, job.exception() if not job.cancelled() else "cancelled")
+            self._failed = True
+            return
+        for track, (_, end) in spans.items():
+            self._rings[track].released = end
+        if self._again and not self._closed:
+            self._again = False
+            self._flush()
+
+    def _write_out(self, regions: dict, lines: list, final: bool):
+        # runs on the capture thread pool
+        if self._files is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._files = {}
+            for track in regions:
+                wav = wave.open(os.path.join(self.directory, f"{track}.wav"), "wb")
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(SAMPLE_RATE)
+                self._files[track] = wav
+            self._files["transcript"] = open(os.path.join(self.directory, "transcript.jsonl"), "a")
+        for track, views in regions.items():
+            for view in views:
+                # header sizes are patched once, on close
+                self._files[track].writeframesraw(view)
+        if lines:
+            self._files["transcript"].write("".join(lines))
+            self._files["transcript"].flush()
+        if final:
+            self._close_files()
+
+    def _close_files(self):
+        # runs on the capture thread pool
+        for f in self._files.values():
+            try:
+                f.close()
+            except OSError as e:
+                logger.warning("Failed to close call capture file for %s: %s", self.call_id, e)
+
+    async def close(self):
+        """Writes out what is buffered and closes the files."""
+        if self._closed:
+            return
+        while self._job is not None:
+            await asyncio.wait([self._job])
+        self._closed = True
+        if not self._failed:
+            self._line_final()
+            self._flush(final=True)
+            await asyncio.wait([self._job])
+        if self._failed and self._files is not None:
+            # a failed write skips (or ends) the final flush; the files still get closed
+            await asyncio.get_running_loop().run_in_executor(_get_executor(), self._close_files)
+        for ring in self._rings.values():
+            _release_buffer(ring.close())
+
+    def _line_final(self):
+        dropped = {track: ring.dropped for track, ring in self._rings.items() if ring.dropped}
+        entry = {"type": "end", "ts": time.time(), "offset_ms": int(1000 * (time.monotonic() - self.started))}
+        if dropped:
+            entry["dropped_bytes"] = dropped
+        self._lines.append(jsonCodec.dumps(entry) + "\n")
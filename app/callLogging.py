@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+from app import jsonCodec
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# call connection ids that log at DEBUG regardless of LOG_LEVEL
+CALL_DEBUG_IDS = {i for i in os.getenv("CALL_DEBUG_IDS", "").split(",") if i}
+# more such ids, one per line; every worker re-reads it, so debug can be
+# switched on (or off) for calls already in progress
+CALL_DEBUG_FILE = os.getenv("CALL_DEBUG_FILE", "/tmp/call_debug_ids")
+CALL_DEBUG_RELOAD_S = float(os.getenv("CALL_DEBUG_RELOAD_S", "2"))
+# share of per-frame events a debug-enabled call logs
+CALL_DEBUG_SAMPLE_RATE = float(os.getenv("CALL_DEBUG_SAMPLE_RATE", "0.02"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; runs on the listener thread, never the event loop."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        call_id = getattr(record, "call_id", None)
+        if call_id:
+            entry["call_id"] = call_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return jsonCodec.dumps(entry, default=str)
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that hands the raw record to the listener thread instead
+    of formatting it on the caller's thread, and drops records rather than
+    blocking when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def setup_logging():
+    """Routes the `app` logger hierarchy through a bounded queue drained by a
+    background thread. Called per worker, since threads don't survive fork."""
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+
+    root = logging.getLogger("app")
+    root.handlers = [_LazyQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+    # CallLogger does its own gating so per-call debug can bypass LOG_LEVEL
+    logging.getLogger("app.call").setLevel(logging.DEBUG)
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class DebugIds():
+    """CALL_DEBUG_IDS plus the ids in CALL_DEBUG_FILE. A background task
+    re-reads the file every CALL_DEBUG_RELOAD_S when it changed, off the
+    event loop; lookups only check the cached ids."""
+
+    def __init__(self, path: str = CALL_DEBUG_FILE) -> None:
+        self.path = path
+        self.ids = frozenset(CALL_DEBUG_IDS)
+        self._mtime = None
+        self._watcher = None
+
+    def __contains__(self, call_id: str) -> bool:
+        return call_id in self.ids
+
+    def _read_if_changed(self):
+        """(mtime, ids) if the file changed since the last read, else None."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        except OSError:
+            return None
+        if mtime == self._mtime:
+            return None
+        ids = set(CALL_DEBUG_IDS)
+        if mtime is not None:
+            try:
+                with open(self.path) as f:
+                    ids.update(line.strip() for line in f if line.strip())
+            except OSError:
+                return None
+        return mtime, frozenset(ids)
+
+    async def reload_if_changed(self):
+        loaded = await asyncio.to_thread(self._read_if_changed)
+        if loaded is not None:
+            self._mtime, self.ids = loaded
+
+    def start(self):
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+    async def _watch(self):
+        while True:
+            await self.reload_if_changed()
+            await asyncio.sleep(CALL_DEBUG_RELOAD_S)
+
+
+debug_ids = DebugIds()
+
+
+class CallLogger(logging.LoggerAdapter):
+    """Logger bound to one call. Arguments are only formatted if the record
+    is emitted, `sampled` and `throttled` thin out high-frequency events, and
+    DEBUG is on for just this call if `debug_enabled` or its id is listed in
+    CALL_DEBUG_IDS or CALL_DEBUG_FILE."""
+
+    def __init__(self, call_id: str = None, debug_enabled: bool = False) -> None:
+        super().__init__(logging.getLogger("app.call"), {})
+        self.call_id = call_id
+        self.debug_enabled = debug_enabled
+        self._throttle = {}
+
+    def bind(self, call_id: str):
+        self.call_id = call_id
+
+    def isEnabledFor(self, level: int) -> bool:
+        if level >= logging.getLogger("app").getEffectiveLevel() or self.debug_enabled:
+            return True
+        return self.call_id is not None and self.call_id in debug_ids
+
+    def process(self, msg, kwargs):
+        extra = kwargs.get("extra")
+        kwargs["extra"] = {**extra, "call_id": self.call_id} if extra else {"call_id": self.call_id}
+        return msg, kwargs
+
+    def sampled(self, rate: float, level: int, msg: str, *args):
+        """Logs roughly `rate` (0..1) of the calls, for per-frame events."""
+        if self.isEnabledFor(level) and random.random() < rate:
+            self.log(level, msg, *args)
+
+    def throttled(self, key: str, level: int, msg: str, *args, interval_s: float = 5.0):
+        """Logs at most once per `interval_s` for `key`, reporting how many
+        records were suppressed in between."""
+        if not self.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        last, suppressed = self._throttle.get(key, (0.0, 0))
+        if now - last < interval_s:
+            self._throttle[key] = (last, suppressed + 1)
+            return
+        self._throttle[key] = (now, 0)
+        if suppressed:
+            self.log(level, msg + " (%d similar suppressed)", *args, suppressed)
+        else:
+            self.log(level, msg, *args)
@@ -0,0 +1,448 @@
+import asyncio
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app import jsonCodec
+
+logger = logging.getLogger(__name__)
+
+# memory (single worker / local stand-in), sqlite (shared by the workers of
+# one container) or redis (shared across containers)
+CALL_STORE_BACKEND = os.getenv("CALL_STORE_BACKEND", "sqlite")
+CALL_STORE_PATH = os.getenv("CALL_STORE_PATH", "/tmp/call_sessions.db")
+CALL_STORE_REDIS_URL = os.getenv("CALL_STORE_REDIS_URL", "redis://localhost:6379/0")
+# sessions that never saw CallDisconnected are forgotten after this long
+CALL_STORE_TTL_S = int(os.getenv("CALL_STORE_TTL_S", "14400"))
+# EventGrid redelivers until it sees a 2xx, possibly to another worker;
+# an incomingCallContext is only answerable for a few minutes anyway
+EVENT_DEDUP_TTL_S = int(os.getenv("EVENT_DEDUP_TTL_S", "900"))
+
+# a call's lifecycle; update() never moves a session back to an earlier state
+STATES = ("answered", "connected", "streaming")
+
+
+def _earlier_states(state: str) -> tuple:
+    return STATES[:STATES.index(state)] if state in STATES else ()
+
+
+class CallSession():
+    def __init__(
+        self,
+        call_connection_id: str,
+        correlation_id: str = None,
+        caller_id: str = None,
+        context_id: str = None,
+        state: str = "answered",
+        profile: str = None,
+        worker_pid: int = None,
+        updated: float = None,
+    ) -> None:
+        self.call_connection_id = call_connection_id
+        self.correlation_id = correlation_id
+        self.caller_id = caller_id
+        self.context_id = context_id
+        self.state = state
+        self.profile = profile
+        self.worker_pid = worker_pid
+        self.updated = updated or time.time()
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CallSession":
+        return cls(**data)
+
+    def merge(self, fields: dict):
+        """Applies an update() to this session."""
+        for name, value in fields.items():
+            if name == "state" and self.state not in _earlier_states(value):
+                continue
+            setattr(self, name, value)
+
+
+# the stored fields, in column order
+FIELDS = tuple(CallSession("").to_dict())
+
+
+class InMemoryCallStore():
+    """Per-process store; also the local stand-in for Redis in development."""
+
+    def __init__(self) -> None:
+        self._sessions = {}
+        self._by_correlation = {}
+        self._events = {}
+        self._slots = {}
+
+    async def put(self, session: CallSession):
+        session.updated = time.time()
+        self._sessions[session.call_connection_id] = session
+        if session.correlation_id:
+            self._by_correlation[session.correlation_id] = session.call_connection_id
+
+    async def update(self, call_connection_id: str, **fields):
+        session = self._sessions.get(call_connection_id)
+        if session is None:
+            session = self._sessions[call_connection_id] = CallSession(call_connection_id, **fields)
+        else:
+            session.merge(fields)
+        session.updated = time.time()
+        if session.correlation_id:
+            self._by_correlation[session.correlation_id] = call_connection_id
+
+    async def get(self, call_connection_id: str):
+        return self._sessions.get(call_connection_id)
+
+    async def get_by_correlation(self, correlation_id: str):
+        call_connection_id = self._by_correlation.get(correlation_id)
+        return self._sessions.get(call_connection_id) if call_connection_id else None
+
+    async def delete(self, call_connection_id: str):
+        session = self._sessions.pop(call_connection_id, None)
+        if session is not None and session.correlation_id:
+            self._by_correlation.pop(session.correlation_id, None)
+
+    async def active(self) -> list:
+        cutoff = time.time() - CALL_STORE_TTL_S
+        return [s for s in self._sessions.values() if s.updated >= cutoff]
+
+    async def claim_event(self, event_id: str) -> bool:
+        now = time.time()
+        if len(self._events) > 1024:
+            self._events = {k: v for k, v in self._events.items() if v > now}
+        if self._events.get(event_id, 0) > now:
+            return False
+        self._events[event_id] = now + EVENT_DEDUP_TTL_S
+        return True
+
+    async def reserve_slot(self, key: str, limit: int, hold_s: float) -> bool:
+        now = time.time()
+        self._slots = {k: expires for k, expires in self._slots.items() if expires >= now}
+        if len(self._slots) >= limit:
+            return False
+        self._slots.setdefault(key, now + hold_s)
+        return True
+
+    async def move_slot(self, key: str, new_key: str, hold_s: float):
+        if self._slots.pop(key, None) is not None:
+            self._slots[new_key] = time.time() + hold_s
+
+    async def hold_slots(self, keys: list, hold_s: float):
+        expires = time.time() + hold_s
+        for key in keys:
+            if key in self._slots:
+                self._slots[key] = expires
+
+    async def release_slot(self, key: str):
+        self._slots.pop(key, None)
+
+
+class SqliteCallStore():
+    """Store shared by all gunicorn workers on one host through a WAL-mode
+    SQLite file. Lookups go through the primary key or an index; each field
+    has its own column so update() only writes the fields it is given.
+    Queries run on the default thread pool, one at a time, since they share
+    the worker's connection."""
+
+    def __init__(self, path: str = CALL_STORE_PATH) -> None:
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        # connections must not cross gunicorn's fork
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS calls (call_connection_id TEXT PRIMARY KEY, correlation_id TEXT, "
+                "caller_id TEXT, context_id TEXT, state TEXT, profile TEXT, worker_pid INTEGER, updated REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS calls_correlation ON calls (correlation_id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS seen_events (event_id TEXT PRIMARY KEY, expires REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS slots (key TEXT PRIMARY KEY, expires REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS slots_expires ON slots (expires)")
+            # the number of rows in slots, kept with them in each transaction
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO counters VALUES ('slots', 0)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _put(self, session: CallSession):
+        session.updated = time.time()
+        self._db().execute(
+            f"INSERT OR REPLACE INTO calls ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+            tuple(getattr(session, name) for name in FIELDS),
+        )
+
+    def _update(self, call_connection_id: str, fields: dict):
+        # the row as inserted if the call is new; otherwise only `fields` change
+        session = CallSession(call_connection_id, **fields)
+        assignments = [f"{name} = excluded.{name}" for name in fields if name != "state"]
+        params = [getattr(session, name) for name in FIELDS]
+        earlier = _earlier_states(fields.get("state"))
+        if earlier:
+            assignments.append(
+                f"state = CASE WHEN state IN ({', '.join('?' * len(earlier))}) THEN excluded.state ELSE state END"
+            )
+            params.extend(earlier)
+        assignments.append("updated = excluded.updated")
+        self._db().execute(
+            f"INSERT INTO calls ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))}) "
+            f"ON CONFLICT (call_connection_id) DO UPDATE SET {', '.join(assignments)}",
+            params,
+        )
+
+    def _get(self, column: str, value: str):
+        row = self._db().execute(f"SELECT {', '.join(FIELDS)} FROM calls WHERE {column} = ?", (value,)).fetchone()
+        return CallSession(*row) if row else None
+
+    def _delete(self, call_connection_id: str):
+        self._db().execute("DELETE FROM calls WHERE call_connection_id = ?", (call_connection_id,))
+
+    def _active(self) -> list:
+        db = self._db()
+        cutoff = time.time() - CALL_STORE_TTL_S
+        db.execute("DELETE FROM calls WHERE updated < ?", (cutoff,))
+        return [CallSession(*row) for row in db.execute(f"SELECT {', '.join(FIELDS)} FROM calls")]
+
+    def _claim_event(self, event_id: str) -> bool:
+        db = self._db()
+        now = time.time()
+        db.execute("DELETE FROM seen_events WHERE expires < ?", (now,))
+        # the primary key makes the first worker to insert the winner
+        cursor = db.execute("INSERT OR IGNORE INTO seen_events VALUES (?, ?)", (event_id, now + EVENT_DEDUP_TTL_S))
+        return cursor.rowcount == 1
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so no other worker
+        # can count the slots between our count and our insert
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    @staticmethod
+    def _count_slots(db, change: int) -> int:
+        db.execute("UPDATE counters SET value = value + ? WHERE name = 'slots'", (change,))
+        return db.execute("SELECT value FROM counters WHERE name = 'slots'").fetchone()[0]
+
+    def _reserve_slot(self, key: str, limit: int, hold_s: float) -> bool:
+        now = time.time()
+        with self._transaction() as db:
+            expired = db.execute("DELETE FROM slots WHERE expires < ?", (now,)).rowcount
+            if self._count_slots(db, -expired) >= limit:
+                return False
+            added = db.execute("INSERT OR IGNORE INTO slots VALUES (?, ?)", (key, now + hold_s)).rowcount
+            self._count_slots(db, added)
+        return True
+
+    def _move_slot(self, key: str, new_key: str, hold_s: float):
+        self._db().execute("UPDATE slots SET key = ?, expires = ? WHERE key = ?", (new_key, time.time() + hold_s, key))
+
+    def _hold_slots(self, keys: list, hold_s: float):
+        self._db().execute(
+            f"UPDATE slots SET expires = ? WHERE key IN ({', '.join('?' * len(keys))})", (time.time() + hold_s, *keys)
+        )
+
+    def _release_slot(self, key: str):
+        with self._transaction() as db:
+            self._count_slots(db, -db.execute("DELETE FROM slots WHERE key = ?", (key,)).rowcount)
+
+    async def _in_thread(self, fn, *args):
+        return await asyncio.to_thread(self._locked, fn, *args)
+
+    def _locked(self, fn, *args):
+        with self._lock:
+            return fn(*args)
+
+    async def put(self, session: CallSession):
+        await self._in_thread(self._put, session)
+
+    async def update(self, call_connection_id: str, **fields):
+        """Sets `fields` on the call's session, creating it if needed, in one
+        statement, so workers updating the same call don't undo each other."""
+        await self._in_thread(self._update, call_connection_id, fields)
+
+    async def get(self, call_connection_id: str):
+        return await self._in_thread(self._get, "call_connection_id", call_connection_id)
+
+    async def get_by_correlation(self, correlation_id: str):
+        return await self._in_thread(self._get, "correlation_id", correlation_id)
+
+    async def delete(self, call_connection_id: str):
+        await self._in_thread(self._delete, call_connection_id)
+
+    async def active(self) -> list:
+        return await self._in_thread(self._active)
+
+    async def claim_event(self, event_id: str) -> bool:
+        """True the first time an event id is seen by any worker."""
+        return await self._in_thread(self._claim_event, event_id)
+
+    async def reserve_slot(self, key: str, limit: int, hold_s: float) -> bool:
+        """Takes one of `limit` slots shared by every worker for `key`, for
+        `hold_s` unless held longer; False if they are all taken."""
+        return await self._in_thread(self._reserve_slot, key, limit, hold_s)
+
+    async def move_slot(self, key: str, new_key: str, hold_s: float):
+        """Hands the slot of `key`, if it still has one, to `new_key`."""
+        await self._in_thread(self._move_slot, key, new_key, hold_s)
+
+    async def hold_slots(self, keys: list, hold_s: float):
+        """Keeps the slots of `keys` another `hold_s`; expired ones stay free."""
+        if keys:
+            await self._in_thread(self._hold_slots, keys, hold_s)
+
+    async def release_slot(self, key: str):
+        await self._in_thread(self._release_slot, key)
+
+
+# KEYS: slots sorted set. ARGV: now, limit, key, expiry.
+_RESERVE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+  return 0
+end
+redis.call('ZADD', KEYS[1], 'NX', ARGV[4], ARGV[3])
+return 1
+"""
+
+# KEYS: slots sorted set. ARGV: key, new key, expiry.
+_MOVE_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+  redis.call('ZADD', KEYS[1], ARGV[3], ARGV[2])
+end
+"""
+
+# KEYS: call hash. ARGV: ttl, state ('' for none), the states it may replace
+# as ",a,b,", then field/value pairs. A new hash also gets the insert defaults.
+_UPDATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  redis.call('HSET', KEYS[1], 'state', '"answered"')
+end
+if ARGV[2] ~= '' then
+  local current = redis.call('HGET', KEYS[1], 'state')
+  if string.find(ARGV[3], ',' .. current .. ',', 1, true) then
+    redis.call('HSET', KEYS[1], 'state', ARGV[2])
+  end
+end
+if #ARGV > 3 then
+  redis.call('HSET', KEYS[1], unpack(ARGV, 4))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+"""
+
+
+class RedisCallStore():
+    """One hash per call, fields JSON-encoded, so update() writes only the
+    fields it is given."""
+
+    def __init__(self, url: str = CALL_STORE_REDIS_URL) -> None:
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url, decode_responses=True)
+        self._update_script = self._redis.register_script(_UPDATE_SCRIPT)
+        self._reserve_script = self._redis.register_script(_RESERVE_SCRIPT)
+        self._move_script = self._redis.register_script(_MOVE_SCRIPT)
+
+    async def put(self, session: CallSession):
+        session.updated = time.time()
+        key = f"call:{session.call_connection_id}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping={name: jsonCodec.dumps(value) for name, value in session.to_dict().items()})
+            pipe.expire(key, CALL_STORE_TTL_S)
+            pipe.sadd("calls", session.call_connection_id)
+            if session.correlation_id:
+                pipe.set(f"corr:{session.correlation_id}", session.call_connection_id, ex=CALL_STORE_TTL_S)
+            await pipe.execute()
+
+    async def update(self, call_connection_id: str, **fields):
+        """Sets `fields` on the call's session, creating it if needed, in one
+        script, so workers updating the same call don't undo each other."""
+        state = fields.pop("state", None)
+        earlier = _earlier_states(state)
+        fields = {"call_connection_id": call_connection_id, **fields, "updated": time.time()}
+        replaces = "," + ",".join(jsonCodec.dumps(earlier_state) for earlier_state in earlier) + ","
+        args = [CALL_STORE_TTL_S, jsonCodec.dumps(state) if earlier else "", replaces]
+        for name, value in fields.items():
+            args += [name, jsonCodec.dumps(value)]
+        await self._update_script(keys=[f"call:{call_connection_id}"], args=args)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.sadd("calls", call_connection_id)
+            if fields.get("correlation_id"):
+                pipe.set(f"corr:{fields['correlation_id']}", call_connection_id, ex=CALL_STORE_TTL_S)
+            await pipe.execute()
+
+    async def get(self, call_connection_id: str):
+        data = await self._redis.hgetall(f"call:{call_connection_id}")
+        if not data:
+            return None
+        return CallSession.from_dict({name: jsonCodec.loads(value) for name, value in data.items() if name in FIELDS})
+
+    async def get_by_correlation(self, correlation_id: str):
+        call_connection_id = await self._redis.get(f"corr:{correlation_id}")
+        return await self.get(call_connection_id) if call_connection_id else None
+
+    async def delete(self, call_connection_id: str):
+        session = await self.get(call_connection_id)
+        keys = [f"call:{call_connection_id}"]
+        if session is not None and session.correlation_id:
+            keys.append(f"corr:{session.correlation_id}")
+        await self._redis.delete(*keys)
+        await self._redis.srem("calls", call_connection_id)
+
+    async def active(self) -> list:
+        sessions = []
+        for call_connection_id in await self._redis.smembers("calls"):
+            session = await self.get(call_connection_id)
+            if session is None:
+                await self._redis.srem("calls", call_connection_id)
+            else:
+                sessions.append(session)
+        return sessions
+
+    async def claim_event(self, event_id: str) -> bool:
+        return bool(await self._redis.set(f"event:{event_id}", 1, nx=True, ex=EVENT_DEDUP_TTL_S))
+
+    async def reserve_slot(self, key: str, limit: int, hold_s: float) -> bool:
+        now = time.time()
+        return bool(await self._reserve_script(keys=["slots"], args=[now, limit, key, now + hold_s]))
+
+    async def move_slot(self, key: str, new_key: str, hold_s: float):
+        await self._move_script(keys=["slots"], args=[key, new_key, time.time() + hold_s])
+
+    async def hold_slots(self, keys: list, hold_s: float):
+        if keys:
+            expires = time.time() + hold_s
+            await self._redis.zadd("slots", {key: expires for key in keys}, xx=True)
+
+    async def release_slot(self, key: str):
+        await self._redis.zrem("slots", key)
+
+
+def create_call_store(backend: str = CALL_STORE_BACKEND):
+    if backend == "memory":
+        return InMemoryCallStore()
+    if backend == "redis":
+        try:
+            return RedisCallStore()
+        except ImportError:
+            logger.warning("redis package not installed, falling back to the sqlite call store")
+    return SqliteCallStore()
+
+
+call_store = create_call_store()
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import os
+
+import httpx
+from openai import AsyncAzureOpenAI
+
+AZURE_OPENAI_API_ENDPOINT = os.getenv("AZURE_OPENAI_API_ENDPOINT")
+AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
+AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
+AZURE_OPENAI_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
+# overrides the realtime endpoint, e.g. the load-test mock server
+AZURE_OPENAI_WEBSOCKET_BASE_URL = os.getenv("AZURE_OPENAI_WEBSOCKET_BASE_URL")
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_S = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_S", "30"))
+HTTP_CONNECT_TIMEOUT_S = float(os.getenv("HTTP_CONNECT_TIMEOUT_S", "3"))
+HTTP_TIMEOUT_S = float(os.getenv("HTTP_TIMEOUT_S", "10"))
+
+# Created per worker in the FastAPI lifespan, never before gunicorn forks,
+# since both clients are bound to the worker's event loop.
+_http_client = None
+_openai_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_S,
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT_S, connect=HTTP_CONNECT_TIMEOUT_S),
+        )
+    return _http_client
+
+
+def get_openai_client() -> AsyncAzureOpenAI:
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = AsyncAzureOpenAI(
+            azure_endpoint=AZURE_OPENAI_API_ENDPOINT,
+            azure_deployment=AZURE_OPENAI_DEPLOYMENT_NAME,
+            api_key=AZURE_OPENAI_API_KEY,
+            api_version=AZURE_OPENAI_API_VERSION,
+            websocket_base_url=AZURE_OPENAI_WEBSOCKET_BASE_URL,
+        )
+    return _openai_client
+
+
+def _websocket(connection):
+    """The websocket under an openai realtime connection, which the SDK
+    keeps private: it has no ping and no way to send an event that is
+    already serialized. None if this SDK release keeps it elsewhere."""
+    websocket = getattr(connection, "_connection", None)
+    if callable(getattr(websocket, "ping", None)) and callable(getattr(websocket, "send", None)):
+        return websocket
+    return None
+
+
+async def send_realtime_event(connection, event: str):
+    """Sends a client event serialized ahead of time, as is."""
+    websocket = _websocket(connection)
+    if websocket is None:
+        await connection.send(json.loads(event))
+    else:
+        await websocket.send(event)
+
+
+async def ping_realtime(connection, timeout_s: float):
+    """Raises unless the realtime session answers within `timeout_s`. A
+    websocket ping queues no realtime events; without one, a harmless
+    event at least proves the socket still takes writes."""
+    websocket = _websocket(connection)
+    if websocket is None:
+        await asyncio.wait_for(connection.send({"type": "input_audio_buffer.clear"}), timeout_s)
+        return
+    pong = await websocket.ping()
+    await asyncio.wait_for(pong, timeout_s)
+
+
+def start_clients():
+    get_http_client()
+    get_openai_client()
+
+
+async def close_clients():
+    global _http_client, _openai_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
@@ -0,0 +1,55 @@
+import base64
+import logging
+import os
+import wave
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# PCM24K mono 16-bit clip ("one moment please"), WAV or raw PCM; unset disables fillers
+FILLER_AUDIO_PATH = os.getenv("FILLER_AUDIO_PATH")
+# played while a dropped realtime session reconnects; falls back to the filler
+HOLD_AUDIO_PATH = os.getenv("HOLD_AUDIO_PATH")
+# play the filler once a tool has been running this long
+FILLER_DELAY_MS = int(os.getenv("FILLER_DELAY_MS", "700"))
+FILLER_CHUNK_MS = 100
+SAMPLE_RATE = 24000
+
+
+@lru_cache(maxsize=8)
+def load_clip(path: str) -> tuple:
+    """Loads a clip once per worker and returns it as base64 chunks ready
+    for the ACS outbound queue."""
+    if path.lower().endswith(".wav"):
+        with wave.open(path, "rb") as wav:
+            if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) != (SAMPLE_RATE, 1, 2):
+                raise ValueError(f"{path}: expected 24 kHz mono 16-bit PCM")
+            pcm = wav.readframes(wav.getnframes())
+    else:
+        with open(path, "rb") as f:
+            pcm = f.read()
+    chunk = SAMPLE_RATE * 2 * FILLER_CHUNK_MS // 1000
+    return tuple(
+        base64.b64encode(pcm[i:i + chunk]).decode("ascii")
+        for i in range(0, len(pcm), chunk)
+    )
+
+
+def filler_clip() -> tuple:
+    if not FILLER_AUDIO_PATH:
+        return ()
+    try:
+        return load_clip(FILLER_AUDIO_PATH)
+    except Exception as e:
+        logger.error("Failed to load filler audio %s: %s", FILLER_AUDIO_PATH, e)
+        return ()
+
+
+def hold_clip() -> tuple:
+    if not HOLD_AUDIO_PATH:
+        return filler_clip()
+    try:
+        return load_clip(HOLD_AUDIO_PATH)
+    except Exception as e:
+        logger.error("Failed to load hold audio %s: %s", HOLD_AUDIO_PATH, e)
+        return filler_clip()
@@ -0,0 +1,30 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# "orjson" (default when installed) or "json" to compare against the stdlib
+JSON_CODEC = os.getenv("JSON_CODEC", "orjson")
+
+orjson = None
+if JSON_CODEC == "orjson":
+    try:
+        import orjson
+    except ImportError:
+        logger.warning("orjson package not installed, falling back to the json module")
+
+
+def loads(data):
+    """Parses a str or bytes document."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj, default=None) -> str:
+    """Compact JSON text. Unlike json.dumps there are no spaces after
+    separators, so don't use it where the exact bytes are relied on."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default).decode()
+    return json.dumps(obj, default=default, separators=(",", ":"))
@@ -1,6 +1,9 @@
+import asyncio
+import functools
 import logging
 import uuid
 import os
+from contextlib import asynccontextmanager
 from urllib.parse import urlencode, urlparse, urlunparse
 from dotenv import load_dotenv
 
@@ -9,27 +12,112 @@ load_dotenv()
 from fastapi import FastAPI, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, PlainTextResponse, Response
-from fastapi.websockets import WebSocketDisconnect
-from azure.eventgrid import EventGridEvent, SystemEventNames
 from azure.communication.callautomation import (
     MediaStreamingOptions,
     AudioFormat,
     MediaStreamingContentType,
     MediaStreamingAudioChannelType,
     StreamingTransportType,
+    CallRejectReason,
+    CommunicationUserIdentifier,
+    PhoneNumberIdentifier,
 )
 from azure.communication.callautomation.aio import CallAutomationClient
 
-from app.azureOpenAIService import OpenAIRTHandler
+from app.admission import OVERFLOW_REDIRECT_TARGET, admission
+from app.azureOpenAIService import OpenAIRTHandler, realtime_pools
+from app.callLogging import debug_ids, setup_logging, stop_logging
+from app.callRegistry import call_store
+from app import jsonCodec
+from app.clients import close_clients, start_clients
+from app.fillerAudio import filler_clip, hold_clip
+from app.metrics import ACTIVE_CALLS, render, start_metrics_writer, stop_metrics_writer
+from app.realtimePool import REALTIME_POOL_SIZE
+from app.sessionProfiles import session_profiles
 
 ACS_CONNECTION_STRING = os.getenv("ACS_CONNECTION_STRING")
 CALLBACK_URI_HOST = os.getenv("CALLBACK_URI_HOST")  
 CALLBACK_EVENTS_URI = CALLBACK_URI_HOST + "/api/callbacks"
+# answer_call requests a worker has in flight at once during a burst
+ANSWER_CONCURRENCY = int(os.getenv("ANSWER_CONCURRENCY", "8"))
+SUBSCRIPTION_VALIDATION_EVENT = "Microsoft.EventGrid.SubscriptionValidationEvent"
+# WebSocket close code for a media session refused while over capacity
+TRY_AGAIN_LATER = 1013
 
-logger = logging.getLogger("uvicorn.error")
+logger = logging.getLogger("app.main")
 
 acs_client = CallAutomationClient.from_connection_string(ACS_CONNECTION_STRING)
-app = FastAPI()
+
+
+
+@functools.lru_cache(maxsize=None)
+def media_streaming_options(profile_name: str) -> MediaStreamingOptions:
+    # the profile rides on the media URL so /ws needs no store lookup
+    query = urlencode({"profile": profile_name})
+    return MediaStreamingOptions(
+        transport_url=urlunparse(("wss", urlparse(CALLBACK_EVENTS_URI).netloc, "/ws", "", query, "")),
+        transport_type=StreamingTransportType.WEBSOCKET,
+        content_type=MediaStreamingContentType.AUDIO,
+        audio_channel_type=MediaStreamingAudioChannelType.MIXED,
+        start_media_streaming=True,
+        enable_bidirectional=True,
+        audio_format=AudioFormat.PCM24_K_MONO,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def overflow_target():
+    if OVERFLOW_REDIRECT_TARGET.startswith("+"):
+        return PhoneNumberIdentifier(OVERFLOW_REDIRECT_TARGET)
+    return CommunicationUserIdentifier(OVERFLOW_REDIRECT_TARGET)
+
+
+_answer_slots = asyncio.Semaphore(ANSWER_CONCURRENCY)
+# webhook work that outlives its request; referenced so it can't be collected
+_background_tasks = set()
+
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(_log_failure)
+    return task
+
+
+def _log_failure(task: asyncio.Task):
+    # nothing awaits these tasks, so an error would otherwise go unseen
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task %s failed", task.get_coro().__qualname__, exc_info=task.exception())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # runs per worker after fork; shutdown also runs when gunicorn recycles
+    # a worker after max_requests
+    setup_logging()
+    debug_ids.start()
+    start_clients()
+    start_metrics_writer()
+    admission.start()
+    session_profiles.start()
+    filler_clip()
+    hold_clip()
+    realtime_pools.get(session_profiles.default, size=REALTIME_POOL_SIZE)
+    yield
+    if _background_tasks:
+        await asyncio.wait(_background_tasks, timeout=10)
+    await realtime_pools.close()
+    await admission.stop()
+    await session_profiles.stop()
+    await close_clients()
+    await stop_metrics_writer()
+    await debug_ids.stop()
+    stop_logging()
+    await acs_client.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -40,67 +128,109 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-active_call_connection_id = None
-
 @app.post("/api/incomingCall")
 async def incoming_call_handler(request: Request) -> Response:
-    logger.info("incoming event data")
-    events = await request.json()
+    events = jsonCodec.loads(await request.body())
     if isinstance(events, dict):
         events = [events]
 
-    for event_dict in events:
-        event = EventGridEvent.from_dict(event_dict)
-        logger.info("incoming event data --> %s", event.data)
-        if event.event_type == SystemEventNames.EventGridSubscriptionValidationEventName:
+    for event in events:
+        event_type = event.get("eventType")
+        if event_type == SUBSCRIPTION_VALIDATION_EVENT:
             logger.info("Validating subscription")
-            validation_code = event.data["validationCode"]
-            validation_response = {"validationResponse": validation_code}
+            validation_response = {"validationResponse": event["data"]["validationCode"]}
             return JSONResponse(content=validation_response, status_code=200)
-        elif event.event_type == "Microsoft.Communication.IncomingCall":
-            logger.info("Incoming call received: data=%s", event.data)
-            if event.data["from"]["kind"] == "phoneNumber":
-                caller_id = event.data["from"]["phoneNumber"]["value"]
-            else:
-                caller_id = event.data["from"]["rawId"]
-            logger.info("incoming call handler caller id: %s", caller_id)
-            incoming_call_context = event.data["incomingCallContext"]
-            guid = uuid.uuid4()
-            query_parameters = urlencode({"callerId": caller_id})
-            callback_uri = f"{CALLBACK_EVENTS_URI}/{guid}?{query_parameters}"
-
-            parsed_url = urlparse(CALLBACK_EVENTS_URI)
-            websocket_url = urlunparse(("wss", parsed_url.netloc, "/ws", "", "", ""))
-
-            logger.info("callback url: %s", callback_uri)
-            logger.info("websocket url: %s", websocket_url)
-
-            media_streaming_options = MediaStreamingOptions(
-                transport_url=websocket_url,
-                transport_type=StreamingTransportType.WEBSOCKET,
-                content_type=MediaStreamingContentType.AUDIO,
-                audio_channel_type=MediaStreamingAudioChannelType.MIXED,
-                start_media_streaming=True,
-                enable_bidirectional=True,
-                audio_format=AudioFormat.PCM24_K_MONO,
-            )
+        elif event_type == "Microsoft.Communication.IncomingCall":
+            # acknowledge right away; EventGrid and the caller's ring time
+            # shouldn't wait on answer_call
+            _spawn(answer_incoming_call(event))
+    return Response(status_code=200)
+
+
+async def answer_incoming_call(event: dict):
+    event_data = event["data"]
+    if not await call_store.claim_event(event["id"]):
+        logger.info("Ignoring redelivered IncomingCall event %s", event["id"])
+        return
+    logger.info("Incoming call received: data=%s", event_data)
+    if event_data["from"]["kind"] == "phoneNumber":
+        caller_id = event_data["from"]["phoneNumber"]["value"]
+    else:
+        caller_id = event_data["from"]["rawId"]
+    logger.info("incoming call handler caller id: %s", caller_id)
+    reason = await admission.admit_call(event["id"])
+    if reason is not None:
+        await turn_away_call(event_data["incomingCallContext"], caller_id, reason)
+        return
+    called = event_data["to"].get("phoneNumber", {}).get("value") or event_data["to"]["rawId"]
+    profile = session_profiles.select(called, caller_id)
+    guid = uuid.uuid4()
+    query_parameters = urlencode({"callerId": caller_id})
+    callback_uri = f"{CALLBACK_EVENTS_URI}/{guid}?{query_parameters}"
+    logger.info("callback url: %s", callback_uri)
 
+    async with _answer_slots:
+        try:
             answer_call_result = await acs_client.answer_call(
-                incoming_call_context=incoming_call_context,
+                incoming_call_context=event_data["incomingCallContext"],
                 operation_context="incomingCall",
                 callback_url=callback_uri,
-                media_streaming=media_streaming_options,
-            )
-            logger.info(
-                "Answered call for connection id: %s", answer_call_result.call_connection_id
+                media_streaming=media_streaming_options(profile.name),
             )
-    return Response(status_code=200)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Failed to answer call from %s: %s", caller_id, e)
+            await admission.release_event(event["id"])
+            return
+    logger.info(
+        "Answered call for connection id: %s with profile %s", answer_call_result.call_connection_id, profile.name
+    )
+    # CallConnected and /ws (often on other workers) may have written the
+    # call already; only the fields known here are set
+    await call_store.update(
+        answer_call_result.call_connection_id,
+        caller_id=caller_id,
+        context_id=str(guid),
+        profile=profile.name,
+    )
+    # the answered call holds the slot from here
+    await admission.answered(event["id"], answer_call_result.call_connection_id)
+
+
+async def turn_away_call(incoming_call_context: str, caller_id: str, reason: str):
+    """Sends a call this worker has no room for to the overflow route, or
+    rejects it as busy so the caller isn't left ringing."""
+    try:
+        if OVERFLOW_REDIRECT_TARGET:
+            await acs_client.redirect_call(incoming_call_context, overflow_target())
+            logger.warning("Over capacity (%s), redirected call from %s", reason, caller_id)
+        else:
+            await acs_client.reject_call(incoming_call_context, call_reject_reason=CallRejectReason.BUSY)
+            logger.warning("Over capacity (%s), rejected call from %s", reason, caller_id)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error("Failed to turn away call from %s: %s", caller_id, e)
+
+
+async def hang_up_call(call_connection_id: str):
+    try:
+        await acs_client.get_call_connection(call_connection_id).hang_up(is_for_everyone=True)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.warning("Could not hang up call %s: %s", call_connection_id, e)
+
+
+async def log_media_streaming_subscription(call_connection_id: str):
+    try:
+        call_connection_properties = (
+            await acs_client.get_call_connection(call_connection_id).get_call_properties()
+        )
+    except Exception as e:  # pylint: disable=broad-except
+        logger.warning("Could not fetch call properties for %s: %s", call_connection_id, e)
+        return
+    logger.info("MediaStreamingSubscription:--> %s", call_connection_properties.media_streaming_subscription)
 
 
 @app.post("/api/callbacks/{contextId}")
 async def callbacks(contextId: str, request: Request) -> Response:  # noqa: N803
-    global active_call_connection_id
-    events = await request.json()
+    events = jsonCodec.loads(await request.body())
     if isinstance(events, dict):
         events = [events]
 
@@ -109,70 +239,88 @@ async def callbacks(contextId: str, request: Request) -> Response:  # noqa: N803
         event_data = event["data"]
         call_connection_id = event_data["callConnectionId"]
         logger.info(
-            f"Received Event:-> {event['type']}, Correlation Id:-> {event_data['correlationId']}, CallConnectionId:-> {call_connection_id}"
+            "Received Event:-> %s, Correlation Id:-> %s, CallConnectionId:-> %s",
+            event["type"], event_data["correlationId"], call_connection_id,
         )
         if event["type"] == "Microsoft.Communication.CallConnected":
-            active_call_connection_id = call_connection_id
-            call_connection_properties = (
-                await acs_client.get_call_connection(call_connection_id).get_call_properties()
-            )
-            media_streaming_subscription = call_connection_properties.media_streaming_subscription
-            logger.info(
-                f"MediaStreamingSubscription:--> {media_streaming_subscription}"
-            )
-            logger.info(
-                f"Received CallConnected event for connection id: {call_connection_id}"
+            # media can open before this callback arrives; update() keeps "streaming"
+            await call_store.update(
+                call_connection_id, correlation_id=event_data["correlationId"], context_id=contextId, state="connected"
             )
+            # diagnostics only, so keep the ACS round trip off the response
+            if logger.isEnabledFor(logging.INFO):
+                _spawn(log_media_streaming_subscription(call_connection_id))
+            logger.info("Received CallConnected event for connection id: %s", call_connection_id)
             logger.info("CORRELATION ID:--> %s", event_data["correlationId"])
             logger.info("CALL CONNECTION ID:--> %s", event_data["callConnectionId"])
         elif event["type"] == "Microsoft.Communication.MediaStreamingStarted":
-            logger.info(
-                f"Media streaming content type:--> {event_data['mediaStreamingUpdate']['contentType']}"
-            )
-            logger.info(
-                f"Media streaming status:--> {event_data['mediaStreamingUpdate']['mediaStreamingStatus']}"
-            )
-            logger.info(
-                f"Media streaming status details:--> {event_data['mediaStreamingUpdate']['mediaStreamingStatusDetails']}"
-            )
+            logger.info("Media streaming content type:--> %s", event_data["mediaStreamingUpdate"]["contentType"])
+            logger.info("Media streaming status:--> %s", event_data["mediaStreamingUpdate"]["mediaStreamingStatus"])
+            logger.info("Media streaming status details:--> %s", event_data["mediaStreamingUpdate"]["mediaStreamingStatusDetails"])
         elif event["type"] == "Microsoft.Communication.MediaStreamingStopped":
-            logger.info(
-                f"Media streaming content type:--> {event_data['mediaStreamingUpdate']['contentType']}"
-            )
-            logger.info(
-                f"Media streaming status:--> {event_data['mediaStreamingUpdate']['mediaStreamingStatus']}"
-            )
-            logger.info(
-                f"Media streaming status details:--> {event_data['mediaStreamingUpdate']['mediaStreamingStatusDetails']}"
-            )
+            logger.info("Media streaming content type:--> %s", event_data["mediaStreamingUpdate"]["contentType"])
+            logger.info("Media streaming status:--> %s", event_data["mediaStreamingUpdate"]["mediaStreamingStatus"])
+            logger.info("Media streaming status details:--> %s", event_data["mediaStreamingUpdate"]["mediaStreamingStatusDetails"])
         elif event["type"] == "Microsoft.Communication.MediaStreamingFailed":
+            result_information = event_data["resultInformation"]
             logger.info(
-                f"Code:->{event_data['resultInformation']['code']}, Subcode:-> {event_data['resultInformation']['subCode']}"
+                "Code:->%s, Subcode:-> %s", result_information["code"], result_information["subCode"]
             )
-            logger.info(f"Message:->{event_data['resultInformation']['message']}")
+            logger.info("Message:->%s", result_information["message"])
         elif event["type"] == "Microsoft.Communication.CallDisconnected":
-            active_call_connection_id = None
-            logger.info("Call disconnected, clearing active call connection ID")
+            await call_store.delete(call_connection_id)
+            await admission.release(call_connection_id)
+            logger.info("Call disconnected, removed call session %s", call_connection_id)
     return Response(status_code=200)
 
 
+async def register_media_session(call_connection_id: str, correlation_id: str):
+    """Records which worker carries the call's media stream."""
+    if not call_connection_id and correlation_id:
+        session = await call_store.get_by_correlation(correlation_id)
+        call_connection_id = session.call_connection_id if session is not None else None
+    if not call_connection_id:
+        return
+    fields = {"state": "streaming", "worker_pid": os.getpid()}
+    if correlation_id:
+        fields["correlation_id"] = correlation_id
+    await call_store.update(call_connection_id, **fields)
+
+
 @app.websocket("/ws")
 async def ws(websocket: WebSocket) -> None:
     await websocket.accept()
-    handler = OpenAIRTHandler()
-    print("Client connected to WebSocket")
-    await handler.init_incoming_websocket(websocket)
-    await handler.start_client()
-    while True:
-        try:
-            data = await websocket.receive_text()
-            await handler.acs_to_oai(data)
-            await handler.send_welcome()
-        except WebSocketDisconnect:
-            break
-        except Exception as e:  # pylint: disable=broad-except
-            print(f"WebSocket connection closed: {e}")
-            break
+    logger.info("Client connected to WebSocket")
+    # ACS identifies the call the media stream belongs to in the upgrade headers
+    call_connection_id = websocket.headers.get("x-ms-call-connection-id")
+    reason = admission.admit_session()
+    if reason is not None:
+        logger.warning("Over capacity (%s), refusing media session for call %s", reason, call_connection_id)
+        await websocket.close(code=TRY_AGAIN_LATER)
+        # without media the call would sit in silence
+        if call_connection_id:
+            _spawn(hang_up_call(call_connection_id))
+        return
+    # counted until the handler has released everything, so a draining
+    # worker doesn't stop under a call that is still closing
+    ACTIVE_CALLS.inc()
+    if call_connection_id:
+        admission.streaming_started(call_connection_id)
+    try:
+        async with OpenAIRTHandler(session_profiles.get(websocket.query_params.get("profile"))) as handler:
+            handler.call_connection_id = call_connection_id
+            handler.correlation_id = websocket.headers.get("x-ms-call-correlation-id")
+            handler.log.bind(handler.call_connection_id)
+            await register_media_session(handler.call_connection_id, handler.correlation_id)
+            await handler.init_incoming_websocket(websocket)
+            await handler.start_client()
+            await handler.run()
+    finally:
+        ACTIVE_CALLS.dec()
+        if call_connection_id:
+            # frees the call's session and slot even if CallDisconnected never arrives
+            await call_store.delete(call_connection_id)
+            await admission.release(call_connection_id)
 
 
 @app.get("/")
@@ -180,26 +328,40 @@ async def home() -> PlainTextResponse:
     return PlainTextResponse("Hello ACS CallAutomation!")
 
 
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    # merges the snapshot files of every gunicorn worker, so read off the loop
+    body = await asyncio.to_thread(render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
 # End call
 @app.post("/api/endCall")
-async def end_call() -> JSONResponse:
-    global active_call_connection_id
-    logger.info(f"End call requested for connection ID: {active_call_connection_id}")
-    
-    if not active_call_connection_id:
+async def end_call(request: Request) -> JSONResponse:
+    call_connection_id = request.query_params.get("callConnectionId")
+    if not call_connection_id and await request.body():
+        call_connection_id = (await request.json()).get("callConnectionId")
+    if not call_connection_id:
+        # only unambiguous when this deployment has a single call in progress
+        sessions = await call_store.active()
+        if len(sessions) == 1:
+            call_connection_id = sessions[0].call_connection_id
+    logger.info("End call requested for connection ID: %s", call_connection_id)
+
+    if not call_connection_id:
         return JSONResponse(status_code=400, content={"error": "No active call to end"})
-    
+
     try:
-        call_connection = acs_client.get_call_connection(active_call_connection_id)
+        call_connection = acs_client.get_call_connection(call_connection_id)
         await call_connection.hang_up(is_for_everyone=True)
-        
-        logger.info(f"Successfully ended call with connection ID: {active_call_connection_id}")
-        active_call_connection_id = None
-        
+
+        logger.info("Successfully ended call with connection ID: %s", call_connection_id)
+        await call_store.delete(call_connection_id)
+
         return JSONResponse(status_code=200, content={"message": "Call ended successfully"})
-        
+
     except Exception as e:
-        logger.error(f"Error ending call: {e}")
+        logger.error("Error ending call: %s", e)
         return JSONResponse(status_code=500, content={"error": f"Failed to end call: {str(e)}"})
 
 
@@ -207,9 +369,9 @@ async def end_call() -> JSONResponse:
 # Get ticket
 @app.get("/api/ticket/{ticket_id}")
 async def get_ticket(ticket_id: str) -> JSONResponse:
-    print(f"Getting ticket: {ticket_id}")
+    logger.info("Getting ticket: %s", ticket_id)
     if ticket_id == "123":
-        print("Ticket found")
+        logger.info("Ticket found")
         return JSONResponse(status_code=200, content={"ticket_id": ticket_id, "status": "open", "description": "What is the property rate for the property 123?"})
     else:
         return JSONResponse(status_code=404, content={"error": "Ticket not found"})
@@ -218,6 +380,6 @@ async def get_ticket(ticket_id: str) -> JSONResponse:
 @app.post("/api/ticket")
 async def create_ticket(request: Request) -> JSONResponse:
     data = await request.json()
-    logger.info(f"Creating ticket: {data}")
+    logger.info("Creating ticket: %s", data)
     return JSONResponse(status_code=200, content={"ticket_id": "124", "status": "open", "description": data["description"]})
 
@@ -0,0 +1,315 @@
+import asyncio
+import json
+import logging
+import os
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# each worker snapshots its metrics here; /metrics merges every worker's file
+METRICS_DIR = os.getenv("METRICS_DIR", "/tmp/app_metrics")
+# counters and histograms of exited workers, folded together by the master
+ARCHIVE_FILE = "archive.json"
+METRICS_FLUSH_INTERVAL_S = float(os.getenv("METRICS_FLUSH_INTERVAL_S", "5"))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Metric():
+    kind = None
+
+    def __init__(self, name: str, documentation: str, label: str = None) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.series = {}
+        _registry[name] = self
+
+    def snapshot(self) -> dict:
+        return {"kind": self.kind, "help": self.documentation, "label": self.label, "series": dict(self.series)}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, label: str = ""):
+        self.series[label] = self.series.get(label, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, label: str = ""):
+        self.series[label] = value
+
+    def inc(self, amount: float = 1, label: str = ""):
+        self.series[label] = self.series.get(label, 0) + amount
+
+    def dec(self, amount: float = 1, label: str = ""):
+        self.inc(-amount, label)
+
+    def value(self, label: str = "") -> float:
+        return self.series.get(label, 0)
+
+
+class Histogram(Metric):
+    """Fixed-bucket histogram; a series is [bucket counts..., +Inf count, sum]."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets=LATENCY_BUCKETS, label: str = None) -> None:
+        super().__init__(name, documentation, label)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, label: str = ""):
+        series = self.series.get(label)
+        if series is None:
+            series = self.series[label] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def snapshot(self) -> dict:
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        snapshot["series"] = {label: list(series) for label, series in self.series.items()}
+        return snapshot
+
+
+_registry = {}
+_writer = None
+_started = (None, None)
+
+
+def _process_start(pid: int):
+    """When the process started, in clock ticks since boot; None where /proc
+    can't tell."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # the command name in parentheses may contain spaces
+    return int(stat[stat.rindex(")") + 2:].split()[19])
+
+
+def snapshot() -> dict:
+    global _started
+    pid = os.getpid()
+    # workers fork from the preloaded master, so look it up per process
+    if _started[0] != pid:
+        _started = (pid, _process_start(pid))
+    return {
+        "pid": pid,
+        "started": _started[1],
+        "metrics": {name: metric.snapshot() for name, metric in _registry.items()},
+    }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _worker_alive(worker: dict) -> bool:
+    """Whether the process that wrote a snapshot still runs; a new process
+    that got its pid doesn't count."""
+    pid = worker.get("pid")
+    if not pid or not _pid_alive(pid):
+        return False
+    started = worker.get("started")
+    return started is None or _process_start(pid) in (None, started)
+
+
+def _read_snapshot(path: str):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _worker_snapshots() -> list:
+    """Latest snapshot of every worker, with this worker's taken live, and
+    the archive of the exited ones."""
+    snapshots = [snapshot()]
+    try:
+        names = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        return snapshots
+    archive = _read_snapshot(os.path.join(METRICS_DIR, ARCHIVE_FILE)) if ARCHIVE_FILE in names else None
+    # files folded into the archive but not deleted yet
+    folded = {name for name, _ in archive["folded"]} if archive else set()
+    if archive:
+        snapshots.append(archive)
+    for name in names:
+        if not name.endswith(".json") or name in (f"{os.getpid()}.json", ARCHIVE_FILE) or name in folded:
+            continue
+        worker = _read_snapshot(os.path.join(METRICS_DIR, name))
+        if worker is not None:
+            snapshots.append(worker)
+    return snapshots
+
+
+def live_series(name: str) -> list:
+    """Every series value of a metric across the workers still running; the
+    other workers' values are as of their last snapshot."""
+    values = []
+    for worker in _worker_snapshots():
+        metric = worker["metrics"].get(name)
+        if metric is not None and _worker_alive(worker):
+            values.extend(metric["series"].values())
+    return values
+
+
+def merge(snapshots: list) -> dict:
+    """Sums counters and histograms across workers. Gauges only count live
+    workers, so a recycled worker's last queue depth does not linger."""
+    merged = {}
+    for worker in snapshots:
+        alive = _worker_alive(worker)
+        for name, metric in worker["metrics"].items():
+            if metric["kind"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "series": {}})
+            for label, value in metric["series"].items():
+                current = target["series"].get(label)
+                if current is None:
+                    target["series"][label] = value
+                elif metric["kind"] == "histogram":
+                    target["series"][label] = [a + b for a, b in zip(current, value)]
+                else:
+                    target["series"][label] = current + value
+    return merged
+
+
+def archive_dead_workers():
+    """Folds the snapshots of exited workers into the archive and deletes
+    them, so METRICS_DIR stays one file per running worker. Run by the
+    gunicorn master only, which makes it the archive's single writer."""
+    try:
+        names = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        return
+    archive_path = os.path.join(METRICS_DIR, ARCHIVE_FILE)
+    archive = _read_snapshot(archive_path) or {"pid": None, "folded": [], "metrics": {}}
+    dead = {}
+    for name in names:
+        if not name.endswith(".json") or name == ARCHIVE_FILE:
+            continue
+        worker = _read_snapshot(os.path.join(METRICS_DIR, name))
+        # folded already if the last run stopped before deleting it
+        if worker is not None and not _worker_alive(worker) and [name, worker.get("started")] not in archive["folded"]:
+            dead[name] = worker
+    if not dead:
+        return
+    metrics = merge([archive] + list(dead.values()))
+    archive = {
+        "pid": None,
+        # readers skip these until they are gone; entries of deleted files are dropped
+        "folded": [entry for entry in archive["folded"] if entry[0] in names]
+        + [[name, worker.get("started")] for name, worker in dead.items()],
+        "metrics": {name: metric for name, metric in metrics.items() if metric["kind"] != "gauge"},
+    }
+    with open(archive_path + ".tmp", "w") as f:
+        json.dump(archive, f)
+    os.replace(archive_path + ".tmp", archive_path)
+    for name in dead:
+        try:
+            os.remove(os.path.join(METRICS_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+def _labels(metric: dict, label: str, extra: str = "") -> str:
+    parts = []
+    if metric["label"]:
+        parts.append(f'{metric["label"]}="{label}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render() -> str:
+    """Prometheus text exposition of the metrics of all workers."""
+    lines = []
+    for name, metric in sorted(merge(_worker_snapshots()).items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for label, value in metric["series"].items():
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(metric, label)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], value[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_labels(metric, label, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(metric, label)} {value[-1]}")
+            lines.append(f"{name}_count{_labels(metric, label)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def write_snapshot():
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(snapshot(), f)
+    os.replace(path + ".tmp", path)
+
+
+async def _write_periodically():
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL_S)
+        try:
+            await asyncio.to_thread(write_snapshot)
+        except OSError as e:
+            logger.warning("Failed to write metrics snapshot: %s", e)
+
+
+def start_metrics_writer():
+    global _writer
+    if _writer is None:
+        _writer = asyncio.create_task(_write_periodically())
+
+
+async def stop_metrics_writer():
+    global _writer
+    if _writer is not None:
+        _writer.cancel()
+        _writer = None
+    try:
+        write_snapshot()
+    except OSError:
+        pass
+
+
+ACS_FRAME_TO_APPEND = Histogram(
+    "acs_frame_to_append_seconds", "ACS frame arrival to input_audio_buffer.append completing")
+SPEECH_STOPPED_TO_FIRST_DELTA = Histogram(
+    "speech_stopped_to_first_delta_seconds", "input_audio_buffer.speech_stopped to the first response.audio.delta")
+FIRST_DELTA_TO_ACS_SEND = Histogram(
+    "first_delta_to_acs_send_seconds", "First response.audio.delta of a response to its first ACS send")
+TIME_TO_FIRST_AUDIO = Histogram(
+    "time_to_first_audio_seconds", "/ws accept to the first response.audio.delta of a call")
+TOOL_CALL_DURATION = Histogram(
+    "tool_call_seconds", "Function tool execution time", label="tool")
+ACS_OUTBOUND_QUEUE_DEPTH = Histogram(
+    "acs_outbound_queue_depth", "ACS outbound queue depth when audio is enqueued", buckets=DEPTH_BUCKETS)
+ACS_FRAMES_IN = Counter("acs_audio_frames_total", "Non-silent ACS audio frames received")
+REALTIME_APPENDS = Counter("realtime_audio_appends_total", "input_audio_buffer.append messages sent upstream")
+ACS_OUTBOUND_SHED = Counter("acs_outbound_shed_total", "Stale outbound audio frames shed", label="policy")
+CAPTURE_DROPPED_BYTES = Counter("call_capture_dropped_bytes_total", "PCM bytes dropped by a full capture ring", label="track")
+REALTIME_RECONNECT = Histogram(
+    "realtime_reconnect_seconds", "Realtime session drop to the replacement session taking audio again")
+REALTIME_RECONNECT_FAILED = Counter("realtime_reconnect_failures_total", "Calls ended after reconnect attempts ran out")
+EVENT_LOOP_LAG = Histogram("event_loop_lag_seconds", "Event-loop scheduling delay of the admission monitor")
+LOOP_LAG_PEAK = Gauge("event_loop_lag_peak_seconds", "Decaying peak of the event-loop lag", label="worker")
+OUTBOUND_QUEUE_MEAN_DEPTH = Gauge(
+    "acs_outbound_queue_mean_depth", "Mean ACS outbound queue depth over the calls in progress", label="worker")
+ADMISSION_REFUSED = Counter("admission_refused_total", "Calls and media sessions turned away", label="reason")
+ACTIVE_CALLS = Gauge("active_calls", "Media WebSocket sessions in progress")
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from app.clients import ping_realtime
+
+logger = logging.getLogger(__name__)
+
+# sessions kept open and configured per worker; 0 opens each call's session
+# when its media stream arrives
+REALTIME_POOL_SIZE = int(os.getenv("REALTIME_POOL_SIZE", "0"))
+# upper bound on the sessions a pool has open or opening
+REALTIME_POOL_MAX_SIZE = int(os.getenv("REALTIME_POOL_MAX_SIZE", "8"))
+REALTIME_POOL_MAX_IDLE_S = float(os.getenv("REALTIME_POOL_MAX_IDLE_S", "120"))
+REALTIME_POOL_HEALTH_INTERVAL_S = float(os.getenv("REALTIME_POOL_HEALTH_INTERVAL_S", "15"))
+REALTIME_POOL_PING_TIMEOUT_S = float(os.getenv("REALTIME_POOL_PING_TIMEOUT_S", "5"))
+
+
+class PooledSession():
+    def __init__(self, manager, connection) -> None:
+        self.manager = manager
+        self.connection = connection
+        self.created = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.created
+
+
+class RealtimeConnectionPool():
+    """Per-worker pool of realtime sessions that are already connected and
+    have had session.update applied, so a new call only pays for
+    response.create.
+
+    `connect` returns a realtime connection manager, `configure` is awaited
+    with the entered connection before it is parked in the pool.
+    """
+
+    def __init__(
+        self,
+        connect,
+        configure,
+        size: int = REALTIME_POOL_SIZE,
+        max_size: int = REALTIME_POOL_MAX_SIZE,
+        max_idle_s: float = REALTIME_POOL_MAX_IDLE_S,
+    ) -> None:
+        self._connect = connect
+        self._configure = configure
+        self.size = size
+        self.max_size = max(max_size, size)
+        self.max_idle_s = max_idle_s
+        self._idle = deque()
+        self._warming = 0
+        self._tasks = set()
+        self._maintainer = None
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+    def start(self):
+        if self._maintainer is None:
+            self._maintainer = asyncio.create_task(self._maintain())
+            self.prewarm(self.size)
+
+    async def close(self):
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+            self._maintainer = None
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        # a warm task may still append a session or its counter update
+        await asyncio.gather(*tasks, return_exceptions=True)
+        while self._idle:
+            await self._discard(self._idle.popleft())
+
+    async def open_session(self) -> PooledSession:
+        """Opens and configures a session outside the pool."""
+        manager = self._connect()
+        connection = await manager.enter()
+        try:
+            await self._configure(connection)
+        except BaseException:
+            await connection.close()
+            raise
+        return PooledSession(manager, connection)
+
+    async def acquire(self) -> PooledSession:
+        """Hands out a warm session if one is available, else opens one inline."""
+        session = None
+        while self._idle:
+            candidate = self._idle.pop()
+            if candidate.age() < self.max_idle_s:
+                session = candidate
+                break
+            await self._discard(candidate)
+        if session is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            session = await self.open_session()
+        self.prewarm(self.size - len(self._idle) - self._warming)
+        return session
+
+    def prewarm(self, count: int = 1):
+        """Starts opening up to `count` sessions in the background."""
+        count = min(count, self.max_size - len(self._idle) - self._warming)
+        for _ in range(max(count, 0)):
+            self._warming += 1
+            task = asyncio.create_task(self._warm())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _warm(self):
+        try:
+            self._idle.append(await self.open_session())
+        except Exception as e:
+            logger.warning("Failed to prewarm realtime session: %s", e)
+        finally:
+            self._warming -= 1
+
+    async def _healthy(self, session: PooledSession) -> bool:
+        if session.age() >= self.max_idle_s:
+            return False
+        try:
+            await ping_realtime(session.connection, REALTIME_POOL_PING_TIMEOUT_S)
+            return True
+        except Exception:
+            return False
+
+    async def _discard(self, session: PooledSession):
+        self.evicted += 1
+        try:
+            await session.connection.close()
+        except Exception:
+            pass
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(REALTIME_POOL_HEALTH_INTERVAL_S)
+            for session in list(self._idle):
+                if not await self._healthy(session):
+                    try:
+                        self._idle.remove(session)
+                    except ValueError:
+                        # handed out while we were pinging it
+                        continue
+                    await self._discard(session)
+            self.prewarm(self.size - len(self._idle) - self._warming)
+
+
+class ProfilePools():
+    """One RealtimeConnectionPool per session profile, since pooled sessions
+    already carry a profile's session.update. `configure(connection, profile)`
+    is bound to each pool's profile. A pool whose profile changed on reload
+    is closed and replaced on next use."""
+
+    def __init__(self, connect, configure) -> None:
+        self._connect = connect
+        self._configure = configure
+        self._pools = {}
+        self._tasks = set()
+
+    def get(self, profile, size: int = 0) -> RealtimeConnectionPool:
+        entry = self._pools.get(profile.name)
+        if entry is not None and entry[0] == profile.fingerprint:
+            return entry[1]
+        if entry is not None:
+            # an edited profile keeps its warm pool, whoever asks for it first
+            size = max(size, entry[1].size)
+            task = asyncio.create_task(entry[1].close())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        async def configure(connection):
+            await self._configure(connection, profile)
+
+        pool = RealtimeConnectionPool(self._connect, configure, size=size)
+        pool.start()
+        self._pools[profile.name] = (profile.fingerprint, pool)
+        return pool
+
+    async def close(self):
+        for _, pool in self._pools.values():
+            await pool.close()
+        self._pools.clear()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
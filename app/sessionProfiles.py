@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from app.tools import tool_registry
+
+logger = logging.getLogger(__name__)
+
+SESSION_PROFILES_PATH = os.getenv(
+    "SESSION_PROFILES_PATH", os.path.join(os.path.dirname(__file__), "sessionProfiles.json")
+)
+# how often each worker looks at the file's mtime for edits
+SESSION_PROFILES_RELOAD_S = float(os.getenv("SESSION_PROFILES_RELOAD_S", "5"))
+
+VOICES = {"alloy", "ash", "ballad", "coral", "echo", "sage", "shimmer", "verse"}
+
+
+class SessionProfile():
+    """A validated persona. The session.update event is serialized once
+    here and sent verbatim to every realtime session using the profile."""
+
+    def __init__(
+        self,
+        name: str,
+        instructions: str,
+        voice: str = "shimmer",
+        vad_threshold: float = 0.4,
+        silence_duration_ms: int = 600,
+        tools: list = None,
+        numbers: list = None,
+        callers: list = None,
+    ) -> None:
+        if not isinstance(instructions, str) or not instructions.strip():
+            raise ValueError(f"profile {name}: instructions must be a non-empty string")
+        if voice not in VOICES:
+            raise ValueError(f"profile {name}: unknown voice {voice!r}")
+        for field, values in (("tools", tools), ("numbers", numbers), ("callers", callers)):
+            if values is not None and not (isinstance(values, list) and all(isinstance(v, str) for v in values)):
+                raise ValueError(f"profile {name}: {field} must be a list of strings")
+        if not 0.0 <= vad_threshold <= 1.0:
+            raise ValueError(f"profile {name}: vad_threshold must be between 0 and 1")
+        if not isinstance(silence_duration_ms, int) or silence_duration_ms <= 0:
+            raise ValueError(f"profile {name}: silence_duration_ms must be a positive integer")
+        if tools is None:
+            tools = tool_registry.names()
+        unknown = set(tools) - set(tool_registry.names())
+        if unknown:
+            raise ValueError(f"profile {name}: unknown tools {sorted(unknown)}")
+
+        self.name = name
+        self.voice = voice
+        self.silence_duration_ms = silence_duration_ms
+        self.tools = list(tools)
+        self.numbers = list(numbers or [])
+        self.callers = list(callers or [])
+        session = {
+            "input_audio_transcription": {
+                "model": "whisper-1",
+            },
+            "turn_detection": {
+                "threshold": vad_threshold,
+                "silence_duration_ms": silence_duration_ms,
+                "type": "server_vad"
+            },
+            "instructions": instructions,
+            "voice": voice,
+            "modalities": ["text", "audio"],
+            "tool_choice": "auto",
+            "tools": tool_registry.schema(self.tools),
+        }
+        self.update_event = json.dumps({"type": "session.update", "session": session})
+        # changes whenever anything sent to the realtime API changes
+        self.fingerprint = hashlib.sha1(self.update_event.encode()).hexdigest()[:12]
+
+    @classmethod
+    def from_dict(cls, name: str, data: dict) -> "SessionProfile":
+        if not isinstance(data, dict):
+            raise ValueError(f"profile {name}: expected an object, got {type(data).__name__}")
+        try:
+            return cls(name, **data)
+        except TypeError as e:
+            raise ValueError(f"profile {name}: {e}") from None
+
+
+class SessionProfileStore():
+    """Profiles from SESSION_PROFILES_PATH, routed by the called number or
+    the caller. Each worker checks the file for edits in the background,
+    so they are picked up without a restart and lookups never touch the
+    file; a file that fails validation is logged and the previous profiles
+    stay active."""
+
+    def __init__(self, path: str = SESSION_PROFILES_PATH) -> None:
+        self.path = path
+        self.default = None
+        self._profiles = {}
+        self._by_number = {}
+        self._by_caller = {}
+        self._mtime = None
+        self._watcher = None
+        self.load()
+
+    def load(self):
+        self._apply(*self._read())
+
+    def _read(self) -> tuple:
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path) as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not isinstance(data.get("profiles"), dict):
+            raise ValueError(f"{self.path}: expected an object with a \"profiles\" object")
+        profiles = {name: SessionProfile.from_dict(name, spec) for name, spec in data["profiles"].items()}
+        default = data.get("default") or next(iter(profiles), None)
+        if default not in profiles:
+            raise ValueError(f"{self.path}: default profile {default!r} is not defined")
+        return mtime, profiles, default
+
+    def _read_if_changed(self):
+        if os.stat(self.path).st_mtime == self._mtime:
+            return None
+        return self._read()
+
+    def _apply(self, mtime: float, profiles: dict, default: str):
+        by_number, by_caller = {}, {}
+        for profile in profiles.values():
+            for number in profile.numbers:
+                by_number[number] = profile
+            for caller in profile.callers:
+                by_caller[caller] = profile
+
+        self._profiles, self._by_number, self._by_caller = profiles, by_number, by_caller
+        self.default = profiles[default]
+        self._mtime = mtime
+        logger.info("Loaded %d session profiles from %s", len(profiles), self.path)
+
+    async def reload_if_changed(self):
+        """Reads the file off the event loop if it changed since the last load."""
+        try:
+            loaded = await asyncio.to_thread(self._read_if_changed)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Keeping current session profiles, reload of %s failed: %s", self.path, e)
+            return
+        if loaded is not None:
+            self._apply(*loaded)
+
+    def start(self):
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+    async def _watch(self):
+        # /ws usually lands on a worker that never ran select() for the call,
+        # so every worker has to notice edits to the file on its own
+        while True:
+            await asyncio.sleep(SESSION_PROFILES_RELOAD_S)
+            await self.reload_if_changed()
+
+    def get(self, name: str = None) -> SessionProfile:
+        return self._profiles.get(name) or self.default
+
+    def select(self, called: str = None, caller: str = None) -> SessionProfile:
+        """The caller's profile, else the called number's, else the default."""
+        return self._by_caller.get(caller) or self._by_number.get(called) or self.default
+
+
+session_profiles = SessionProfileStore()
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+
+from app import metrics
+from app.clients import get_http_client
+
+TOOL_TIMEOUT_S = float(os.getenv("TOOL_TIMEOUT_S", "8"))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "64"))
+
+
+class Tool():
+    def __init__(self, name, description, parameters, fn, timeout_s, cache_ttl_s) -> None:
+        self.name = name
+        self.description = description
+        self.parameters = parameters
+        self.fn = fn
+        self.timeout_s = timeout_s
+        self.cache_ttl_s = cache_ttl_s
+
+    def schema(self) -> dict:
+        return {
+            "type": "function",
+            "name": self.name,
+            "description": self.description,
+            "parameters": self.parameters,
+        }
+
+
+class ToolResultCache():
+    """Small TTL + LRU cache for results of idempotent tools, one per call."""
+
+    def __init__(self, max_entries: int = TOOL_CACHE_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def key(name: str, arguments: dict):
+        return name, json.dumps(arguments, sort_keys=True)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, result = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key, result, ttl_s: float):
+        self._entries[key] = (time.monotonic() + ttl_s, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class ToolRegistry():
+    def __init__(self) -> None:
+        self._tools = {}
+
+    def tool(self, name, description, parameters=None, timeout_s=TOOL_TIMEOUT_S, cache_ttl_s=None):
+        """Registers `fn(arguments, handler) -> str` as a realtime function tool.
+
+        `cache_ttl_s` marks the tool idempotent: results are reused for the
+        same arguments within a call for that many seconds.
+        """
+        if parameters is None:
+            parameters = {"type": "object", "properties": {}, "required": []}
+
+        def register(fn):
+            self._tools[name] = Tool(name, description, parameters, fn, timeout_s, cache_ttl_s)
+            return fn
+        return register
+
+    def schema(self, names=None) -> list:
+        """Function definitions for session.update, optionally only `names`."""
+        if names is None:
+            return [tool.schema() for tool in self._tools.values()]
+        return [self._tools[name].schema() for name in names]
+
+    def names(self) -> list:
+        return list(self._tools)
+
+    async def call(self, name, arguments, handler, cache=None, deadline=None) -> str:
+        """Runs a tool, bounded by its own timeout and by `deadline`
+        (event loop time), whichever comes first. Always returns an output
+        for the model, an error message if the tool fails."""
+        tool = self._tools.get(name)
+        if tool is None:
+            return f"Unknown function: {name}"
+
+        key = None
+        if cache is not None and tool.cache_ttl_s:
+            key = cache.key(name, arguments)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+        timeout = tool.timeout_s
+        if deadline is not None:
+            timeout = min(timeout, deadline - asyncio.get_running_loop().time())
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(tool.fn(arguments, handler), max(timeout, 0))
+        except asyncio.TimeoutError:
+            handler.log.warning("Function %s timed out after %.1fs", name, timeout)
+            return f"The {name} function timed out. Please try again later."
+        except Exception as e:  # pylint: disable=broad-except
+            # the model waits on the call_id until it gets an output, so it
+            # gets one for a failure too
+            handler.log.exception("Function %s failed: %s", name, e)
+            return f"The {name} function failed. Please try again later."
+        finally:
+            metrics.TOOL_CALL_DURATION.observe(time.perf_counter() - started, label=name)
+
+        if key is not None:
+            cache.put(key, result, tool.cache_ttl_s)
+        return result
+
+
+tool_registry = ToolRegistry()
+
+
+@tool_registry.tool(
+    "get_ticket",
+    "Get the ticket from the server",
+    {
+        "type": "object",
+        "properties": {
+            "ticket_id": {
+                "type": "string",
+                "description": "The id of the ticket to get"
+            }
+        },
+        "required": ["ticket_id"]
+    },
+    cache_ttl_s=60,
+)
+async def get_ticket(arguments, handler):
+    """Execute the get_ticket function"""
+    url = f"{os.getenv('CALLBACK_URI_HOST')}/api/ticket/{arguments['ticket_id']}"
+    response = await get_http_client().get(url)
+
+    message = response.text
+    return message
+
+
+@tool_registry.tool(
+    "create_ticket",
+    "Create a new ticket on the server",
+    {
+        "type": "object",
+        "properties": {
+            "description": {
+                "type": "string",
+                "description": "The description of the ticket to create"
+            }
+        },
+        "required": ["description"]
+    },
+)
+async def create_ticket(arguments, handler):
+    """Execute the create_ticket function"""
+    url = f"{os.getenv('CALLBACK_URI_HOST')}/api/ticket"
+    response = await get_http_client().post(url, json=arguments)
+
+    message = response.text
+    return message
+
+
+@tool_registry.tool("end_call", "End the current phone call")
+async def end_call(arguments, handler):
+    """Execute the end_call function"""
+    try:
+        url = f"{os.getenv('CALLBACK_URI_HOST')}/api/endCall"
+        response = await get_http_client().post(url, json={"callConnectionId": handler.call_connection_id})
+
+        if response.status_code == 200:
+            return "Call ended successfully. Thank you for calling!"
+        else:
+            return "Failed to end call. Please try again."
+    except Exception as e:
+        handler.log.error("Error ending call: %s", e)
+        return "Failed to end call due to an error."
@@ -0,0 +1,117 @@
+import os
+from collections import deque
+
+import numpy as np
+
+# RMS threshold in dBFS; line hiss/comfort noise sits well below -50
+LOCAL_VAD_THRESHOLD_DBFS = float(os.getenv("LOCAL_VAD_THRESHOLD_DBFS", "-45"))
+# voiced speech has a low zero-crossing rate, hiss a high one
+LOCAL_VAD_MAX_ZCR = float(os.getenv("LOCAL_VAD_MAX_ZCR", "0.35"))
+LOCAL_VAD_ONSET_FRAMES = int(os.getenv("LOCAL_VAD_ONSET_FRAMES", "2"))
+# unvoiced audio still forwarded after the last voiced frame; the gate pads
+# with silence when it closes if this is shorter than the server VAD waits
+LOCAL_VAD_HANGOVER_MS = int(os.getenv("LOCAL_VAD_HANGOVER_MS", "400"))
+LOCAL_VAD_PREROLL_MS = int(os.getenv("LOCAL_VAD_PREROLL_MS", "200"))
+# ACS streams 20 ms frames
+FRAME_MS = 20
+# PCM24K mono 16-bit
+FRAME_BYTES = FRAME_MS * 48
+
+
+def frame_features(pcm: bytes):
+    """Returns (rms dBFS, zero-crossing rate) of a PCM16 frame."""
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    if samples.size == 0:
+        return -120.0, 0.0
+    floats = samples.astype(np.float32)
+    rms = np.sqrt(np.mean(floats * floats))
+    dbfs = 20.0 * np.log10(max(rms, 1.0) / 32768.0)
+    signs = np.signbit(samples)
+    zcr = np.count_nonzero(signs[1:] != signs[:-1]) / samples.size
+    return float(dbfs), float(zcr)
+
+
+class EnergyVad():
+    """Energy / zero-crossing gate for decoded PCM24K frames.
+
+    `process` returns the frames that should go upstream: nothing while
+    idle, the buffered pre-roll plus the current frame at onset, and every
+    frame until the hangover after the last voiced frame expires. Server
+    VAD only ends the turn after `trailing_silence_ms` of silence, so a
+    shorter hangover is topped up with zero PCM when the gate closes.
+    """
+
+    def __init__(
+        self,
+        threshold_dbfs: float = LOCAL_VAD_THRESHOLD_DBFS,
+        max_zcr: float = LOCAL_VAD_MAX_ZCR,
+        onset_frames: int = LOCAL_VAD_ONSET_FRAMES,
+        hangover_ms: int = LOCAL_VAD_HANGOVER_MS,
+        preroll_ms: int = LOCAL_VAD_PREROLL_MS,
+        trailing_silence_ms: int = 0,
+    ) -> None:
+        self.threshold_dbfs = threshold_dbfs
+        self.max_zcr = max_zcr
+        self.onset_frames = onset_frames
+        self.hangover_frames = max(hangover_ms // FRAME_MS, 1)
+        # one frame past the server's silence duration, so its timer is sure to expire
+        self.padding_frames = max(trailing_silence_ms // FRAME_MS + 1 - self.hangover_frames, 0)
+        self._preroll = deque(maxlen=max(preroll_ms // FRAME_MS, onset_frames))
+        self._voiced_run = 0
+        self._hangover = 0
+        self.speaking = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def is_voiced(self, pcm: bytes) -> bool:
+        dbfs, zcr = frame_features(pcm)
+        return dbfs >= self.threshold_dbfs and zcr <= self.max_zcr
+
+    def process(self, pcm: bytes):
+        """Returns (frames to forward, True if speech started on this frame)."""
+        self.bytes_in += len(pcm)
+        voiced = self.is_voiced(pcm)
+        onset = False
+        if self.speaking:
+            if voiced:
+                self._hangover = self.hangover_frames
+                frames = [pcm]
+            else:
+                self._hangover -= 1
+                frames = [pcm] + self._close() if self._hangover <= 0 else [pcm]
+        else:
+            self._voiced_run = self._voiced_run + 1 if voiced else 0
+            if self._voiced_run >= self.onset_frames:
+                self.speaking = onset = True
+                self._hangover = self.hangover_frames
+                frames = list(self._preroll)
+                frames.append(pcm)
+                self._preroll.clear()
+            else:
+                self._preroll.append(pcm)
+                frames = []
+        for frame in frames:
+            self.bytes_out += len(frame)
+        return frames, onset
+
+    def process_silence(self) -> list:
+        """Advances the state machine for a frame ACS already flagged as
+        silent; returns the zero PCM to forward in its place."""
+        self._voiced_run = 0
+        self._preroll.clear()
+        if not self.speaking:
+            return []
+        self._hangover -= 1
+        frames = [bytes(FRAME_BYTES)]
+        if self._hangover <= 0:
+            frames += self._close()
+        self.bytes_out += FRAME_BYTES * len(frames)
+        return frames
+
+    def _close(self) -> list:
+        self.speaking = False
+        self._voiced_run = 0
+        return [bytes(FRAME_BYTES)] * self.padding_frames
+
+    def bytes_saved(self) -> int:
+        return self.bytes_in - self.bytes_out
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from gunicorn.arbiter import Arbiter
+from uvicorn.server import Server
+from uvicorn.workers import UvicornWorker
+
+from app.metrics import ACTIVE_CALLS
+
+logger = logging.getLogger("uvicorn.error")
+
+# how long a stopping worker keeps serving the calls it already has;
+# gunicorn's graceful_timeout must be longer
+CALL_DRAIN_TIMEOUT_S = float(os.getenv("CALL_DRAIN_TIMEOUT_S", "300"))
+# "auto" picks uvloop and httptools when installed; "asyncio" / "h11" to compare
+UVICORN_LOOP = os.getenv("UVICORN_LOOP", "auto")
+UVICORN_HTTP = os.getenv("UVICORN_HTTP", "auto")
+
+
+class DrainingServer(Server):
+    """Uvicorn fails every open WebSocket with 1012 as soon as it starts
+    shutting down, which hangs up on callers. This server stops accepting
+    first and waits for the worker's calls to end before doing that."""
+
+    async def shutdown(self, sockets=None) -> None:
+        for server in self.servers:
+            server.close()
+        for sock in sockets or []:
+            sock.close()
+        deadline = time.monotonic() + CALL_DRAIN_TIMEOUT_S
+        if ACTIVE_CALLS.value() > 0:
+            logger.info("Draining %d active calls (up to %.0fs)", ACTIVE_CALLS.value(), CALL_DRAIN_TIMEOUT_S)
+        # a second SIGTERM/SIGINT sets force_exit and cuts the drain short
+        while ACTIVE_CALLS.value() > 0 and not self.force_exit and time.monotonic() < deadline:
+            # main_loop's heartbeat has stopped; without this the arbiter
+            # kills the worker after `timeout` (e.g. on a max_requests recycle)
+            if self.config.callback_notify is not None:
+                await self.config.callback_notify()
+            await asyncio.sleep(0.5)
+        if ACTIVE_CALLS.value() > 0:
+            logger.warning("Drain window over, dropping %d calls", ACTIVE_CALLS.value())
+        await super().shutdown(sockets=sockets)
+
+
+class DrainingUvicornWorker(UvicornWorker):
+    CONFIG_KWARGS = {"loop": UVICORN_LOOP, "http": UVICORN_HTTP}
+
+    async def _serve(self) -> None:
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
@@ -0,0 +1,54 @@
+"""Micro-benchmark: outbound ACS AudioData / StopAudio envelopes.
+
+Compares the per-delta json.dumps that oai_to_acs used to do against the
+pre-serialized templates in app.acsMedia. tests/test_acs_media.py checks
+that both produce the same JSON.
+
+    python -m benchmarks.bench_acs_envelopes
+"""
+import base64
+import json
+import os
+import timeit
+
+from app.acsMedia import STOP_AUDIO_FRAME, encode_audio_frame
+
+# response.audio.delta chunks are typically a few hundred ms of PCM24K
+DELTA = base64.b64encode(os.urandom(4800)).decode("ascii")
+
+
+def json_audio(data):
+    return json.dumps({
+        "Kind": "AudioData",
+        "AudioData": {
+                "Data":  data
+        },
+        "StopAudio": None
+    })
+
+
+def json_stop():
+    return json.dumps({
+        "Kind": "StopAudio",
+        "AudioData": None,
+        "StopAudio": {}
+    })
+
+
+def main(number: int = 200000) -> None:
+    baseline = timeit.timeit(lambda: json_audio(DELTA), number=number)
+    fast = timeit.timeit(lambda: encode_audio_frame(DELTA), number=number)
+    print(
+        f"AudioData  json.dumps: {number / baseline:>10.0f} frames/s  "
+        f"template: {number / fast:>10.0f} frames/s  speedup: {baseline / fast:.2f}x"
+    )
+    baseline = timeit.timeit(json_stop, number=number)
+    fast = timeit.timeit(lambda: STOP_AUDIO_FRAME, number=number)
+    print(
+        f"StopAudio  json.dumps: {number / baseline:>10.0f} frames/s  "
+        f"constant: {number / fast:>10.0f} frames/s  speedup: {baseline / fast:.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
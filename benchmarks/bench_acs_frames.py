@@ -0,0 +1,61 @@
+"""Micro-benchmark: inbound ACS frame decoding.
+
+Compares the json.loads path that acs_to_oai used to take against
+app.acsMedia.parse_acs_frame.
+
+    python -m benchmarks.bench_acs_frames
+"""
+import base64
+import json
+import os
+import timeit
+
+from app.acsMedia import parse_acs_frame
+
+# 20 ms of PCM24K mono is 960 samples / 1920 bytes
+PCM_FRAME = os.urandom(1920)
+
+
+def make_frame(silent: bool) -> str:
+    return json.dumps({
+        "kind": "AudioData",
+        "audioData": {
+            "timestamp": "2024-11-15T19:16:12.925Z",
+            "participantRawID": "8:acs:00000000-0000-0000-0000-000000000000_00000000-0000-0000-0000-000000000000",
+            "data": base64.b64encode(PCM_FRAME).decode("ascii"),
+            "silent": silent,
+        },
+    })
+
+
+def json_path(stream_data):
+    data = json.loads(stream_data)
+    kind = data['kind']
+    if kind == "AudioData":
+        audio_data_section = data.get("audioData", {})
+        if not audio_data_section.get("silent", True):
+            return audio_data_section.get("data")
+    return None
+
+
+def fast_path(stream_data):
+    frame = parse_acs_frame(stream_data)
+    if frame.kind == "AudioData" and not frame.silent:
+        return frame.data
+    return None
+
+
+def main(number: int = 100000) -> None:
+    for silent in (False, True):
+        frame = make_frame(silent)
+        assert json_path(frame) == fast_path(frame)
+        baseline = timeit.timeit(lambda: json_path(frame), number=number)
+        fast = timeit.timeit(lambda: fast_path(frame), number=number)
+        print(
+            f"silent={silent!s:5}  json.loads: {number / baseline:>10.0f} frames/s  "
+            f"parse_acs_frame: {number / fast:>10.0f} frames/s  speedup: {baseline / fast:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Startup benchmark: import time, worker boot time and per-worker memory.
+
+Boots the app under gunicorn.conf.py with --workers N against dummy
+endpoints (nothing is called at startup), then reads smaps_rollup of the
+master and every worker. PSS splits shared pages between the processes
+that map them, so sum(PSS) is what the container really pays; the shared
+fraction shows how much of each worker is copy-on-write pages inherited
+from the preloaded master.
+
+    python -m benchmarks.bench_startup --workers 4
+    python -m benchmarks.bench_startup --env GC_FREEZE=false --env JSON_CODEC=json
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+BOOTED = re.compile(r"\[(\d+)\] \[INFO\] Application startup complete")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def app_env(workdir: str, extra: dict) -> dict:
+    return {
+        **os.environ,
+        "ACS_CONNECTION_STRING": "endpoint=https://127.0.0.1:9/;accesskey=c3RhcnR1cA==",
+        "CALLBACK_URI_HOST": "https://127.0.0.1:9",
+        "AZURE_OPENAI_API_ENDPOINT": "https://127.0.0.1:9",
+        "AZURE_OPENAI_API_KEY": "startup",
+        "AZURE_OPENAI_API_VERSION": "2024-10-01-preview",
+        "CALL_STORE_PATH": os.path.join(workdir, "calls.db"),
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+        **extra,
+    }
+
+
+def smaps(pid: int) -> dict:
+    """kB fields of /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields
+
+
+def import_times(env: dict, top: int) -> dict:
+    """Import time of app.main, and self time summed per top-level package."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    packages = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| *(\S+)", line)
+        if not match:
+            continue
+        own, cumulative, name = int(match.group(1)), int(match.group(2)), match.group(3)
+        if name == "app.main":
+            total = cumulative
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0) + own
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return {"import_app_main_ms": round(total / 1000, 1), "heaviest_imports_ms": {k: round(v / 1000, 1) for k, v in heaviest}}
+
+
+def boot(workers: int, env: dict, requests: int, timeout_s: float = 60) -> dict:
+    port = _free_port()
+    started = time.monotonic()
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app.main:app", "-c", "gunicorn.conf.py",
+         "--workers", str(workers), "--bind", f"127.0.0.1:{port}"],
+        cwd=ROOT, env=env, stderr=subprocess.PIPE, text=True,
+    )
+    booted = {}
+    all_booted = threading.Event()
+
+    def watch():
+        for line in master.stderr:
+            match = BOOTED.search(line)
+            if match:
+                booted[int(match.group(1))] = time.monotonic() - started
+                if len(booted) == workers:
+                    all_booted.set()
+
+    threading.Thread(target=watch, daemon=True).start()
+    try:
+        if not all_booted.wait(timeout_s):
+            raise TimeoutError(f"{len(booted)}/{workers} workers booted")
+        for _ in range(requests):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/").read()
+        # let the workers settle (lifespan tasks, first metrics snapshot)
+        time.sleep(1)
+        master_mem = smaps(master.pid)
+        worker_mem = [smaps(pid) for pid in booted]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=60)
+
+    def avg(key):
+        return round(sum(m.get(key, 0) for m in worker_mem) / len(worker_mem) / 1024, 1)
+
+    shared = [
+        (m["Shared_Clean"] + m["Shared_Dirty"]) / m["Rss"] for m in worker_mem if m.get("Rss")
+    ]
+    return {
+        "workers": workers,
+        "first_worker_booted_s": round(min(booted.values()), 2),
+        "all_workers_booted_s": round(max(booted.values()), 2),
+        "master_rss_mb": round(master_mem["Rss"] / 1024, 1),
+        "worker_rss_mb": avg("Rss"),
+        "worker_pss_mb": avg("Pss"),
+        "worker_private_mb": round(
+            sum(m["Private_Clean"] + m["Private_Dirty"] for m in worker_mem) / len(worker_mem) / 1024, 1
+        ),
+        "worker_shared_pct": round(100 * sum(shared) / len(shared), 1),
+        "total_pss_mb": round((master_mem["Pss"] + sum(m["Pss"] for m in worker_mem)) / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50, help="requests spread over the workers before measuring")
+    parser.add_argument("--top", type=int, default=8, help="heaviest top-level imports to list")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the app")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="startup-")
+    env = app_env(workdir, dict(item.split("=", 1) for item in args.env))
+    report = import_times(env, args.top)
+    report.update(boot(args.workers, env, args.requests))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
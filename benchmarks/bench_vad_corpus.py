@@ -0,0 +1,98 @@
+"""Local VAD harness over a corpus of recorded calls.
+
+Replays every 16-bit mono WAV in a directory through app.vad.EnergyVad in
+20 ms frames and reports bytes saved, per-frame processing cost and onset
+detection delay. Files that are not 24 kHz are resampled linearly.
+
+A sidecar `<name>.onsets.json` holding a list of labelled speech onsets in
+ms enables the detection-delay column.
+
+    python -m benchmarks.bench_vad_corpus path/to/wavs
+"""
+import argparse
+import json
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from app.vad import FRAME_MS, EnergyVad
+
+SAMPLE_RATE = 24000
+FRAME_BYTES = SAMPLE_RATE * 2 * FRAME_MS // 1000
+
+
+def load_pcm24k(path: Path) -> bytes:
+    with wave.open(str(path), "rb") as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise ValueError(f"{path.name}: expected 16-bit mono")
+        rate = wav.getframerate()
+        pcm = wav.readframes(wav.getnframes())
+    if rate == SAMPLE_RATE:
+        return pcm
+    samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+    positions = np.arange(0, len(samples), rate / SAMPLE_RATE)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.int16).tobytes()
+
+
+def run_file(path: Path, vad_kwargs: dict) -> dict:
+    pcm = load_pcm24k(path)
+    vad = EnergyVad(**vad_kwargs)
+    detected = []
+    timings = []
+    for index, start in enumerate(range(0, len(pcm) - FRAME_BYTES + 1, FRAME_BYTES)):
+        frame = pcm[start:start + FRAME_BYTES]
+        began = time.perf_counter()
+        _, onset = vad.process(frame)
+        timings.append(time.perf_counter() - began)
+        if onset:
+            detected.append((index + 1) * FRAME_MS)
+
+    result = {
+        "file": path.name,
+        "seconds": len(pcm) / (SAMPLE_RATE * 2),
+        "bytes_in": vad.bytes_in,
+        "bytes_saved": vad.bytes_saved(),
+        "frame_us_mean": 1e6 * float(np.mean(timings)) if timings else 0.0,
+        "frame_us_p99": 1e6 * float(np.percentile(timings, 99)) if timings else 0.0,
+        "onsets": detected,
+    }
+    labels = path.with_suffix(".onsets.json")
+    if labels.exists():
+        delays = []
+        for onset_ms in json.loads(labels.read_text()):
+            later = [ms for ms in detected if ms >= onset_ms]
+            if later:
+                delays.append(later[0] - onset_ms)
+        result["onset_delay_ms"] = delays
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", type=Path)
+    parser.add_argument("--threshold-dbfs", type=float)
+    parser.add_argument("--hangover-ms", type=int)
+    parser.add_argument("--preroll-ms", type=int)
+    args = parser.parse_args()
+
+    vad_kwargs = {
+        name: value for name, value in (
+            ("threshold_dbfs", args.threshold_dbfs),
+            ("hangover_ms", args.hangover_ms),
+            ("preroll_ms", args.preroll_ms),
+        ) if value is not None
+    }
+    total_in = total_saved = 0
+    for path in sorted(args.corpus.glob("*.wav")):
+        result = run_file(path, vad_kwargs)
+        total_in += result["bytes_in"]
+        total_saved += result["bytes_saved"]
+        print(json.dumps(result))
+    if total_in:
+        print(f"total: {total_saved}/{total_in} bytes saved ({100 * total_saved / total_in:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""PCM24K sources for the load test: a recorded WAV or a synthetic voice."""
+import base64
+import math
+import struct
+import wave
+
+SAMPLE_RATE = 24000
+FRAME_MS = 20
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+FRAME_BYTES = FRAME_SAMPLES * 2
+SILENT_FRAME = bytes(FRAME_BYTES)
+
+
+def synthetic_speech(ms: int, pitch_hz: float = 180.0) -> bytes:
+    """A syllable-modulated tone, loud enough for any energy VAD."""
+    samples = SAMPLE_RATE * ms // 1000
+    out = bytearray()
+    for n in range(samples):
+        t = n / SAMPLE_RATE
+        envelope = 0.55 + 0.45 * math.sin(2 * math.pi * 4 * t)
+        value = envelope * (0.6 * math.sin(2 * math.pi * pitch_hz * t) + 0.3 * math.sin(2 * math.pi * 2 * pitch_hz * t))
+        out += struct.pack("<h", int(12000 * value))
+    return bytes(out)
+
+
+def load_wav(path: str) -> bytes:
+    with wave.open(path, "rb") as wav:
+        if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) != (SAMPLE_RATE, 1, 2):
+            raise ValueError(f"{path}: expected 24 kHz mono 16-bit PCM")
+        return wav.readframes(wav.getnframes())
+
+
+def frames(pcm: bytes) -> list:
+    """Splits PCM into base64 20 ms frames, zero-padding the last one."""
+    out = []
+    for start in range(0, len(pcm), FRAME_BYTES):
+        chunk = pcm[start:start + FRAME_BYTES]
+        out.append(base64.b64encode(chunk.ljust(FRAME_BYTES, b"\0")).decode("ascii"))
+    return out
+
+
+SILENT_FRAME_B64 = base64.b64encode(SILENT_FRAME).decode("ascii")
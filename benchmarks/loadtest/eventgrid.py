@@ -0,0 +1,58 @@
+"""Fake EventGrid delivery: IncomingCall events to /api/incomingCall and
+Call Automation callbacks to /api/callbacks/{contextId}."""
+import uuid
+from datetime import datetime, timezone
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def incoming_call_event(caller: str, callee: str = "+18005550100") -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "topic": "/subscriptions/loadtest/resourceGroups/loadtest/providers/Microsoft.Communication/CommunicationServices/loadtest",
+        "subject": f"/caller/{caller}/recipient/{callee}",
+        "eventType": "Microsoft.Communication.IncomingCall",
+        "eventTime": _now(),
+        "dataVersion": "1.0",
+        "metadataVersion": "1",
+        "data": {
+            "to": {"kind": "phoneNumber", "rawId": f"4:{callee}", "phoneNumber": {"value": callee}},
+            "from": {"kind": "phoneNumber", "rawId": f"4:{caller}", "phoneNumber": {"value": caller}},
+            "serverCallId": str(uuid.uuid4()),
+            "callerDisplayName": "",
+            "incomingCallContext": f"loadtest-{uuid.uuid4()}",
+            "correlationId": str(uuid.uuid4()),
+        },
+    }
+
+
+def callback_event(event_type: str, call_connection_id: str, correlation_id: str, **data) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "source": f"calling/callConnections/{call_connection_id}",
+        "type": event_type,
+        "time": _now(),
+        "specversion": "1.0",
+        "datacontenttype": "application/json",
+        "subject": f"calling/callConnections/{call_connection_id}",
+        "data": {
+            "callConnectionId": call_connection_id,
+            "serverCallId": str(uuid.uuid4()),
+            "correlationId": correlation_id,
+            "operationContext": "incomingCall",
+            **data,
+        },
+    }
+
+
+async def post_incoming_call(session, app_url: str, caller: str) -> int:
+    """Delivers one IncomingCall event; returns the webhook's status code."""
+    async with session.post(f"{app_url}/api/incomingCall", json=[incoming_call_event(caller)]) as response:
+        return response.status
+
+
+async def post_callback(session, callback_uri: str, event: dict) -> int:
+    async with session.post(callback_uri, json=[event]) as response:
+        return response.status
@@ -0,0 +1,226 @@
+"""Fake ACS: the Call Automation REST endpoints the app calls, plus a media
+client that streams PCM24K into the app's /ws at real-time pace.
+
+Answering a call makes the fake post CallConnected to the app's callback
+URI and open the media WebSocket. The Call Automation SDK only speaks
+HTTPS, so the fake serves a throwaway self-signed certificate; point the
+app's SSL_CERT_FILE at `cert_path`. The media client alternates caller speech
+and silence, and records mouth-to-ear latency: from the end of each caller
+utterance to the first assistant AudioData frame that comes back.
+"""
+import asyncio
+import json
+import os
+import ssl
+import subprocess
+import time
+import uuid
+from urllib.parse import urlparse, urlunparse
+
+import aiohttp
+from aiohttp import web
+
+from benchmarks.loadtest.audio import FRAME_MS, SILENT_FRAME_B64, frames, synthetic_speech
+from benchmarks.loadtest.eventgrid import callback_event, post_callback
+
+TRY_AGAIN_LATER = 1013
+
+
+class CallResult():
+    def __init__(self, call_connection_id: str) -> None:
+        self.call_connection_id = call_connection_id
+        self.latencies = []
+        self.audio_frames_received = 0
+        self.stop_audio_received = 0
+        self.connected = False
+        # the app closed the media socket with 1013 (over capacity)
+        self.refused = False
+        self.error = None
+        self.started = time.monotonic()
+        self.ended = None
+
+
+class FakeAcs():
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8766,
+        app_ws_url: str = None,
+        call_seconds: float = 20.0,
+        utterance_ms: int = 1500,
+        gap_ms: int = 3500,
+        speech_pcm: bytes = None,
+        cert_dir: str = None,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.app_ws_url = app_ws_url
+        self.call_seconds = call_seconds
+        self.gap_ms = gap_ms
+        self.speech = frames(speech_pcm or synthetic_speech(utterance_ms))
+        self.results = []
+        self.rejected = 0
+        self.redirected = 0
+        self.hung_up = 0
+        self._calls = set()
+        self._runner = None
+        self._http = None
+        self.cert_path = None
+        self._ssl = None
+        if cert_dir is not None:
+            self.cert_path = os.path.join(cert_dir, "fake_acs.pem")
+            key_path = os.path.join(cert_dir, "fake_acs.key")
+            subprocess.run(
+                ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                 "-subj", f"/CN={host}", "-addext", f"subjectAltName=IP:{host}",
+                 "-keyout", key_path, "-out", self.cert_path],
+                check=True, capture_output=True,
+            )
+            self._ssl = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self._ssl.load_cert_chain(self.cert_path, key_path)
+
+    @property
+    def connection_string(self) -> str:
+        scheme = "https" if self._ssl else "http"
+        return f"endpoint={scheme}://{self.host}:{self.port}/;accesskey=bG9hZHRlc3Q="
+
+    async def start(self):
+        self._http = aiohttp.ClientSession()
+        app = web.Application()
+        app.router.add_post("/calling/callConnections:answer", self._answer)
+        app.router.add_post("/calling/callConnections:reject", self._reject)
+        app.router.add_post("/calling/callConnections:redirect", self._redirect)
+        app.router.add_get("/calling/callConnections/{call_id}", self._properties)
+        app.router.add_delete("/calling/callConnections/{call_id}", self._hang_up)
+        app.router.add_post("/calling/callConnections/{call_id}", self._hang_up)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port, ssl_context=self._ssl).start()
+
+    async def stop(self):
+        for task in list(self._calls):
+            task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+        if self._http is not None:
+            await self._http.close()
+
+    async def wait_idle(self):
+        while self._calls:
+            await asyncio.gather(*list(self._calls), return_exceptions=True)
+
+    def _properties_body(self, call_id: str, callback_uri: str = None, correlation_id: str = None) -> dict:
+        return {
+            "callConnectionId": call_id,
+            "serverCallId": str(uuid.uuid4()),
+            "targets": [],
+            "callConnectionState": "connected",
+            "callbackUri": callback_uri,
+            "correlationId": correlation_id,
+            "mediaStreamingSubscription": {"id": str(uuid.uuid4()), "state": "active", "subscribedContentTypes": ["audio"]},
+        }
+
+    async def _answer(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        call_id = str(uuid.uuid4())
+        correlation_id = str(uuid.uuid4())
+        transport_url = body["mediaStreamingOptions"]["transportUrl"]
+        task = asyncio.create_task(self._run_call(call_id, correlation_id, body["callbackUri"], transport_url))
+        self._calls.add(task)
+        task.add_done_callback(self._calls.discard)
+        return web.json_response(self._properties_body(call_id, body["callbackUri"], correlation_id))
+
+    async def _reject(self, request: web.Request) -> web.Response:
+        self.rejected += 1
+        return web.Response(status=204)
+
+    async def _redirect(self, request: web.Request) -> web.Response:
+        self.redirected += 1
+        return web.Response(status=204)
+
+    async def _properties(self, request: web.Request) -> web.Response:
+        return web.json_response(self._properties_body(request.match_info["call_id"]))
+
+    async def _hang_up(self, request: web.Request) -> web.Response:
+        self.hung_up += 1
+        return web.Response(status=204)
+
+    async def _run_call(self, call_id: str, correlation_id: str, callback_uri: str, transport_url: str):
+        result = CallResult(call_id)
+        self.results.append(result)
+        try:
+            await post_callback(self._http, callback_uri, callback_event(
+                "Microsoft.Communication.CallConnected", call_id, correlation_id))
+            ws_url = transport_url
+            if self.app_ws_url:
+                # keep the app's query (e.g. the session profile) on the override
+                ws_url = urlunparse(urlparse(self.app_ws_url)._replace(query=urlparse(transport_url).query))
+            await self._stream_media(result, call_id, correlation_id, ws_url)
+        except Exception as e:  # pylint: disable=broad-except
+            result.error = repr(e)
+        finally:
+            result.ended = time.monotonic()
+            try:
+                await post_callback(self._http, callback_uri, callback_event(
+                    "Microsoft.Communication.CallDisconnected", call_id, correlation_id))
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+    async def _stream_media(self, result: CallResult, call_id: str, correlation_id: str, ws_url: str):
+        parsed = urlparse(ws_url)
+        if parsed.scheme == "wss" and parsed.hostname in ("127.0.0.1", "localhost"):
+            ws_url = urlunparse(parsed._replace(scheme="ws"))
+        headers = {"x-ms-call-connection-id": call_id, "x-ms-call-correlation-id": correlation_id}
+        async with self._http.ws_connect(ws_url, headers=headers, max_msg_size=0) as ws:
+            result.connected = True
+            utterance_end = {"t": None}
+            receiver = asyncio.create_task(self._receive(ws, result, utterance_end))
+            try:
+                await ws.send_str(json.dumps({"kind": "AudioMetadata", "audioMetadata": {
+                    "subscriptionId": str(uuid.uuid4()), "encoding": "PCM", "sampleRate": 24000, "channels": 1, "length": 960,
+                }}))
+                await self._speak(ws, utterance_end)
+            except ConnectionError:
+                if ws.close_code != TRY_AGAIN_LATER:
+                    raise
+                result.refused = True
+            finally:
+                receiver.cancel()
+
+    async def _speak(self, ws, utterance_end: dict):
+        started = time.monotonic()
+        gap_frames = self.gap_ms // FRAME_MS
+        index = 0
+        while time.monotonic() - started < self.call_seconds:
+            for data in self.speech:
+                await self._send_frame(ws, data, False, started, index)
+                index += 1
+            utterance_end["t"] = time.monotonic()
+            for _ in range(gap_frames):
+                await self._send_frame(ws, SILENT_FRAME_B64, True, started, index)
+                index += 1
+
+    async def _send_frame(self, ws, data: str, silent: bool, started: float, index: int):
+        # absolute schedule so the stream doesn't drift behind real time
+        delay = started + index * FRAME_MS / 1000 - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await ws.send_str(json.dumps({"kind": "AudioData", "audioData": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "participantRawID": "4:+15555550100",
+            "data": data,
+            "silent": silent,
+        }}))
+
+    async def _receive(self, ws, result: CallResult, utterance_end: dict):
+        async for message in ws:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                continue
+            kind = json.loads(message.data).get("Kind")
+            if kind == "AudioData":
+                result.audio_frames_received += 1
+                if utterance_end["t"] is not None:
+                    result.latencies.append(time.monotonic() - utterance_end["t"])
+                    utterance_end["t"] = None
+            elif kind == "StopAudio":
+                result.stop_audio_received += 1
@@ -0,0 +1,151 @@
+"""Leak test: pushes thousands of short calls through one worker and checks
+that nothing outlives them.
+
+After the churn the worker must be back to its idle footprint: no upstream
+realtime sessions beyond the warm pool, file descriptors back to the
+baseline, and RSS flat over the second half of the run.
+With --drain it then SIGTERMs the worker in the middle of a batch of calls
+and checks they all run to completion.
+
+    python -m benchmarks.loadtest.leak --calls 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from benchmarks.loadtest.eventgrid import post_incoming_call
+from benchmarks.loadtest.fake_acs import FakeAcs
+from benchmarks.loadtest.mock_realtime import MockRealtimeServer
+from benchmarks.loadtest.run import _free_port, process_usage, start_app, wait_ready
+
+
+def open_fds(pid: int) -> int:
+    return len(os.listdir(f"/proc/{pid}/fd"))
+
+
+def worker_pid(app) -> int:
+    with open(f"/proc/{app.pid}/task/{app.pid}/children") as f:
+        return int(f.read().split()[0])
+
+
+async def settle(acs: FakeAcs, realtime: MockRealtimeServer, pool_size: int, timeout_s: float = 30):
+    deadline = time.monotonic() + timeout_s
+    while (acs._calls or realtime.open_sessions > pool_size) and time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+
+
+async def churn(http, app_url: str, acs: FakeAcs, calls: int, concurrency: int):
+    first = len(acs.results)
+    for index in range(calls):
+        while len(acs._calls) >= concurrency:
+            await asyncio.sleep(0.02)
+        await post_incoming_call(http, app_url, f"+1555{index:07d}")
+        # answers are asynchronous; wait for this one so the count above holds
+        deadline = time.monotonic() + 5
+        while len(acs.results) - first <= index and time.monotonic() < deadline:
+            await asyncio.sleep(0.005)
+
+
+async def drain_check(http, app, app_url: str, acs: FakeAcs, calls: int) -> dict:
+    first = len(acs.results)
+    for index in range(calls):
+        await post_incoming_call(http, app_url, f"+1666{index:07d}")
+    await asyncio.sleep(1)
+    app.send_signal(signal.SIGTERM)
+    signalled = time.monotonic()
+    await asyncio.to_thread(app.wait)
+    results = acs.results[first:]
+    return {
+        "drain_calls": calls,
+        "drain_completed": sum(r.error is None and r.ended is not None for r in results),
+        "drain_exit_s": round(time.monotonic() - signalled, 1),
+    }
+
+
+async def main_async(args) -> int:
+    realtime = MockRealtimeServer(port=_free_port(), first_delta_ms=50, response_ms=300)
+    workdir = tempfile.mkdtemp(prefix="leaktest-")
+    acs = FakeAcs(
+        port=_free_port(), cert_dir=workdir, call_seconds=args.call_seconds, utterance_ms=300, gap_ms=700,
+    )
+    await realtime.start()
+    await acs.start()
+    port = _free_port()
+    app = start_app(port, realtime, acs, workdir, {"REALTIME_POOL_SIZE": str(args.pool_size)})
+    app_url = f"http://127.0.0.1:{port}"
+    acs.app_ws_url = f"ws://127.0.0.1:{port}/ws"
+    failures = []
+    try:
+        await wait_ready(app_url + "/")
+        pid = worker_pid(app)
+        async with aiohttp.ClientSession() as http:
+            # the first round grows allocator arenas to peak concurrency and
+            # creates lazy clients, so the baseline is taken after it
+            rounds = 10
+            started = time.monotonic()
+            rss = []
+            for round_index in range(rounds):
+                await churn(http, app_url, acs, args.calls // rounds, args.concurrency)
+                await settle(acs, realtime, args.pool_size)
+                rss.append(process_usage(pid)[1])
+                if round_index == 0:
+                    fds_before = open_fds(pid)
+            results = acs.results
+            report = {
+                "calls": args.calls,
+                "errors": sum(r.error is not None for r in results),
+                "wall_s": round(time.monotonic() - started, 1),
+                "upstream_open_after": realtime.open_sessions,
+                "fds_before": fds_before,
+                "fds_after": open_fds(pid),
+                "rss_mb_per_round": [round(value / 2**20, 1) for value in rss],
+            }
+            if args.drain:
+                report.update(await drain_check(http, app, app_url, acs, args.drain))
+        print(json.dumps(report), flush=True)
+    finally:
+        if app.poll() is None:
+            app.send_signal(signal.SIGTERM)
+            await asyncio.to_thread(app.wait)
+        await acs.stop()
+        await realtime.stop()
+
+    if report["errors"]:
+        failures.append(f"{report['errors']} calls failed")
+    if report["upstream_open_after"] > args.pool_size:
+        failures.append(f"{report['upstream_open_after']} realtime sessions still open")
+    if report["fds_after"] > report["fds_before"] + 5:
+        failures.append(f"file descriptors grew {report['fds_before']} -> {report['fds_after']}")
+    # allocator arenas keep growing for a while before they plateau, so judge
+    # the second half of the run
+    rss_mb = report["rss_mb_per_round"]
+    middle = len(rss_mb) // 2
+    if rss_mb[-1] - rss_mb[middle] > args.max_rss_growth_mb:
+        failures.append(f"RSS grew {rss_mb[middle]} -> {rss_mb[-1]} MB over the second half")
+    if args.drain and report["drain_completed"] != args.drain:
+        failures.append(f"only {report['drain_completed']}/{args.drain} calls survived the shutdown")
+    for failure in failures:
+        print(f"LEAK: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--call-seconds", type=float, default=1)
+    parser.add_argument("--pool-size", type=int, default=0)
+    parser.add_argument("--max-rss-growth-mb", type=float, default=10)
+    parser.add_argument("--drain", type=int, default=0, help="calls in flight when the worker is SIGTERMed")
+    sys.exit(asyncio.run(main_async(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
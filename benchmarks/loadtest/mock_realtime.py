@@ -0,0 +1,255 @@
+"""Local stand-in for the Azure OpenAI realtime WebSocket API.
+
+Speaks enough of the protocol for OpenAIRTHandler: session.created/updated,
+server VAD events driven by the energy of appended audio, paced
+response.audio.delta streams, optional function calls, response.cancel and
+conversation.item.truncate. `drop_after_s` closes sessions abruptly to
+exercise upstream reconnects.
+
+    python -m benchmarks.loadtest.mock_realtime --port 8765
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import math
+import struct
+import time
+
+from aiohttp import WSMsgType, web
+
+from benchmarks.loadtest.audio import SAMPLE_RATE
+
+_ids = itertools.count(1)
+
+
+def _id(prefix: str) -> str:
+    return f"{prefix}_{next(_ids):08d}"
+
+
+def _rms(pcm: bytes) -> float:
+    count = len(pcm) // 2
+    if not count:
+        return 0.0
+    samples = struct.unpack(f"<{count}h", pcm[:count * 2])
+    return math.sqrt(sum(s * s for s in samples[::4]) / len(samples[::4]))
+
+
+class MockRealtimeServer():
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        silence_ms: int = 600,
+        first_delta_ms: int = 250,
+        response_ms: int = 1500,
+        delta_ms: int = 100,
+        function_call_every: int = 0,
+        drop_after_s: float = None,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.silence_ms = silence_ms
+        self.first_delta_ms = first_delta_ms
+        self.response_ms = response_ms
+        self.delta_ms = delta_ms
+        self.function_call_every = function_call_every
+        self.drop_after_s = drop_after_s
+        self.sessions = 0
+        self.open_sessions = 0
+        self.dropped = 0
+        self.cancels = 0
+        self.truncates = 0
+        self._runner = None
+        # one delta worth of assistant "speech", shared by every session
+        samples = SAMPLE_RATE * delta_ms // 1000
+        pcm = b"".join(
+            struct.pack("<h", int(6000 * math.sin(2 * math.pi * 220 * n / SAMPLE_RATE))) for n in range(samples)
+        )
+        self._delta = base64.b64encode(pcm).decode("ascii")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/{tail:.*realtime}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        self.sessions += 1
+        self.open_sessions += 1
+        try:
+            await _MockSession(self, ws).run()
+        finally:
+            self.open_sessions -= 1
+        return ws
+
+
+class _MockSession():
+    def __init__(self, server: MockRealtimeServer, ws: web.WebSocketResponse) -> None:
+        self.server = server
+        self.ws = ws
+        self.session_id = _id("sess")
+        self.response_task = None
+        self.speaking = False
+        self.audio_ms = 0
+        # end of the last voiced audio, on the appended-audio timeline
+        self.voice_end_ms = 0
+        self.responses = 0
+
+    async def send(self, event: dict):
+        event.setdefault("event_id", _id("event"))
+        if not self.ws.closed:
+            await self.ws.send_str(json.dumps(event))
+
+    async def run(self):
+        await self.send({"type": "session.created", "session": {"id": self.session_id, "object": "realtime.session"}})
+        dropper = None
+        if self.server.drop_after_s:
+            dropper = asyncio.get_running_loop().call_later(self.server.drop_after_s, self._drop)
+        try:
+            async for message in self.ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                await self.on_event(json.loads(message.data))
+        finally:
+            if dropper is not None:
+                dropper.cancel()
+            if self.response_task is not None:
+                self.response_task.cancel()
+
+    def _drop(self):
+        self.server.dropped += 1
+        asyncio.create_task(self.ws.close(code=1011, message=b"mock upstream drop"))
+
+    async def on_event(self, event: dict):
+        match event.get("type"):
+            case "session.update":
+                await self.send({"type": "session.updated", "session": {"id": self.session_id, **event.get("session", {})}})
+            case "input_audio_buffer.append":
+                await self.on_audio(base64.b64decode(event["audio"]))
+            case "input_audio_buffer.clear":
+                await self.send({"type": "input_audio_buffer.cleared"})
+            case "conversation.item.create":
+                item = {"id": _id("item"), **event.get("item", {})}
+                await self.send({"type": "conversation.item.created", "previous_item_id": None, "item": item})
+            case "conversation.item.truncate":
+                self.server.truncates += 1
+                await self.send({
+                    "type": "conversation.item.truncated",
+                    "item_id": event.get("item_id"),
+                    "content_index": event.get("content_index", 0),
+                    "audio_end_ms": event.get("audio_end_ms", 0),
+                })
+            case "response.create":
+                if self.response_task is not None and not self.response_task.done():
+                    await self.send({"type": "error", "error": {
+                        "type": "invalid_request_error",
+                        "code": "conversation_already_has_active_response",
+                        "message": "Conversation already has an active response",
+                    }})
+                else:
+                    self.response_task = asyncio.create_task(self.respond())
+            case "response.cancel":
+                self.server.cancels += 1
+                if self.response_task is not None and not self.response_task.done():
+                    self.response_task.cancel()
+                else:
+                    await self.send({"type": "error", "error": {
+                        "type": "invalid_request_error",
+                        "code": "response_cancel_not_active",
+                        "message": "Cancellation failed: no active response found",
+                    }})
+
+    async def on_audio(self, pcm: bytes):
+        ms = len(pcm) * 1000 // (SAMPLE_RATE * 2)
+        self.audio_ms += ms
+        if _rms(pcm) < 500:
+            # like the service, silence is measured in audio appended, not time
+            # waited, so a client that stops sending never ends the turn
+            if self.speaking and self.audio_ms - self.voice_end_ms >= self.server.silence_ms:
+                await self.on_speech_stopped()
+            return
+        self.voice_end_ms = self.audio_ms
+        if not self.speaking:
+            self.speaking = True
+            await self.send({"type": "input_audio_buffer.speech_started", "audio_start_ms": self.audio_ms - ms, "item_id": _id("item")})
+
+    async def on_speech_stopped(self):
+        self.speaking = False
+        item_id = _id("item")
+        await self.send({"type": "input_audio_buffer.speech_stopped", "audio_end_ms": self.audio_ms, "item_id": item_id})
+        await self.send({"type": "input_audio_buffer.committed", "previous_item_id": None, "item_id": item_id})
+        await self.send({
+            "type": "conversation.item.input_audio_transcription.completed",
+            "item_id": item_id, "content_index": 0, "transcript": "load test utterance",
+        })
+        if self.response_task is not None and not self.response_task.done():
+            self.response_task.cancel()
+        self.response_task = asyncio.create_task(self.respond())
+
+    async def respond(self):
+        response_id = _id("resp")
+        item_id = _id("item")
+        self.responses += 1
+        status = "completed"
+        await self.send({"type": "response.created", "response": {"id": response_id, "status": "in_progress", "output": []}})
+        try:
+            await asyncio.sleep(self.server.first_delta_ms / 1000)
+            every = self.server.function_call_every
+            if every and self.responses % every == 0:
+                await self.send({
+                    "type": "response.function_call_arguments.done",
+                    "response_id": response_id, "item_id": item_id, "output_index": 0,
+                    "call_id": _id("call"), "name": "get_ticket", "arguments": json.dumps({"ticket_id": "123"}),
+                })
+            else:
+                started = time.monotonic()
+                for index in range(max(self.server.response_ms // self.server.delta_ms, 1)):
+                    await self.send({
+                        "type": "response.audio.delta", "response_id": response_id, "item_id": item_id,
+                        "output_index": 0, "content_index": 0, "delta": self.server._delta,
+                    })
+                    # stream a little faster than real time, like the service does
+                    pause = started + (index + 1) * self.server.delta_ms / 2000 - time.monotonic()
+                    if pause > 0:
+                        await asyncio.sleep(pause)
+                await self.send({"type": "response.audio.done", "response_id": response_id, "item_id": item_id,
+                                 "output_index": 0, "content_index": 0})
+                await self.send({"type": "response.audio_transcript.done", "response_id": response_id, "item_id": item_id,
+                                 "output_index": 0, "content_index": 0, "transcript": "mock assistant reply"})
+        except asyncio.CancelledError:
+            status = "cancelled"
+        await self.send({"type": "response.done", "response": {
+            "id": response_id, "object": "realtime.response", "status": status, "status_details": None, "output": [],
+        }})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--function-call-every", type=int, default=0)
+    parser.add_argument("--drop-after-s", type=float)
+    args = parser.parse_args()
+
+    async def serve():
+        server = MockRealtimeServer(
+            args.host, args.port, function_call_every=args.function_call_every, drop_after_s=args.drop_after_s
+        )
+        await server.start()
+        print(f"mock realtime API on ws://{args.host}:{args.port}/openai/realtime")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
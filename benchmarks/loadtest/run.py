@@ -0,0 +1,241 @@
+"""Load test: how many concurrent calls can one UvicornWorker sustain?
+
+Starts the mock realtime API and the fake ACS, launches the app under
+gunicorn with a single worker pointed at both (or targets --app-url), then
+ramps concurrent calls through stages. Each stage reports p50/p99
+mouth-to-ear latency, CPU seconds per call-second and RSS per call.
+
+    python -m benchmarks.loadtest.run --stages 1,10,25,50 --call-seconds 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+from benchmarks.loadtest.audio import load_wav
+from benchmarks.loadtest.eventgrid import post_incoming_call
+from benchmarks.loadtest.fake_acs import FakeAcs
+from benchmarks.loadtest.mock_realtime import MockRealtimeServer
+
+ROOT = Path(__file__).resolve().parents[2]
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children(pid: int) -> list:
+    pids = [pid]
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            pids.append(int(entry))
+    return pids
+
+
+def process_usage(pid: int):
+    """(cpu seconds, rss bytes) of a process and its direct children."""
+    cpu = rss = 0
+    for p in _children(pid):
+        try:
+            with open(f"/proc/{p}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        rss += int(fields[21]) * PAGE_SIZE
+    return cpu, rss
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def start_app(
+    port: int, realtime: MockRealtimeServer, acs: FakeAcs, workdir: str, extra_env: dict,
+    workers: int = 1, gunicorn_args: tuple = ("--max-requests", "0"),
+):
+    env = {
+        **os.environ,
+        "ACS_CONNECTION_STRING": acs.connection_string,
+        "CALLBACK_URI_HOST": f"http://127.0.0.1:{port}",
+        "AZURE_OPENAI_API_ENDPOINT": f"http://{realtime.host}:{realtime.port}",
+        "AZURE_OPENAI_WEBSOCKET_BASE_URL": f"ws://{realtime.host}:{realtime.port}/openai",
+        "AZURE_OPENAI_API_KEY": "loadtest",
+        "AZURE_OPENAI_API_VERSION": "2024-10-01-preview",
+        "AZURE_OPENAI_DEPLOYMENT_NAME": "gpt-4o-realtime-preview",
+        "CALL_STORE_PATH": os.path.join(workdir, "calls.db"),
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+        "LOG_LEVEL": "WARNING",
+        "SSL_CERT_FILE": acs.cert_path,
+        **extra_env,
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app.main:app", "-c", "gunicorn.conf.py",
+         "--workers", str(workers), "--bind", f"127.0.0.1:{port}", *gunicorn_args],
+        cwd=ROOT, env=env,
+    )
+
+
+async def wait_ready(url: str, timeout_s: float = 30):
+    deadline = time.monotonic() + timeout_s
+    async with aiohttp.ClientSession() as http:
+        while time.monotonic() < deadline:
+            try:
+                async with http.get(url) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up")
+
+
+async def app_metrics(http, app_url: str) -> dict:
+    """Unlabelled samples of the app's /metrics, by name."""
+    async with http.get(app_url + "/metrics") as response:
+        text = await response.text()
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#") and "{" not in line:
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+async def run_stage(
+    http, app_url: str, acs: FakeAcs, realtime: MockRealtimeServer, calls: int, ramp_s: float, app_pid: int
+) -> dict:
+    first = len(acs.results)
+    rejected, redirected = acs.rejected, acs.redirected
+    cancels, truncates = realtime.cancels, realtime.truncates
+    dropped = realtime.dropped
+    metrics_before = await app_metrics(http, app_url)
+    cpu_before, rss_before = process_usage(app_pid) if app_pid else (0, 0)
+    peak_rss = rss_before
+    started = time.monotonic()
+
+    for index in range(calls):
+        status = await post_incoming_call(http, app_url, f"+1555{index:07d}")
+        if status != 200:
+            print(f"incomingCall returned {status}", file=sys.stderr)
+        await asyncio.sleep(ramp_s / max(calls, 1))
+    await asyncio.sleep(1)
+    while acs._calls:
+        if app_pid:
+            peak_rss = max(peak_rss, process_usage(app_pid)[1])
+        await asyncio.sleep(0.5)
+
+    results = acs.results[first:]
+    latencies = [latency for result in results for latency in result.latencies]
+    call_seconds = sum((r.ended or time.monotonic()) - r.started for r in results)
+    cpu_after, _ = process_usage(app_pid) if app_pid else (0, 0)
+    metrics_after = await app_metrics(http, app_url)
+
+    def metric_delta(name):
+        return metrics_after.get(name, 0) - metrics_before.get(name, 0)
+
+    reconnects = metric_delta("realtime_reconnect_seconds_count")
+    answered = len(results)
+    return {
+        "calls": calls,
+        "answered": answered,
+        "connected": sum(r.connected for r in results),
+        "errors": sum(r.error is not None for r in results),
+        "rejected": acs.rejected - rejected,
+        "redirected": acs.redirected - redirected,
+        "refused_sessions": sum(r.refused for r in results),
+        "barge_in_cancels": realtime.cancels - cancels,
+        "barge_in_truncates": realtime.truncates - truncates,
+        "upstream_drops": realtime.dropped - dropped,
+        "reconnects": int(reconnects),
+        "reconnect_failures": int(metric_delta("realtime_reconnect_failures_total")),
+        "reconnect_mean_ms": round(1000 * metric_delta("realtime_reconnect_seconds_sum") / reconnects, 1) if reconnects else None,
+        "mouth_to_ear_p50_ms": round(1000 * percentile(latencies, 0.50), 1),
+        "mouth_to_ear_p99_ms": round(1000 * percentile(latencies, 0.99), 1),
+        "cpu_s_per_call_s": round((cpu_after - cpu_before) / call_seconds, 4) if call_seconds else None,
+        "rss_mb_per_call": round((peak_rss - rss_before) / answered / 2**20, 2) if answered and app_pid else None,
+        "wall_s": round(time.monotonic() - started, 1),
+    }
+
+
+async def main_async(args) -> None:
+    realtime = MockRealtimeServer(
+        port=_free_port(), function_call_every=args.function_call_every, drop_after_s=args.drop_after_s
+    )
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    acs = FakeAcs(
+        port=_free_port(),
+        cert_dir=workdir,
+        call_seconds=args.call_seconds,
+        gap_ms=args.gap_ms,
+        speech_pcm=load_wav(args.wav) if args.wav else None,
+    )
+    await realtime.start()
+    await acs.start()
+
+    app = None
+    app_url = args.app_url
+    try:
+        if app_url is None:
+            port = _free_port()
+            extra_env = dict(item.split("=", 1) for item in args.env)
+            app = start_app(port, realtime, acs, workdir, extra_env)
+            app_url = f"http://127.0.0.1:{port}"
+        acs.app_ws_url = app_url.replace("http", "ws", 1) + "/ws"
+        await wait_ready(app_url + "/")
+        print(f"app {app_url}  mock realtime :{realtime.port}  fake ACS :{acs.port}", file=sys.stderr)
+
+        async with aiohttp.ClientSession() as http:
+            for calls in args.stages:
+                report = await run_stage(http, app_url, acs, realtime, calls, args.ramp_s, app.pid if app else None)
+                print(json.dumps(report), flush=True)
+    finally:
+        if app is not None:
+            app.send_signal(signal.SIGTERM)
+            try:
+                app.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                app.kill()
+        await acs.stop()
+        await realtime.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", type=lambda s: [int(x) for x in s.split(",")], default=[1, 5, 10, 25])
+    parser.add_argument("--call-seconds", type=float, default=20)
+    parser.add_argument("--ramp-s", type=float, default=5, help="spread call arrivals over this many seconds")
+    parser.add_argument("--gap-ms", type=int, default=3500, help="caller silence between utterances; short gaps barge in")
+    parser.add_argument("--wav", help="24 kHz mono 16-bit caller recording; synthetic speech otherwise")
+    parser.add_argument("--app-url", help="target an already running app instead of spawning one")
+    parser.add_argument("--function-call-every", type=int, default=0, help="make every Nth response a get_ticket call")
+    parser.add_argument("--drop-after-s", type=float, help="mock realtime drops each session after this long")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the spawned app")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,57 @@
+import gc
+import os
+
+from app import metrics
+
+# freeze what preload_app imports so the workers' collector never touches
+# (and un-shares) those pages; "false" to measure without it
+GC_FREEZE = os.getenv("GC_FREEZE", "true").lower() == "true"
+if GC_FREEZE:
+    # no collections in the master while the app is imported, so freed
+    # cycles don't leave holes in the pages the workers will share
+    gc.disable()
+
 bind = "0.0.0.0:80"
 workers = 8
-worker_class = "uvicorn.workers.UvicornWorker"
+# UvicornWorker that lets in-progress calls finish before stopping
+worker_class = "app.worker.DrainingUvicornWorker"
 worker_connections = 2000
 max_requests = 10000
 max_requests_jitter = 1000
+# covers the worker's call drain window plus lifespan shutdown
+graceful_timeout = int(float(os.getenv("CALL_DRAIN_TIMEOUT_S", "300"))) + 30
 preload_app = True
 forwarded_allow_ips = "*"
 
 raw_env = ["UVICORN_CMD_ARGS=--proxy-headers"]
+
+
+def when_ready(server):
+    # the app is loaded and no worker forked yet; the master runs for the
+    # container's lifetime, so it gets its collector back
+    if GC_FREEZE:
+        gc.freeze()
+        gc.enable()
+    # snapshots left by a previous run
+    try:
+        metrics.archive_dead_workers()
+    except OSError as e:
+        server.log.warning("Failed to archive old metrics snapshots: %s", e)
+
+
+def pre_fork(server, worker):
+    if GC_FREEZE:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if GC_FREEZE:
+        gc.enable()
+
+
+def child_exit(server, worker):
+    # the worker has written its last snapshot and been reaped
+    try:
+        metrics.archive_dead_workers()
+    except OSError as e:
+        server.log.warning("Failed to archive metrics of worker %s: %s", worker.pid, e)
@@ -0,0 +1,64 @@
+"""Runs the app under gunicorn against the load-test mock realtime server
+and fake ACS, for tests that need whole calls."""
+import asyncio
+import contextlib
+import signal
+import subprocess
+import tempfile
+import time
+
+import aiohttp
+
+from benchmarks.loadtest.eventgrid import post_incoming_call
+from benchmarks.loadtest.fake_acs import FakeAcs
+from benchmarks.loadtest.mock_realtime import MockRealtimeServer
+from benchmarks.loadtest.run import _free_port, start_app, wait_ready
+
+
+class Harness():
+    def __init__(self, app, url: str, acs: FakeAcs, realtime: MockRealtimeServer, http, workdir: str) -> None:
+        self.app = app
+        self.workdir = workdir
+        self.url = url
+        self.acs = acs
+        self.realtime = realtime
+        self.http = http
+
+    async def call(self, caller: str = "+15550000001") -> int:
+        return await post_incoming_call(self.http, self.url, caller)
+
+    async def wait_connected(self, calls: int = 1, timeout_s: float = 10):
+        deadline = time.monotonic() + timeout_s
+        while sum(r.connected for r in self.acs.results) < calls:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{calls} calls did not connect")
+            await asyncio.sleep(0.05)
+
+
+@contextlib.asynccontextmanager
+async def running_app(
+    call_seconds: float = 5, env: dict = None, workers: int = 1, gunicorn_args: tuple = ("--max-requests", "0"),
+    **realtime_options,
+):
+    realtime = MockRealtimeServer(port=_free_port(), **realtime_options)
+    workdir = tempfile.mkdtemp(prefix="apptest-")
+    acs = FakeAcs(port=_free_port(), cert_dir=workdir, call_seconds=call_seconds, utterance_ms=500, gap_ms=1000)
+    await realtime.start()
+    await acs.start()
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    acs.app_ws_url = f"ws://127.0.0.1:{port}/ws"
+    app = start_app(port, realtime, acs, workdir, env or {}, workers=workers, gunicorn_args=gunicorn_args)
+    try:
+        await wait_ready(url + "/")
+        async with aiohttp.ClientSession() as http:
+            yield Harness(app, url, acs, realtime, http, workdir)
+    finally:
+        if app.poll() is None:
+            app.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.to_thread(app.wait, 30)
+            except subprocess.TimeoutExpired:
+                app.kill()
+        await acs.stop()
+        await realtime.stop()
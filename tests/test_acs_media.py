@@ -0,0 +1,66 @@
+import base64
+import json
+
+import pytest
+
+from app.acsMedia import STOP_AUDIO_FRAME, encode_audio_frame, parse_acs_frame
+
+DATA = "UklGRiQAAABXQVZFZm10IBAAAAABAAEAwF0AAIC7AAACABAA"
+
+
+def _reference(frame: str) -> tuple:
+    """(kind, silent, data) as the full JSON parse has it."""
+    message = json.loads(frame)
+    if message.get("kind") != "AudioData":
+        return message.get("kind"), True, None
+    audio = message.get("audioData") or {}
+    silent = audio.get("silent", True)
+    return "AudioData", silent, None if silent else audio.get("data")
+
+
+@pytest.mark.parametrize("frame", [
+    # what ACS sends
+    json.dumps({"kind": "AudioData", "audioData": {"timestamp": "2024-01-01T00:00:00Z", "participantRawID": "8:acs:1",
+                                                   "data": DATA, "silent": False}}),
+    json.dumps({"kind": "AudioData", "audioData": {"data": DATA, "silent": True}}),
+    # other kinds
+    json.dumps({"kind": "AudioMetadata", "audioMetadata": {"subscriptionId": "s", "encoding": "PCM",
+                                                           "sampleRate": 24000, "channels": 1, "length": 480}}),
+    json.dumps({"kind": "DtmfData", "dtmfData": {"data": "5"}}),
+    # reordered keys
+    json.dumps({"audioData": {"silent": False, "data": DATA}, "kind": "AudioData"}),
+    json.dumps({"kind": "AudioData", "audioData": {"silent": False, "participantRawID": "8:acs:1", "data": DATA}}),
+    # escaped strings
+    json.dumps({"kind": "AudioData", "audioData": {"data": DATA[:8] + "\\/" + DATA[8:], "silent": False}}),
+    '{"kind": "AudioData", "audioData": {"data": "' + DATA[:8] + '\\/' + DATA[8:] + '", "silent": false}}',
+    json.dumps({"kind": "AudioData", "audioData": {"participantRawID": "8:acs:\"quoted\"", "data": DATA,
+                                                         "silent": False}}),
+    # extra whitespace
+    '{ "kind" :  "AudioData" ,\n  "audioData" : {\n\t"data" :\t"' + DATA + '" ,\n\t"silent" :  false } }',
+    '{"kind":"AudioData","audioData":{"data":"' + DATA + '","silent":true}}',
+    # the silent flag missing or not a boolean
+    json.dumps({"kind": "AudioData", "audioData": {"data": DATA}}),
+    json.dumps({"kind": "AudioData", "audioData": {"data": DATA, "silent": None}}),
+    json.dumps({"kind": "AudioData", "audioData": {"data": DATA, "silent": 0}}),
+    json.dumps({"kind": "AudioData", "audioData": None}),
+])
+def test_parse_acs_frame_matches_json_loads(frame):
+    parsed = parse_acs_frame(frame)
+    assert (parsed.kind, parsed.silent, parsed.data) == _reference(frame)
+
+
+@pytest.mark.parametrize("data", [
+    # a response.audio.delta sized chunk, empty, and every byte value
+    base64.b64encode(bytes(4800)).decode("ascii"), "", "AAAA", base64.b64encode(bytes(range(256))).decode("ascii"),
+])
+def test_audio_envelope_is_what_json_dumps_produces(data):
+    message = {"Kind": "AudioData", "AudioData": {"Data": data}, "StopAudio": None}
+    encoded = encode_audio_frame(data)
+    assert encoded == json.dumps(message)
+    assert json.loads(encoded) == message
+
+
+def test_stop_audio_envelope_is_what_json_dumps_produces():
+    message = {"Kind": "StopAudio", "AudioData": None, "StopAudio": {}}
+    assert STOP_AUDIO_FRAME == json.dumps(message)
+    assert json.loads(STOP_AUDIO_FRAME) == message
@@ -0,0 +1,79 @@
+import asyncio
+import base64
+
+from app import jsonCodec
+from app.acsOutbound import BYTES_PER_MS, AcsOutboundWriter
+
+# 20 ms of PCM24K
+FRAME = base64.b64encode(bytes(20 * BYTES_PER_MS)).decode("ascii")
+
+
+async def _send_frames(frames: int, **options) -> tuple:
+    """Queues `frames` before the writer starts, as if the socket had been
+    stalled; returns the writer and the ms of audio in each send."""
+    sent = []
+
+    async def send(message: str):
+        data = jsonCodec.loads(message)["AudioData"]["Data"]
+        sent.append(len(base64.b64decode(data)) // BYTES_PER_MS)
+
+    writer = AcsOutboundWriter(send, high_water=4, **options)
+    for _ in range(frames):
+        writer.put_audio(FRAME, "item-1")
+    writer.start()
+    for _ in range(100):
+        if not writer.depth():
+            break
+        await asyncio.sleep(0.01)
+    await writer.close()
+    return writer, sent
+
+
+def test_overflow_drops_the_oldest_audio_by_default():
+    async def scenario():
+        _, sent = await _send_frames(10)
+        assert sent == [20] * 4
+
+    asyncio.run(scenario())
+
+
+def test_coalescing_stops_at_the_merged_duration_cap():
+    async def scenario():
+        writer, sent = await _send_frames(10, policy="coalesce", max_coalesced_ms=60)
+        # nothing merges past 60 ms; what can't be merged is dropped
+        assert max(sent) <= 60 and sum(sent) < 10 * 20
+        assert writer.coalesced and writer.dropped
+
+    asyncio.run(scenario())
+
+
+def test_filler_is_only_stopped_while_it_is_what_plays():
+    async def scenario():
+        sent = []
+
+        async def send(message: str):
+            sent.append(jsonCodec.loads(message)["Kind"])
+
+        writer = AcsOutboundWriter(send)
+        writer.start()
+        # 100 ms of filler, cancelled while it plays
+        writer.put_filler(base64.b64encode(bytes(100 * BYTES_PER_MS)).decode("ascii"))
+        await asyncio.sleep(0.02)
+        writer.cancel_filler()
+        await asyncio.sleep(0.02)
+        assert sent == ["AudioData", "StopAudio"]
+
+        # filler that has played out
+        writer.put_filler(FRAME)
+        await asyncio.sleep(0.05)
+        writer.cancel_filler()
+        # filler followed by the answer
+        writer.put_filler(FRAME)
+        writer.put_audio(FRAME, "item-1")
+        await asyncio.sleep(0.01)
+        writer.cancel_filler()
+        await asyncio.sleep(0.02)
+        await writer.close()
+        assert sent == ["AudioData", "StopAudio", "AudioData", "AudioData", "AudioData"]
+
+    asyncio.run(scenario())
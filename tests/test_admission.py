@@ -0,0 +1,44 @@
+import asyncio
+
+from tests.harness import running_app
+
+
+def test_call_limit_holds_across_workers():
+    """The webhook that admits a call and the /ws carrying it land on
+    different workers; the limit still applies to the calls of all of them."""
+    async def scenario():
+        # only the call limit; a worker's startup lag would refuse calls too
+        env = {"ADMISSION_MAX_CALLS": "3", "ADMISSION_MAX_LOOP_LAG_MS": "0", "ADMISSION_MAX_QUEUE_DEPTH": "0"}
+        async with running_app(call_seconds=4, workers=3, env=env) as harness:
+            for index in range(6):
+                assert await harness.call(f"+1555000000{index}") == 200
+            await asyncio.sleep(1)
+            await harness.acs.wait_idle()
+            results = harness.acs.results
+            assert len(results) == 3
+            assert harness.acs.rejected == 3
+            assert all(r.error is None and not r.refused for r in results)
+
+            # slots are freed when the calls end
+            assert await harness.call("+15550000009") == 200
+            await harness.wait_connected(4)
+
+    asyncio.run(scenario())
+
+
+def test_streaming_call_keeps_its_slot_past_the_reservation():
+    async def scenario():
+        env = {
+            "ADMISSION_MAX_CALLS": "1", "ADMISSION_MAX_LOOP_LAG_MS": "0", "ADMISSION_MAX_QUEUE_DEPTH": "0",
+            "ADMISSION_RESERVATION_S": "1", "ADMISSION_SHARED_INTERVAL_S": "0.2",
+        }
+        async with running_app(call_seconds=4, workers=2, env=env) as harness:
+            assert await harness.call("+15550000001") == 200
+            await harness.wait_connected(1)
+            # the media worker renews the slot it would otherwise lose here
+            await asyncio.sleep(1.5)
+            assert await harness.call("+15550000002") == 200
+            await harness.acs.wait_idle()
+            assert harness.acs.rejected == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+
+from websockets.exceptions import ConnectionClosed
+
+from app.audioBatcher import InboundAudioBatcher
+from app.azureOpenAIService import OpenAIRTHandler
+
+FRAME = bytes(960)
+
+
+def test_failed_timed_flush_is_logged(caplog):
+    async def append(audio):
+        raise ConnectionClosed(None, None)
+
+    async def scenario():
+        batcher = InboundAudioBatcher(append, batch_ms=40)
+        await batcher.add_pcm(FRAME)
+        await asyncio.sleep(0.1)
+        assert batcher._timed_flush is None
+
+    with caplog.at_level(logging.WARNING, logger="app.audioBatcher"):
+        asyncio.run(scenario())
+    assert "Timed flush of inbound audio failed" in caplog.text
+
+
+def test_close_cancels_a_timed_flush_in_progress():
+    sent = []
+    blocked = asyncio.Event()
+
+    async def append(audio):
+        sent.append(audio)
+        if len(sent) == 1:
+            blocked.set()
+            await asyncio.sleep(10)
+
+    async def scenario():
+        batcher = InboundAudioBatcher(append, batch_ms=40)
+        await batcher.add_pcm(FRAME)
+        await blocked.wait()
+        timed_flush = batcher._timed_flush
+        await batcher.add_pcm(FRAME)
+        await asyncio.wait_for(batcher.close(), 1)
+        assert timed_flush.cancelled()
+        # what was buffered behind the stuck flush still goes out
+        assert len(sent) == 2
+
+    asyncio.run(scenario())
+
+
+def test_handler_close_logs_the_inbound_rates(caplog):
+    async def append(audio):
+        pass
+
+    async def scenario():
+        handler = OpenAIRTHandler()
+        handler.inbound = InboundAudioBatcher(append, batch_ms=40)
+        await handler.inbound.add_pcm(FRAME)
+        await handler.close()
+
+    caplog.set_level(logging.INFO, logger="app")
+    asyncio.run(scenario())
+    assert "Inbound audio:" in caplog.text
@@ -0,0 +1,44 @@
+import asyncio
+import base64
+import os
+import wave
+
+from app import callCapture
+from app.callCapture import CallCapture
+
+FRAME = base64.b64encode(bytes(callCapture.FRAME_BYTES)).decode("ascii")
+
+
+def test_files_are_closed_after_a_failed_write(monkeypatch, tmp_path):
+    monkeypatch.setattr(callCapture, "CALL_CAPTURE_DIR", str(tmp_path))
+    monkeypatch.setattr(callCapture, "CALL_CAPTURE_FLUSH_MS", 20)
+    writes = []
+    write = wave.Wave_write.writeframesraw
+
+    def writeframesraw(self, data):
+        writes.append(len(data))
+        if len(writes) > 1:
+            raise OSError("disk full")
+        write(self, data)
+
+    monkeypatch.setattr(wave.Wave_write, "writeframesraw", writeframesraw)
+
+    async def scenario():
+        capture = CallCapture("call-1")
+        for _ in range(3):
+            capture.caller(FRAME)
+            await asyncio.sleep(0.05)
+        await capture.close()
+
+    asyncio.run(scenario())
+    assert len(writes) == 2
+    directory = tmp_path / "call-1"
+    # no descriptor of this process still points into the capture
+    open_files = {os.path.realpath(f"/proc/self/fd/{fd}") for fd in os.listdir("/proc/self/fd")}
+    assert not any(path.startswith(str(directory)) for path in open_files)
+    # the header was patched to what made it to disk before the failure
+    with wave.open(str(directory / "caller.wav"), "rb") as wav:
+        assert (wav.getnchannels(), wav.getframerate()) == (1, callCapture.SAMPLE_RATE)
+        assert wav.getnframes() == writes[0] // 2
+    for name in os.listdir(directory):
+        os.remove(directory / name)
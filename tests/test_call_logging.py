@@ -0,0 +1,56 @@
+import asyncio
+import logging
+import os
+
+from app import callLogging
+from app.callLogging import CallLogger, DebugIds
+
+
+def _touch(path, text: str, mtime: int):
+    path.write_text(text)
+    os.utime(path, (mtime, mtime))
+
+
+def test_debug_file_toggles_debug_for_a_call_in_progress(monkeypatch, tmp_path, caplog):
+    path = tmp_path / "call_debug_ids"
+    debug_ids = DebugIds(str(path))
+    monkeypatch.setattr(callLogging, "debug_ids", debug_ids)
+    caplog.set_level(logging.INFO, logger="app")
+    log = CallLogger()
+    log.bind("call-1")
+    assert not log.isEnabledFor(logging.DEBUG)
+
+    _touch(path, "call-2\ncall-1\n", 1000)
+    asyncio.run(debug_ids.reload_if_changed())
+    assert log.isEnabledFor(logging.DEBUG)
+    assert not CallLogger("call-3").isEnabledFor(logging.DEBUG)
+
+    _touch(path, "call-2\n", 2000)
+    asyncio.run(debug_ids.reload_if_changed())
+    assert not log.isEnabledFor(logging.DEBUG)
+    assert log.isEnabledFor(logging.INFO)
+
+
+def test_debug_ids_are_reloaded_in_the_background(monkeypatch, tmp_path):
+    monkeypatch.setattr(callLogging, "CALL_DEBUG_RELOAD_S", 0.01)
+    path = tmp_path / "call_debug_ids"
+    debug_ids = DebugIds(str(path))
+
+    async def scenario():
+        debug_ids.start()
+        _touch(path, "call-1\n", 1000)
+        await asyncio.sleep(0.1)
+        await debug_ids.stop()
+
+    asyncio.run(scenario())
+    assert "call-1" in debug_ids
+
+
+def test_sampled_only_logs_when_enabled(monkeypatch, caplog):
+    monkeypatch.setattr(callLogging, "debug_ids", DebugIds("/nonexistent/call_debug_ids"))
+    caplog.set_level(logging.INFO, logger="app")
+    with caplog.at_level(logging.DEBUG, logger="app.call"):
+        CallLogger("quiet").sampled(1.0, logging.DEBUG, "frame %d", 1)
+        CallLogger("loud", debug_enabled=True).sampled(1.0, logging.DEBUG, "frame %d", 2)
+        CallLogger("loud", debug_enabled=True).sampled(0.0, logging.DEBUG, "frame %d", 3)
+    assert [r.getMessage() for r in caplog.records] == ["frame 2"]
@@ -0,0 +1,111 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from app.callRegistry import InMemoryCallStore, SqliteCallStore
+from tests.harness import running_app
+
+
+async def stored_sessions(workdir: str) -> list:
+    sessions = await SqliteCallStore(os.path.join(workdir, "calls.db")).active()
+    return [session.to_dict() for session in sessions]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryCallStore()
+    return SqliteCallStore(str(tmp_path / "calls.db"))
+
+
+def test_updates_from_different_workers_merge_in_any_order(store):
+    async def scenario():
+        # /ws and CallConnected got there before answer_call returned
+        await store.update("call-1", state="streaming", worker_pid=42, correlation_id="corr-1")
+        await store.update("call-1", state="connected", correlation_id="corr-1", context_id="ctx")
+        await store.update("call-1", caller_id="+15550000001", context_id="ctx", profile="acme")
+        session = await store.get("call-1")
+        assert (session.state, session.worker_pid, session.correlation_id) == ("streaming", 42, "corr-1")
+        assert (session.caller_id, session.context_id, session.profile) == ("+15550000001", "ctx", "acme")
+        assert (await store.get_by_correlation("corr-1")).call_connection_id == "call-1"
+
+        await store.update("call-2", caller_id="+15550000002")
+        assert (await store.get("call-2")).state == "answered"
+        await store.update("call-2", state="connected")
+        assert (await store.get("call-2")).state == "connected"
+
+    asyncio.run(scenario())
+
+
+def test_media_session_records_its_worker():
+    async def scenario():
+        async with running_app(call_seconds=3, workers=2) as harness:
+            await harness.call()
+            await harness.wait_connected()
+            await asyncio.sleep(0.5)
+            result = harness.acs.results[0]
+            sessions = {s["call_connection_id"]: s for s in await stored_sessions(harness.workdir)}
+            session = sessions[result.call_connection_id]
+            assert session["state"] == "streaming"
+            assert session["correlation_id"]
+            with open(f"/proc/{harness.app.pid}/task/{harness.app.pid}/children") as f:
+                workers = {int(pid) for pid in f.read().split()}
+            assert session["worker_pid"] in workers
+
+    asyncio.run(scenario())
+
+
+
+def test_sqlite_store_queries_share_the_connection_one_at_a_time(tmp_path):
+    class Recording(SqliteCallStore):
+        running = peak = 0
+
+        def _get(self, column, value):
+            Recording.running += 1
+            Recording.peak = max(Recording.peak, Recording.running)
+            time.sleep(0.005)
+            try:
+                return super()._get(column, value)
+            finally:
+                Recording.running -= 1
+
+    async def scenario():
+        store = Recording(str(tmp_path / "calls.db"))
+        await asyncio.gather(*(store.get(f"call-{n}") for n in range(20)))
+        assert Recording.peak == 1
+
+    asyncio.run(scenario())
+
+
+def test_slots_are_reserved_atomically_across_workers(tmp_path):
+    async def scenario():
+        # one store per worker: separate connections to the same file
+        workers = [SqliteCallStore(str(tmp_path / "calls.db")) for _ in range(4)]
+        taken = await asyncio.gather(
+            *(workers[index % 4].reserve_slot(f"event-{index}", 3, 60) for index in range(20))
+        )
+        assert sum(taken) == 3
+
+    asyncio.run(scenario())
+
+
+def test_slots_follow_the_call_until_released_or_expired(store):
+    async def scenario():
+        assert await store.reserve_slot("admitting:event-1", 2, 60)
+        assert await store.reserve_slot("admitting:event-2", 2, 0.2)
+        assert not await store.reserve_slot("admitting:event-3", 2, 60)
+
+        await store.move_slot("admitting:event-1", "call-1", 60)
+        await store.release_slot("admitting:event-1")
+        assert not await store.reserve_slot("admitting:event-3", 2, 60)
+
+        # event-2 was never answered, so its slot lapses
+        await asyncio.sleep(0.3)
+        assert await store.reserve_slot("admitting:event-3", 2, 60)
+
+        await store.release_slot("call-1")
+        assert await store.reserve_slot("admitting:event-4", 2, 60)
+
+    asyncio.run(scenario())
@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+from app import metrics
+
+
+def _write(directory, pid: int, started, requests: int, depth: float):
+    worker = {
+        "pid": pid,
+        "started": started,
+        "metrics": {
+            "requests_total": {"kind": "counter", "help": "", "label": None, "series": {"": requests}},
+            "queue_depth": {"kind": "gauge", "help": "", "label": None, "series": {"": depth}},
+        },
+    }
+    with open(os.path.join(directory, f"{pid}.json"), "w") as f:
+        json.dump(worker, f)
+
+
+def _exited_pid() -> int:
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    return child.pid
+
+
+def test_exited_workers_are_folded_into_the_archive(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    parent = os.getppid()
+    _write(tmp_path, _exited_pid(), None, 2, 5)
+    # a live process that only got an exited worker's pid
+    _write(tmp_path, 1, -1, 3, 7)
+    _write(tmp_path, parent, metrics._process_start(parent), 4, 1)
+
+    metrics.archive_dead_workers()
+    metrics.archive_dead_workers()
+
+    assert sorted(os.listdir(tmp_path)) == sorted([metrics.ARCHIVE_FILE, f"{parent}.json"])
+    archived = metrics.merge(metrics._worker_snapshots()[1:])
+    assert archived["requests_total"]["series"][""] == 2 + 3 + 4
+    # gauges of exited workers are gone
+    assert archived["queue_depth"]["series"][""] == 1
@@ -0,0 +1,187 @@
+import asyncio
+import contextlib
+import time
+from types import SimpleNamespace
+
+from openai import AsyncAzureOpenAI
+
+from app import realtimePool
+from app.azureOpenAIService import configure_realtime
+from app.clients import ping_realtime, send_realtime_event
+from app.realtimePool import ProfilePools, RealtimeConnectionPool
+from app.sessionProfiles import session_profiles
+from benchmarks.loadtest.mock_realtime import MockRealtimeServer
+from benchmarks.loadtest.run import _free_port
+
+
+class FakeConnection():
+    closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeManager():
+    async def enter(self):
+        return FakeConnection()
+
+
+async def configure(connection, profile):
+    pass
+
+
+def test_profile_edit_keeps_the_warm_pool_size():
+    async def scenario():
+        pools = ProfilePools(FakeManager, configure)
+        default = SimpleNamespace(name="main", fingerprint="v1")
+        warm = pools.get(default, size=3)
+        await asyncio.sleep(0)
+        assert warm.idle_count() == 3
+
+        # hot reload changed the profile; an incoming call asks with the default size
+        edited = SimpleNamespace(name="main", fingerprint="v2")
+        replacement = pools.get(edited)
+        await asyncio.sleep(0)
+        assert replacement is not warm
+        assert replacement.size == 3
+        assert replacement.idle_count() == 3
+        await pools.close()
+
+    asyncio.run(scenario())
+
+
+@contextlib.asynccontextmanager
+async def mock_pool(drop_after_s: float = None, **pool_options):
+    """A pool of sessions on the load-test mock, configured with the default profile."""
+    server = MockRealtimeServer(port=_free_port(), drop_after_s=drop_after_s)
+    await server.start()
+    client = AsyncAzureOpenAI(
+        azure_endpoint=f"http://{server.host}:{server.port}",
+        websocket_base_url=f"ws://{server.host}:{server.port}/openai",
+        azure_deployment="gpt-4o-realtime-preview",
+        api_key="test",
+        api_version="2024-10-01-preview",
+    )
+    pool = RealtimeConnectionPool(
+        lambda: client.beta.realtime.connect(model="gpt-4o-realtime-preview"),
+        lambda connection: configure_realtime(connection, session_profiles.default),
+        **pool_options,
+    )
+    try:
+        yield pool, server
+    finally:
+        await pool.close()
+        await client.close()
+        await server.stop()
+
+
+async def _until(condition, timeout_s: float = 5):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+def test_prewarmed_sessions_are_configured_and_refilled():
+    async def scenario():
+        async with mock_pool(size=2) as (pool, server):
+            pool.start()
+            await _until(lambda: pool.idle_count() == 2)
+            session = await pool.acquire()
+            assert (pool.hits, pool.misses) == (1, 0)
+            # the profile's session.update went out before the session was parked
+            assert (await session.connection.recv()).type == "session.created"
+            updated = await session.connection.recv()
+            assert updated.type == "session.updated"
+            assert updated.session.voice == session_profiles.default.voice
+            await _until(lambda: pool.idle_count() == 2)
+            assert server.sessions == 3
+            await session.connection.close()
+
+    asyncio.run(scenario())
+
+
+def test_acquire_opens_a_session_when_none_is_idle():
+    async def scenario():
+        async with mock_pool(size=0) as (pool, server):
+            pool.start()
+            session = await pool.acquire()
+            assert (pool.hits, pool.misses) == (0, 1)
+            assert server.sessions == 1 and pool.idle_count() == 0
+            await session.connection.close()
+
+    asyncio.run(scenario())
+
+
+def test_idle_sessions_past_max_idle_are_not_handed_out():
+    async def scenario():
+        async with mock_pool(size=1, max_idle_s=0.3) as (pool, server):
+            pool.start()
+            await _until(lambda: pool.idle_count() == 1)
+            await asyncio.sleep(0.4)
+            session = await pool.acquire()
+            assert (pool.evicted, pool.hits, pool.misses) == (1, 0, 1)
+            assert session.age() < 0.3
+            await _until(lambda: server.open_sessions == 2)
+            await session.connection.close()
+
+    asyncio.run(scenario())
+
+
+def test_health_check_replaces_dropped_sessions(monkeypatch):
+    monkeypatch.setattr(realtimePool, "REALTIME_POOL_HEALTH_INTERVAL_S", 0.2)
+
+    async def scenario():
+        async with mock_pool(drop_after_s=0.5, size=1) as (pool, server):
+            warm = await pool.open_session()
+            assert await pool._healthy(warm)
+            await _until(lambda: server.dropped == 1)
+            await asyncio.sleep(0.05)
+            assert not await pool._healthy(warm)
+
+            pool.start()
+            await _until(lambda: pool.idle_count() == 1)
+            first = pool._idle[0]
+            # the mock drops it; the next health check swaps in a new one
+            await _until(lambda: pool.idle_count() == 1 and pool._idle[0] is not first)
+            assert pool.evicted >= 1
+
+    asyncio.run(scenario())
+
+
+def test_realtime_helpers_fall_back_to_the_public_api():
+    class PublicOnly():
+        """A connection from an SDK release that moved its websocket."""
+
+        def __init__(self) -> None:
+            self.sent = []
+
+        async def send(self, event):
+            self.sent.append(event)
+
+    async def scenario():
+        connection = PublicOnly()
+        await send_realtime_event(connection, '{"type": "session.update", "session": {"voice": "alloy"}}')
+        await ping_realtime(connection, 1)
+        assert connection.sent == [
+            {"type": "session.update", "session": {"voice": "alloy"}},
+            {"type": "input_audio_buffer.clear"},
+        ]
+
+    asyncio.run(scenario())
+
+
+def test_close_waits_for_sessions_still_warming():
+    class StalledManager():
+        async def enter(self):
+            await asyncio.sleep(3600)
+
+    async def scenario():
+        pool = RealtimeConnectionPool(StalledManager, None, size=2)
+        pool.start()
+        await asyncio.sleep(0)
+        await pool.close()
+        # nothing of the pool is left running
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    asyncio.run(scenario())
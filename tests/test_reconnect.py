@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+from websockets.exceptions import ConnectionClosed
+
+from app import azureOpenAIService
+from app.acsOutbound import AcsOutboundWriter
+from app.azureOpenAIService import OpenAIRTHandler
+
+
+class FakeConnection():
+    """Records what the handler sends; `fail_on` drops it at that call."""
+
+    closed = False
+
+    def __init__(self, fail_on: str = None) -> None:
+        self.fail_on = fail_on
+        self.sent = []
+        self.input_audio_buffer = SimpleNamespace(append=self._method("append"))
+        self.conversation = SimpleNamespace(item=SimpleNamespace(create=self._method("item.create")))
+        self.response = SimpleNamespace(create=self._method("response.create"))
+
+    def _method(self, name: str):
+        async def call(**kwargs):
+            if name == self.fail_on:
+                raise ConnectionClosed(None, None)
+            self.sent.append(name)
+        return call
+
+    async def close(self):
+        self.closed = True
+
+
+class FakePool():
+    def __init__(self, connections: list) -> None:
+        self.connections = connections
+
+    async def acquire(self):
+        return SimpleNamespace(manager=None, connection=self.connections.pop(0))
+
+
+async def _sent(data):
+    pass
+
+
+def test_frame_sent_into_a_dropped_session_is_held():
+    async def scenario():
+        handler = OpenAIRTHandler()
+        handler.connection = FakeConnection(fail_on="append")
+        await handler.forward_audio("AAAA")
+        assert handler.reconnecting
+        assert list(handler.backlog) == ["AAAA"]
+
+    asyncio.run(scenario())
+
+
+def test_reconnect_retries_the_replay_and_stops_the_hold_prompt(monkeypatch):
+    async def scenario():
+        # the first replacement drops while the turns are replayed
+        broken, working = FakeConnection(fail_on="item.create"), FakeConnection()
+        pool = FakePool([broken, working])
+        monkeypatch.setattr(azureOpenAIService.realtime_pools, "get", lambda profile: pool)
+        monkeypatch.setattr(azureOpenAIService, "hold_clip", lambda: ("AAAA", "AAAA"))
+        monkeypatch.setattr(azureOpenAIService, "REALTIME_RECONNECT_BASE_MS", 1)
+        handler = OpenAIRTHandler()
+        handler.connection = FakeConnection()
+        handler.outbound = AcsOutboundWriter(_sent)
+        handler.outbound.put_audio("AAAA", "item_old")
+        handler.outbound._playing_item = "item_old"
+        handler.history.append(("user", "hello"))
+        handler.backlog.extend(["AAAA", "BBBB"])
+
+        assert await handler.reconnect()
+        assert broken.closed
+        assert working.sent == ["item.create", "append", "append"]
+        assert not handler.reconnecting and not handler.filler_playing
+        assert handler.outbound.playback_position() == (None, 0, 0)
+        # the old item's audio still plays, untracked; the hold prompt is gone
+        assert list(handler.outbound._queue) == [(0, "AAAA", None)]
+
+    asyncio.run(scenario())
@@ -0,0 +1,66 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from app import sessionProfiles
+from app.sessionProfiles import SessionProfileStore
+
+
+def write_profiles(path, profiles: dict, mtime: float):
+    with open(path, "w") as f:
+        json.dump({"default": "main", "profiles": profiles}, f)
+    os.utime(path, (mtime, mtime))
+
+
+def test_get_picks_up_profiles_added_in_another_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessionProfiles, "SESSION_PROFILES_RELOAD_S", 0.01)
+    path = tmp_path / "profiles.json"
+    main = {"instructions": "Main line."}
+    write_profiles(path, {"main": main}, 1_000_000)
+    webhook_worker, media_worker = SessionProfileStore(str(path)), SessionProfileStore(str(path))
+
+    async def scenario():
+        webhook_worker.start()
+        media_worker.start()
+        write_profiles(path, {"main": main, "acme": {"instructions": "Acme line.", "numbers": ["+18005550199"]}}, 1_000_100)
+        await asyncio.sleep(0.2)
+        await webhook_worker.stop()
+        await media_worker.stop()
+
+    asyncio.run(scenario())
+    assert webhook_worker.select("+18005550199").name == "acme"
+    # the /ws worker never ran select() for this call
+    assert media_worker.get("acme").name == "acme"
+
+
+def test_get_keeps_profiles_when_an_edit_is_invalid(tmp_path):
+    path = tmp_path / "profiles.json"
+    write_profiles(path, {"main": {"instructions": "Main line."}}, 1_000_000)
+    store = SessionProfileStore(str(path))
+
+    write_profiles(path, {"main": {"instructions": "Main line.", "voice": "nobody"}}, 1_000_100)
+    asyncio.run(store.reload_if_changed())
+
+    assert store.get("main").voice == "shimmer"
+
+
+@pytest.mark.parametrize("document", [
+    {"default": "main", "profiles": [{"instructions": "Main line."}]},
+    {"default": "main", "profiles": {"main": "Main line."}},
+    {"default": "main", "profiles": {"main": {"instructions": "Main line.", "numbers": "+18005550199"}}},
+    ["main"],
+])
+def test_get_keeps_profiles_when_an_edit_has_the_wrong_shape(tmp_path, document):
+    path = tmp_path / "profiles.json"
+    write_profiles(path, {"main": {"instructions": "Main line.", "voice": "ash"}}, 1_000_000)
+    store = SessionProfileStore(str(path))
+
+    with open(path, "w") as f:
+        json.dump(document, f)
+    os.utime(path, (1_000_100, 1_000_100))
+    asyncio.run(store.reload_if_changed())
+
+    assert store.get("main").voice == "ash"
+    assert store.select("+18005550199").name == "main"
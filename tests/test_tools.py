@@ -0,0 +1,125 @@
+import asyncio
+from types import SimpleNamespace
+
+from app import azureOpenAIService
+from app.acsOutbound import AcsOutboundWriter
+from app.azureOpenAIService import OpenAIRTHandler
+from app.tools import Tool, tool_registry
+from tests.test_reconnect import FakeConnection, _sent
+
+
+class StreamingConnection(FakeConnection):
+    """Yields `events` as the realtime session would, `gap_s` apart."""
+
+    def __init__(self, events: list, gap_s: float) -> None:
+        super().__init__()
+        self.events = events
+        self.gap_s = gap_s
+
+    async def __aiter__(self):
+        for index, event in enumerate(self.events):
+            if index:
+                await asyncio.sleep(self.gap_s)
+            yield event
+
+
+def _function_calls(response_id: str, count: int) -> list:
+    return [
+        SimpleNamespace(type="response.function_call_arguments.done", name="slow", call_id=f"call_{n}",
+                        arguments="{}", response_id=response_id)
+        for n in range(count)
+    ]
+
+
+def _response_done(response_id: str, status: str):
+    return SimpleNamespace(
+        type="response.done", response=SimpleNamespace(id=response_id, status=status, status_details=None)
+    )
+
+
+def test_function_calls_of_one_response_share_its_deadline(monkeypatch):
+    monkeypatch.setattr(azureOpenAIService, "TOOL_RESPONSE_TIMEOUT_S", 0.3)
+
+    async def slow(arguments, handler):
+        await asyncio.sleep(1)
+        return "done"
+
+    monkeypatch.setitem(tool_registry._tools, "slow", Tool("slow", "", {}, slow, 5, None))
+
+    async def scenario():
+        events = _function_calls("resp_1", 2) + [_response_done("resp_1", "completed")]
+        handler = OpenAIRTHandler()
+        handler.connection = StreamingConnection(events, gap_s=0.15)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await handler.receive_oai_messages()
+        await asyncio.gather(*handler.tool_tasks)
+        # the second call only got what was left of the response's 0.3 s
+        assert loop.time() - started < 0.5
+        # both outputs first, then a single response.create
+        assert handler.connection.sent == ["item.create", "item.create", "response.create"]
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_response_is_not_continued_after_its_tools(monkeypatch):
+    async def quick(arguments, handler):
+        return "done"
+
+    monkeypatch.setitem(tool_registry._tools, "slow", Tool("slow", "", {}, quick, 5, None))
+
+    async def scenario():
+        handler = OpenAIRTHandler()
+        handler.connection = StreamingConnection(
+            _function_calls("resp_1", 1) + [_response_done("resp_1", "cancelled")], gap_s=0.05
+        )
+        await handler.receive_oai_messages()
+        await asyncio.gather(*handler.tool_tasks)
+        assert handler.connection.sent == ["item.create"]
+        assert not handler.tool_batches
+
+    asyncio.run(scenario())
+
+
+def test_failing_tool_still_answers_the_model(monkeypatch):
+    async def broken(arguments, handler):
+        raise KeyError("ticket_id")
+
+    monkeypatch.setitem(tool_registry._tools, "slow", Tool("slow", "", {}, broken, 5, None))
+
+    async def scenario():
+        handler = OpenAIRTHandler()
+        handler.connection = StreamingConnection(
+            _function_calls("resp_1", 1) + [_response_done("resp_1", "completed")], gap_s=0.05
+        )
+        await handler.receive_oai_messages()
+        await asyncio.gather(*handler.tool_tasks)
+        assert handler.connection.sent == ["item.create", "response.create"]
+        assert "failed" in await tool_registry.call("slow", {}, handler)
+
+    asyncio.run(scenario())
+
+
+def test_filler_can_play_again_after_an_answer_without_audio(monkeypatch):
+    monkeypatch.setattr(azureOpenAIService, "FILLER_DELAY_MS", 0)
+    monkeypatch.setattr(azureOpenAIService, "filler_clip", lambda: ("AAAA",))
+
+    async def lookup(arguments, handler):
+        await asyncio.sleep(0.1)
+        return "done"
+
+    monkeypatch.setitem(tool_registry._tools, "slow", Tool("slow", "", {}, lookup, 5, None))
+
+    async def scenario():
+        # the answer after the tool is text only
+        events = _function_calls("resp_1", 1) + [
+            _response_done("resp_1", "completed"), _response_done("resp_2", "completed")
+        ]
+        handler = OpenAIRTHandler()
+        handler.outbound = AcsOutboundWriter(_sent)
+        handler.connection = StreamingConnection(events, gap_s=0.2)
+        await handler.receive_oai_messages()
+        assert handler.connection.sent == ["item.create", "response.create"]
+        assert not handler.filler_playing
+
+    asyncio.run(scenario())
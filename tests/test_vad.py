@@ -0,0 +1,45 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.vad import FRAME_BYTES, FRAME_MS, EnergyVad
+from tests.harness import running_app
+
+SPEECH = (8000 * np.sin(np.arange(FRAME_BYTES // 2) * 2 * np.pi * 200 / 24000)).astype(np.int16).tobytes()
+QUIET = bytes(FRAME_BYTES)
+
+
+def _trailing_ms(vad: EnergyVad, silent_frames: bool) -> int:
+    """Audio forwarded after the last voiced frame until the gate closes."""
+    for _ in range(5):
+        vad.process(SPEECH)
+    forwarded = 0
+    while vad.speaking:
+        frames = vad.process_silence() if silent_frames else vad.process(QUIET)[0]
+        forwarded += len(frames)
+    return forwarded * FRAME_MS
+
+
+@pytest.mark.parametrize("silent_frames", [False, True])
+def test_gate_sends_the_silence_server_vad_waits_for(silent_frames):
+    vad = EnergyVad(hangover_ms=400, trailing_silence_ms=600)
+    assert _trailing_ms(vad, silent_frames) > 600
+
+
+def test_long_hangover_needs_no_padding():
+    vad = EnergyVad(hangover_ms=1000, trailing_silence_ms=600)
+    assert _trailing_ms(vad, False) == 1000
+
+
+@pytest.mark.parametrize("env", [{}, {"LOCAL_VAD_ENABLED": "true"}])
+def test_caller_turns_end_on_the_silence_sent_upstream(env):
+    async def scenario():
+        async with running_app(call_seconds=5, env=env) as harness:
+            await harness.call()
+            await harness.wait_connected()
+            await harness.acs.wait_idle()
+            # a reply after an utterance means the mock's audio-time VAD saw it end
+            assert harness.acs.results[0].latencies
+
+    asyncio.run(scenario())
@@ -0,0 +1,29 @@
+import asyncio
+
+import aiohttp
+
+from tests.harness import running_app
+
+
+def test_max_requests_recycle_lets_the_call_finish():
+    """A worker recycled by max_requests drains its call instead of being
+    killed by the arbiter once gunicorn's timeout passes."""
+    async def scenario():
+        args = ("--max-requests", "6", "--max-requests-jitter", "0", "--timeout", "3")
+        async with running_app(call_seconds=10, gunicorn_args=args) as harness:
+            await harness.call()
+            await harness.wait_connected()
+            # push the worker past max_requests while the call is streaming
+            for _ in range(8):
+                try:
+                    async with harness.http.get(harness.url + "/") as response:
+                        await response.read()
+                except aiohttp.ClientError:
+                    pass
+            await harness.acs.wait_idle()
+            result = harness.acs.results[0]
+            assert result.error is None
+            assert result.ended - result.started >= 9.5
+            assert result.audio_frames_received > 0
+
+    asyncio.run(scenario())